@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: compile time of the full preamble versus --minimal-preamble
+
+Converts each EPUB twice (full and minimal preamble), compiles both with
+the same engine and reports the packages loaded and the compile time per
+book and per pass. Without a TeX engine only the package counts are shown.
+
+Usage:
+    python benchmark_preamble.py [book.epub ...] [--compiler xelatex] [--repeat 3]
+"""
+
+import os
+import re
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, compile_latex, events, probe_toolchain
+
+
+def count_packages(tex_path):
+    """Number of packages loaded by a LaTeX document"""
+    text = Path(tex_path).read_text(encoding='utf-8')
+    head = text[:text.index('\\begin{document}')]
+    return sum(len(names.split(',')) for names in
+               re.findall(r'\\usepackage(?:\[[^\]]*\])?\{([^}]*)\}', head))
+
+
+def time_compile(tex_path, compiler, repeat):
+    """Median seconds per compile and per pass, or None if TeX failed"""
+    durations = []
+    passes = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = compile_latex(str(tex_path), compiler=compiler)
+        durations.append(time.perf_counter() - start)
+        if not result:
+            return None
+        passes = result.passes
+    median = statistics.median(durations)
+    return median, median / max(passes, 1)
+
+
+def main():
+    """Run the benchmark"""
+    default_books = sorted(str(p) for p in Path(__file__).parent.glob('*.epub'))
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('books', nargs='*', default=default_books, help='EPUB files to benchmark')
+    parser.add_argument('--compiler', default='pdflatex', choices=['pdflatex', 'xelatex', 'lualatex'])
+    parser.add_argument('--repeat', type=int, default=3, help='Compiles per variant (median is kept)')
+    args = parser.parse_args()
+
+    events.set_sinks([])
+    can_compile = probe_toolchain().has_engine(args.compiler)
+    if not can_compile:
+        print(f"{args.compiler} not found: reporting package counts only")
+
+    print(f"{'Book':<30} {'Packages':>12} {'Full (s)':>10} {'Minimal (s)':>12} {'Saved (s)':>10} {'Per pass':>9}")
+    total_saved = 0.0
+    timed = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for book in args.books:
+            row = {}
+            for variant, minimal in (('full', False), ('minimal', True)):
+                tex_path = Path(tmpdir) / variant / Path(book).stem / 'book.tex'
+                converter = EPUBToLaTeXConverter(book, str(tex_path), minimal_preamble=minimal)
+                if not converter.convert():
+                    print(f"{Path(book).name:<30} conversion failed: {converter.error}")
+                    break
+                row[variant] = (count_packages(tex_path),
+                                time_compile(tex_path, args.compiler, args.repeat) if can_compile else None)
+            else:
+                (full_packages, full_time), (min_packages, min_time) = row['full'], row['minimal']
+                packages = f"{full_packages} -> {min_packages}"
+                if full_time and min_time:
+                    saved = full_time[0] - min_time[0]
+                    total_saved += saved
+                    timed += 1
+                    print(f"{Path(book).name:<30} {packages:>12} {full_time[0]:>10.2f} {min_time[0]:>12.2f} "
+                          f"{saved:>10.2f} {full_time[1] - min_time[1]:>9.2f}")
+                else:
+                    print(f"{Path(book).name:<30} {packages:>12} {'-':>10} {'-':>12} {'-':>10} {'-':>9}")
+
+    if timed:
+        print(f"\nAverage saved per book: {total_saved / timed:.2f}s ({timed} book(s) timed)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -24,198 +24,2951 @@ import zipfile
 import argparse
 import subprocess
 import glob
+import fnmatch
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import shutil
+import tempfile
+import hashlib
+import json
+import collections
+import marshal
+import tracemalloc
+import cProfile
+import pstats
+import socket
+import time
+import sqlite3
+import threading
+import asyncio
+import atexit
+import bisect
+import heapq
+import multiprocessing
+import traceback
+import contextvars
+from contextlib import contextmanager, nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import signal
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, where compile limits are not applied
+    resource = None
 
 try:
     import ebooklib
     from ebooklib import epub
-    from bs4 import BeautifulSoup, NavigableString, Tag
+    from bs4 import BeautifulSoup, CData, NavigableString, Tag
 except ImportError:
     print("Error: Required libraries not installed.")
     print("Please run: pip install -r requirements.txt")
     sys.exit(1)
 
 
+# Event levels, lowest first ('success' sits between info and warning)
+LOG_LEVELS = {'debug': 10, 'info': 20, 'success': 25, 'warning': 30, 'error': 40}
+
+# Book the current thread or task is working on, attached to every event
+_current_book: contextvars.ContextVar = contextvars.ContextVar('epub2tex_book', default=None)
+
+
+class ConsoleSink:
+    """
+    Human-readable event output, one line (or block) per event.
+    
+    Events render as their message with the CLI's usual markers. Optional
+    fields change the layout: 'detail' indents the line, 'rule' draws a
+    separator of that character under a heading, and a 'traceback' is
+    printed below the message. In batch runs the book ID
+    is prefixed so interleaved output stays attributable.
+    """
+    
+    MARKERS = {'success': '✓ ', 'warning': '⚠ Warning: ', 'error': '✗ '}
+    
+    def __init__(self, stream=None, level: str = 'info', show_book: bool = False):
+        self.stream = stream
+        self.level = LOG_LEVELS[level]
+        self.show_book = show_book
+        self._lock = threading.Lock()
+    
+    def emit(self, event: Dict):
+        if LOG_LEVELS[event['level']] < self.level:
+            return
+        message = event['message']
+        if event.get('detail'):
+            message = '  ' + message.replace('\n', '\n  ')
+        else:
+            message = self.MARKERS.get(event['level'], '') + message
+        if self.show_book and event.get('book'):
+            message = f"[{event['book']}] {message}"
+        if event.get('rule'):
+            message = f"\n{message}\n{event['rule'] * 60}"
+        if event.get('traceback'):
+            message = f"{message}\n{event['traceback'].rstrip()}"
+        stream = self.stream or sys.stdout
+        # One write per event, so lines from threads and processes don't mix
+        with self._lock:
+            stream.write(message + '\n')
+            stream.flush()
+
+
+class JsonLinesSink:
+    """
+    Machine-readable event output: one JSON object per line.
+    
+    The file is opened in append mode, so worker processes sharing a log
+    file each append whole lines. Pass '-' to write to stdout.
+    """
+    
+    def __init__(self, path: str, level: str = 'debug'):
+        self.path = path
+        self.level = LOG_LEVELS[level]
+        self._file = None
+        self._lock = threading.Lock()
+    
+    def emit(self, event: Dict):
+        if LOG_LEVELS[event['level']] < self.level:
+            return
+        line = json.dumps(event, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            if self._file is None:
+                self._file = sys.stdout if self.path == '-' else open(self.path, 'a', encoding='utf-8')
+            self._file.write(line)
+            self._file.flush()
+    
+    def close(self):
+        if self._file is not None and self._file is not sys.stdout:
+            self._file.close()
+        self._file = None
+
+
+class EventLog:
+    """
+    Structured progress events for conversion, batch and compile stages.
+    
+    Every event carries a timestamp, level, stage name, message, the current
+    book ID (see book()) and any extra fields; stage() also records durations.
+    Events go to all sinks; with no sinks (quiet mode) an event costs one
+    comparison and nothing is formatted.
+    """
+    
+    def __init__(self, sinks: Optional[List] = None):
+        self.set_sinks(sinks or [])
+    
+    def set_sinks(self, sinks: List):
+        """Replace the sinks (an empty list silences all output)."""
+        self.sinks = list(sinks)
+        self.min_level = min((sink.level for sink in self.sinks), default=None)
+    
+    def emit(self, level: str, stage: str, message: str = '', **fields):
+        """Send one event to the sinks that accept its level."""
+        if self.min_level is None or LOG_LEVELS[level] < self.min_level:
+            return
+        event = {
+            'ts': round(time.time(), 6),
+            'level': level,
+            'stage': stage,
+            'book': _current_book.get(),
+            'message': message,
+        }
+        event.update(fields)
+        self.dispatch(event)
+    
+    def dispatch(self, event: Dict):
+        """Send an already built event (e.g. relayed from a worker process) to the sinks."""
+        for sink in self.sinks:
+            sink.emit(event)
+    
+    def debug(self, stage: str, message: str = '', **fields):
+        self.emit('debug', stage, message, **fields)
+    
+    def info(self, stage: str, message: str = '', **fields):
+        self.emit('info', stage, message, **fields)
+    
+    def success(self, stage: str, message: str = '', **fields):
+        self.emit('success', stage, message, **fields)
+    
+    def warning(self, stage: str, message: str = '', **fields):
+        self.emit('warning', stage, message, **fields)
+    
+    def error(self, stage: str, message: str = '', **fields):
+        self.emit('error', stage, message, **fields)
+    
+    @contextmanager
+    def book(self, book_id: Optional[str]):
+        """Attach book_id to the events emitted inside the block."""
+        token = _current_book.set(book_id)
+        try:
+            yield
+        finally:
+            _current_book.reset(token)
+    
+    @contextmanager
+    def stage(self, stage: str, message: str = '', **fields):
+        """
+        Emit message when the stage starts and a debug event with its
+        duration when it ends.
+        
+        Yields a dict; fields stored in it are added to the end event.
+        """
+        if message:
+            self.info(stage, message, **fields)
+        end_fields = dict(fields)
+        start = time.perf_counter()
+        try:
+            yield end_fields
+        finally:
+            self.debug(stage, f"{stage} finished", duration=round(time.perf_counter() - start, 6),
+                       **end_fields)
+
+
+class RelaySink:
+    """Forward events from a worker process to the parent's event log."""
+    
+    def __init__(self, queue, level: int):
+        self.queue = queue
+        self.level = level
+    
+    def emit(self, event: Dict):
+        if LOG_LEVELS[event['level']] >= self.level:
+            self.queue.put(event)
+
+
+class MetricsSink:
+    """
+    Prometheus textfile-collector exporter fed by events.
+    
+    Counts books, bytes, images and cache lookups, keeps histograms of
+    conversion and compile durations and the current queue depth, and
+    rewrites the .prom file atomically (temporary file plus rename) so
+    node-exporter never reads a half-written file. A daemon thread rewrites
+    it every interval seconds, also while no events arrive (e.g. during a
+    long TeX pass), and close() writes the final values. Write errors are
+    reported on stderr and never reach the code emitting the event.
+    """
+    
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+    
+    def __init__(self, path: str, interval: float = 15.0):
+        self.path = Path(path)
+        self.interval = interval
+        self.level = LOG_LEVELS['debug']
+        self.books = {'converted': 0, 'failed': 0}
+        self.compiles = {'succeeded': 0, 'failed': 0}
+        self.durations = {'conversion': [0] * (len(self.BUCKETS) + 1) + [0.0],
+                          'compile': [0] * (len(self.BUCKETS) + 1) + [0.0]}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.images = 0
+        self.cache: Dict[str, List[int]] = {}
+        self.queue_depth = None
+        self._last_write = 0.0
+        self._write_error = None
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._refresher = None
+        if interval > 0:
+            self._refresher = threading.Thread(target=self._refresh, name='epub2tex-metrics',
+                                               daemon=True)
+            self._refresher.start()
+    
+    def _refresh(self):
+        while not self._closed.wait(self.interval):
+            with self._lock:
+                self._write()
+    
+    def _observe(self, name: str, seconds: float):
+        # Per-bucket counts, then the total count and sum
+        histogram = self.durations[name]
+        for i, bound in enumerate(self.BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+                break
+        histogram[-2] += 1
+        histogram[-1] += seconds
+    
+    def emit(self, event: Dict):
+        stage = event['stage']
+        with self._lock:
+            if 'duration' in event and 'success' in event:
+                if stage == 'book':
+                    self.books['converted' if event['success'] else 'failed'] += 1
+                    self._observe('conversion', event['duration'])
+                    self.bytes_read += event.get('bytes_read', 0)
+                    self.bytes_written += event.get('bytes_written', 0)
+                    self.images += event.get('images', 0)
+                elif stage == 'compile':
+                    self.compiles['succeeded' if event['success'] else 'failed'] += 1
+                    self._observe('compile', event['duration'])
+            if 'cache' in event:
+                counts = self.cache.setdefault(event['cache'], [0, 0])
+                counts[0] += event.get('hits', 0)
+                counts[1] += event.get('misses', 0)
+            if 'queue_depth' in event:
+                self.queue_depth = event['queue_depth']
+            if time.monotonic() - self._last_write >= self.interval:
+                self._write()
+    
+    def render(self) -> str:
+        """Metrics in the Prometheus text exposition format."""
+        lines = [
+            '# HELP epub2tex_books_total Books processed, by outcome.',
+            '# TYPE epub2tex_books_total counter',
+        ]
+        for status, count in self.books.items():
+            lines.append(f'epub2tex_books_total{{status="{status}"}} {count}')
+        lines += [
+            '# HELP epub2tex_compiles_total LaTeX compilations, by outcome.',
+            '# TYPE epub2tex_compiles_total counter',
+        ]
+        for status, count in self.compiles.items():
+            lines.append(f'epub2tex_compiles_total{{status="{status}"}} {count}')
+        
+        for name, help_text in (('conversion', 'EPUB to LaTeX conversion time per book.'),
+                                ('compile', 'LaTeX compilation time per book.')):
+            metric = f'epub2tex_{name}_duration_seconds'
+            histogram = self.durations[name]
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} histogram']
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, histogram):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram[-2]}')
+            lines.append(f'{metric}_sum {histogram[-1]:.6f}')
+            lines.append(f'{metric}_count {histogram[-2]}')
+        
+        lines += [
+            '# HELP epub2tex_read_bytes_total Bytes of EPUB input read.',
+            '# TYPE epub2tex_read_bytes_total counter',
+            f'epub2tex_read_bytes_total {self.bytes_read}',
+            '# HELP epub2tex_written_bytes_total Bytes of LaTeX and images written.',
+            '# TYPE epub2tex_written_bytes_total counter',
+            f'epub2tex_written_bytes_total {self.bytes_written}',
+            '# HELP epub2tex_images_extracted_total Images extracted from books.',
+            '# TYPE epub2tex_images_extracted_total counter',
+            f'epub2tex_images_extracted_total {self.images}',
+        ]
+        if self.cache:
+            lines += ['# HELP epub2tex_cache_hits_total Cache hits, by cache.',
+                      '# TYPE epub2tex_cache_hits_total counter']
+            lines += [f'epub2tex_cache_hits_total{{cache="{name}"}} {hits}'
+                      for name, (hits, _) in sorted(self.cache.items())]
+            lines += ['# HELP epub2tex_cache_misses_total Cache misses, by cache.',
+                      '# TYPE epub2tex_cache_misses_total counter']
+            lines += [f'epub2tex_cache_misses_total{{cache="{name}"}} {misses}'
+                      for name, (_, misses) in sorted(self.cache.items())]
+            lines += ['# HELP epub2tex_cache_hit_ratio Share of cache lookups that hit, by cache.',
+                      '# TYPE epub2tex_cache_hit_ratio gauge']
+            lines += [f'epub2tex_cache_hit_ratio{{cache="{name}"}} {hits / (hits + misses):.6f}'
+                      for name, (hits, misses) in sorted(self.cache.items()) if hits + misses]
+        if self.queue_depth is not None:
+            lines += ['# HELP epub2tex_queue_depth Books waiting or in progress.',
+                      '# TYPE epub2tex_queue_depth gauge',
+                      f'epub2tex_queue_depth {self.queue_depth}']
+        lines += ['# HELP epub2tex_last_update_timestamp_seconds When these metrics were written.',
+                  '# TYPE epub2tex_last_update_timestamp_seconds gauge',
+                  f'epub2tex_last_update_timestamp_seconds {time.time():.3f}']
+        return '\n'.join(lines) + '\n'
+    
+    def _write(self):
+        # Not retried before the next interval, even if the write fails
+        self._last_write = time.monotonic()
+        tmp_path = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_text(self.render(), encoding='utf-8')
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            # Events can't report this (they would come back here): warn on
+            # stderr, once until the error changes
+            message = f"⚠ Warning: Cannot write metrics file {self.path}: {e}"
+            if message != self._write_error:
+                self._write_error = message
+                sys.stderr.write(message + '\n')
+            try:
+                tmp_path.unlink()
+            except OSError:
+                pass
+        else:
+            self._write_error = None
+    
+    def close(self):
+        """Stop the periodic rewrites and write the final values."""
+        self._closed.set()
+        if self._refresher is not None and self._refresher is not threading.current_thread():
+            self._refresher.join()
+        with self._lock:
+            self._write()
+
+
+# Module-wide event log; configure_events() picks the sinks
+events = EventLog([ConsoleSink()])
+
+
+def configure_events(json_log: Optional[str] = None, quiet: bool = False,
+                     verbose: bool = False, show_book: bool = False,
+                     metrics_file: Optional[str] = None, metrics_interval: float = 15.0):
+    """
+    Choose where events go.
+    
+    Args:
+        json_log: Path of a JSON-lines log ('-' for stdout, which moves the
+                  console output to stderr)
+        quiet: Drop console output (JSON lines are still written)
+        verbose: Show debug events (stage durations) on the console
+        show_book: Prefix console lines with the book ID
+        metrics_file: Prometheus textfile-collector file to keep up to date
+        metrics_interval: Seconds between metrics file rewrites
+    """
+    for sink in events.sinks:
+        if isinstance(sink, MetricsSink):
+            atexit.unregister(sink.close)
+        if isinstance(sink, (JsonLinesSink, MetricsSink)):
+            sink.close()
+    sinks = []
+    if not quiet:
+        stream = sys.stderr if json_log == '-' else None
+        sinks.append(ConsoleSink(stream, 'debug' if verbose else 'info', show_book))
+    if json_log:
+        sinks.append(JsonLinesSink(json_log))
+    if metrics_file:
+        metrics = MetricsSink(metrics_file, metrics_interval)
+        atexit.register(metrics.close)
+        sinks.append(metrics)
+    events.set_sinks(sinks)
+
+
+def _init_worker_events(relay, level: Optional[int]):
+    """Process pool initializer: relay events to the parent process."""
+    events.set_sinks([RelaySink(relay, level)] if relay is not None else [])
+
+
+def _write_if_changed(path: Path, data) -> bool:
+    """
+    Write text or bytes to a file unless it already holds exactly that content.
+    
+    Leaving identical files untouched preserves their mtime, so make-style
+    tools and LaTeX reruns only see the outputs that really changed.
+    
+    Args:
+        path: Destination file
+        data: str (written as UTF-8) or bytes
+        
+    Returns:
+        True if the file was written, False if it was already up to date
+    """
+    path = Path(path)
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    with open(path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parse a shard specification of the form 'I/N' (1-based, e.g. '2/4').
+    
+    Args:
+        spec: Shard specification
+        
+    Returns:
+        Tuple of (index, count) with 1 <= index <= count
+        
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    match = re.fullmatch(r'\s*(\d+)\s*/\s*(\d+)\s*', spec)
+    if not match:
+        raise ValueError(f"Invalid shard '{spec}', expected I/N (e.g. 1/4)")
+    index, count = int(match.group(1)), int(match.group(2))
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"Invalid shard '{spec}', index must be between 1 and {max(count, 1)}")
+    return index, count
+
+
+def _shard_of(relative_path: str, count: int) -> int:
+    """
+    Assign a path to a shard (1-based) using a hash that is stable across
+    machines, Python versions and runs (unlike the builtin hash()).
+    """
+    digest = hashlib.sha1(relative_path.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def _claim_lock(lock_path: Path, ttl: float) -> Optional[str]:
+    """
+    Atomically claim a unit of work by creating its lock file.
+    
+    O_CREAT|O_EXCL is atomic on local filesystems and NFSv3+. A lock whose
+    mtime is older than ttl seconds is considered abandoned and taken over.
+    
+    Args:
+        lock_path: Lock file to create
+        ttl: Seconds after which an existing lock is considered abandoned
+        
+    Returns:
+        The owner line written to the lock if this process now owns it (to be
+        passed to _release_lock()), None otherwise
+    """
+    owner = f"{socket.gethostname()} {os.getpid()} {time.time():.6f}\n"
+    for _ in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            try:
+                stale = lock_path.stat()
+            except FileNotFoundError:
+                continue  # Released in the meantime, try again
+            if time.time() - stale.st_mtime < ttl:
+                return None
+            # Take the abandoned lock out of the way with an atomic rename, then
+            # make sure we did not grab a fresh lock someone else just created
+            moved = lock_path.with_name(f"{lock_path.name}.{socket.gethostname()}.{os.getpid()}")
+            try:
+                os.rename(lock_path, moved)
+            except FileNotFoundError:
+                continue
+            if moved.stat().st_ino != stale.st_ino:
+                try:
+                    os.link(moved, lock_path)
+                except OSError:
+                    pass
+                moved.unlink()
+                return None
+            moved.unlink()
+            events.warning('claim', f"Took over abandoned lock {lock_path.name}", lock=str(lock_path))
+            continue
+        with os.fdopen(fd, 'w') as f:
+            f.write(owner)
+        return owner
+    return None
+
+
+def _owns_lock(lock_path: Path, owner: str) -> bool:
+    """True if the lock still holds the owner line written by _claim_lock()."""
+    try:
+        return lock_path.read_text() == owner
+    except FileNotFoundError:
+        return False
+
+
+@contextmanager
+def _hold_lock(lock_path: Path, owner: str, ttl: float):
+    """
+    Keep a claimed lock fresh while the block runs.
+    
+    A thread touches the lock every third of ttl, so a book that takes
+    longer than ttl to convert and compile never looks abandoned to other
+    nodes. It stops early if the lock was taken over anyway.
+    """
+    stop = threading.Event()
+    
+    def refresh():
+        while not stop.wait(ttl / 3):
+            if not _owns_lock(lock_path, owner):
+                break
+            try:
+                os.utime(lock_path)
+            except FileNotFoundError:
+                break
+    
+    refresher = threading.Thread(target=refresh, daemon=True)
+    refresher.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        refresher.join()
+
+
+def _release_lock(lock_path: Path, owner: str):
+    """
+    Remove a lock claimed with _claim_lock(), unless another node took it over.
+    
+    A node that ran past the TTL may have lost its lock to another node;
+    deleting that node's lock would let a third node convert the book again.
+    """
+    if lock_path.exists() and not _owns_lock(lock_path, owner):
+        events.warning('claim', f"Lock {lock_path.name} was taken over by another node, leaving it",
+                       lock=str(lock_path))
+        return
+    try:
+        lock_path.unlink()
+    except FileNotFoundError:
+        pass
+
+
+SYMLINK_POLICIES = ('files', 'follow', 'ignore')
+
+
+def _matches_any(relative: str, name: str, patterns: List[str]) -> bool:
+    """True if the relative path or the bare name matches one of the globs."""
+    return any(fnmatch.fnmatch(relative, pattern) or fnmatch.fnmatch(name, pattern)
+               for pattern in patterns)
+
+
+def iter_epub_files(directory, recursive: bool = True,
+                    include: Optional[List[str]] = None,
+                    exclude: Optional[List[str]] = None,
+                    symlinks: str = 'files') -> Iterator[Path]:
+    """
+    Lazily yield the EPUB files below a directory.
+    
+    Built on os.scandir, so each directory is listed once and the first
+    books can be converted while the rest of a large tree is still being
+    walked. Entries are visited in sorted order (files of a directory before
+    its subdirectories) so every node sees the same sequence.
+    
+    Args:
+        directory: Root directory to search
+        recursive: Descend into subdirectories
+        include: Glob patterns a file must match (any of them), tested
+                 against its path relative to directory and its name;
+                 None includes every EPUB
+        exclude: Glob patterns of files or directories to skip, tested the
+                 same way; a matching directory is pruned with everything
+                 below it
+        symlinks: 'files' follows symlinked files but not directories,
+                  'follow' follows both (guarding against loops),
+                  'ignore' skips every symlink
+        
+    Yields:
+        Paths of files whose extension is .epub, in any letter case
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"Unknown symlink policy '{symlinks}', expected one of {SYMLINK_POLICIES}")
+    
+    root = Path(directory)
+    visited = set()
+    pending = [(root, '')]
+    
+    while pending:
+        dir_path, prefix = pending.pop()
+        if symlinks == 'follow':
+            # A symlinked directory may lead back to one we are already in
+            try:
+                st = dir_path.stat()
+            except OSError:
+                continue
+            if (st.st_dev, st.st_ino) in visited:
+                continue
+            visited.add((st.st_dev, st.st_ino))
+        
+        try:
+            with os.scandir(dir_path) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            events.warning('discover', f"Cannot read directory {dir_path}: {str(e)}",
+                           directory=str(dir_path))
+            continue
+        
+        subdirs = []
+        for entry in entries:
+            relative = prefix + entry.name
+            if exclude and _matches_any(relative, entry.name, exclude):
+                continue
+            
+            is_link = entry.is_symlink()
+            if is_link and symlinks == 'ignore':
+                continue
+            
+            try:
+                if entry.is_dir(follow_symlinks=(symlinks == 'follow')):
+                    if recursive:
+                        subdirs.append((Path(entry.path), relative + '/'))
+                    continue
+                if not entry.is_file():
+                    continue  # Broken link, socket, ...
+            except OSError:
+                continue
+            
+            if not entry.name.lower().endswith('.epub'):
+                continue
+            if include and not _matches_any(relative, entry.name, include):
+                continue
+            yield Path(entry.path)
+        
+        # Stack: push in reverse so subdirectories are visited in sorted order
+        pending.extend(reversed(subdirs))
+
+
+def _select_shard(dir_path: Path, epub_files: Iterable[Path], shard: Tuple[int, int],
+                  claim: bool) -> Iterable[Path]:
+    """
+    Restrict a batch to one shard.
+    
+    Without claim the files are filtered lazily. With claim, the other
+    shards' files follow our own, so an idle node goes on to pick up
+    whatever other nodes have not claimed; that needs the full listing.
+    """
+    index, count = shard
+    
+    def is_own(epub_file: Path) -> bool:
+        return _shard_of(epub_file.relative_to(dir_path).as_posix(), count) == index
+    
+    if not claim:
+        events.info('discover', f"Shard {index}/{count}", shard=index, shards=count)
+        return (f for f in epub_files if is_own(f))
+    
+    epub_files = list(epub_files)
+    own = [f for f in epub_files if is_own(f)]
+    events.info('discover', f"Shard {index}/{count}: {len(own)} of {len(epub_files)} EPUB file(s)",
+                shard=index, shards=count, own=len(own), total=len(epub_files))
+    own_set = set(own)
+    return own + [f for f in epub_files if f not in own_set]
+
+
+def _mirror_dir(epub_file: Path, output_dir: Optional[str], root: Optional[Path]) -> Path:
+    """Directory mirroring the book's location below root inside output_dir."""
+    if not output_dir:
+        return epub_file.parent
+    out_dir = Path(output_dir)
+    if root is not None:
+        out_dir = out_dir / epub_file.parent.relative_to(root)
+    return out_dir
+
+
+def _claim_paths(epub_file: Path, output_dir: Optional[str],
+                 root: Optional[Path] = None) -> Tuple[Path, Path, Path]:
+    """Lock, done-marker and failed-marker paths guarding a book in --claim mode."""
+    lock_dir = _mirror_dir(epub_file, output_dir, root)
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    return (lock_dir / f"{epub_file.name}.lock", lock_dir / f"{epub_file.name}.done",
+            lock_dir / f"{epub_file.name}.failed")
+
+
+def _claim_book(epub_file: Path, output_dir: Optional[str], root: Path, ttl: float,
+                retry_failed: Optional[str] = None) -> Optional[Tuple[Path, str]]:
+    """
+    Claim a book in --claim mode.
+    
+    Books marked done are skipped, and so are books marked failed unless
+    retry_failed is given ('' retries all of them, otherwise only EPUB
+    paths matching that glob).
+    
+    Returns:
+        (lock path, owner line) if this node now owns the book, None otherwise
+    """
+    lock_path, done_path, failed_path = _claim_paths(epub_file, output_dir, root)
+    if done_path.exists():
+        return None
+    if failed_path.exists() and (retry_failed is None or
+                                 (retry_failed and not fnmatch.fnmatchcase(str(epub_file), retry_failed))):
+        events.debug('claim', f"Skipping {epub_file.name}: failed before (see {failed_path.name})",
+                     marker=str(failed_path))
+        return None
+    owner = _claim_lock(lock_path, ttl)
+    return (lock_path, owner) if owner is not None else None
+
+
+def _mark_claimed(lock_path: Path, owner: str, success: bool, error: Optional[str] = None):
+    """
+    Mark a claimed book done or failed, so no node picks it up again.
+    
+    Nothing is recorded if another node took the lock over meanwhile.
+    """
+    if not _owns_lock(lock_path, owner):
+        return
+    stamp = f"{socket.gethostname()} {time.time():.0f}\n"
+    if success:
+        lock_path.with_suffix('.done').write_text(stamp)
+        lock_path.with_suffix('.failed').unlink(missing_ok=True)
+    else:
+        lock_path.with_suffix('.failed').write_text(stamp + (error or '') + '\n')
+
+
+def _book_output_path(epub_file: Path, output_dir: Optional[str], split: bool,
+                      root: Optional[Path] = None) -> Path:
+    """
+    Output .tex path for a book in batch mode.
+    
+    Below output_dir the input tree under root is mirrored. Split books get
+    their own subdirectory so their chapters/ folders don't collide.
+    """
+    out_dir = _mirror_dir(epub_file, output_dir, root)
+    if split:
+        out_dir = out_dir / epub_file.stem
+    out_dir.mkdir(parents=True, exist_ok=True)
+    return out_dir / epub_file.with_suffix('.tex').name
+
+
+def _convert_book(epub_file: str, output_tex: str, converter_options: Dict,
+                  book_id: Optional[str] = None) -> Tuple[bool, Optional[str]]:
+    """
+    Convert one book without compiling it.
+    
+    Module-level (and taking only picklable arguments) so that the batch
+    orchestrator can run it in worker processes.
+    
+    Returns:
+        Tuple of (success, error message)
+    """
+    with events.book(book_id or _current_book.get()):
+        converter = EPUBToLaTeXConverter(epub_file, output_tex, **converter_options)
+        if not converter.convert():
+            events.error('convert', f"Failed to convert {Path(epub_file).name}",
+                         error=converter.error)
+            return False, converter.error
+        return True, None
+
+
+def _process_book(epub_file: Path, output_tex: Path, compile_latex_flag: bool = False,
+                  compiler: str = 'pdflatex', **converter_options) -> Tuple[bool, Optional[str]]:
+    """
+    Convert one book and optionally compile it (shared by the batch modes).
+    
+    Args:
+        epub_file: Input EPUB file
+        output_tex: Output .tex file
+        compile_latex_flag: Whether to compile LaTeX to PDF
+        compiler: LaTeX compiler to use
+        **converter_options: Extra EPUBToLaTeXConverter keyword arguments
+        
+    Returns:
+        Tuple of (success, error message); a failed compile is only a warning
+    """
+    success, error = _convert_book(str(epub_file), str(output_tex), converter_options)
+    if not success:
+        return False, error
+    
+    # Compile to PDF if requested
+    if compile_latex_flag:
+        if compile_latex(str(output_tex), compiler=compiler):
+            events.success('compile', "PDF compilation successful")
+        else:
+            events.warning('compile', "PDF compilation failed, but LaTeX file is available")
+    
+    return True, None
+
+
+def _batch_summary(title: str, successful: int, failed: int, duration: float):
+    """Emit the end-of-batch totals."""
+    events.info('batch', title, rule='=', successful=successful, failed=failed,
+                duration=round(duration, 6))
+    events.info('batch', f"Successful: {successful}", detail=True)
+    events.info('batch', f"Failed: {failed}", detail=True)
+
+
 def process_directory(directory: str, output_dir: Optional[str] = None, 
-                     compile_latex_flag: bool = False, compiler: str = 'pdflatex') -> Tuple[int, int]:
+                     compile_latex_flag: bool = False, compiler: str = 'pdflatex',
+                     split: bool = False, update: bool = False,
+                     low_memory: bool = False, shard: Optional[Tuple[int, int]] = None,
+                     claim: bool = False, lock_ttl: float = 3600,
+                     recursive: bool = True, include: Optional[List[str]] = None,
+                     exclude: Optional[List[str]] = None, symlinks: str = 'files',
+                     retry_failed: Optional[str] = None, **converter_options) -> Tuple[int, int]:
     """
     Process all EPUB files in a directory.
     
+    Files are discovered lazily with iter_epub_files() (recursively by
+    default, extensions matched case-insensitively), and with output_dir the
+    input tree is mirrored below it.
+    
+    Several machines sharing the input (e.g. over NFS) can split the work
+    with shard: each file goes to exactly one shard based on a stable hash
+    of its path relative to the directory. With claim, each book is guarded
+    by an atomic lock file in the output directory and marked done when
+    converted; a node first works through its own shard and then picks up
+    any book no other node has claimed, so idle nodes take over leftover
+    work. Locks older than lock_ttl seconds are treated as abandoned; a
+    node refreshes its lock while it works on the book. A book that fails
+    is marked failed and skipped by every node unless retry_failed is given.
+    
     Args:
         directory: Path to directory containing EPUB files
         output_dir: Optional output directory for LaTeX files
         compile_latex_flag: Whether to compile LaTeX to PDF
         compiler: LaTeX compiler to use
+        split: Write per-chapter files; each book then gets its own
+               subdirectory so their chapters/ folders don't collide
+        update: Only regenerate chapters that changed since the previous run
+                (implies split)
+        low_memory: Release parse trees and item contents as soon as each
+                    chapter is converted
+        shard: Optional (index, count) pair, 1-based, see parse_shard()
+        claim: Coordinate with other nodes through lock files
+        lock_ttl: Seconds after which a lock is considered abandoned
+        recursive: Descend into subdirectories
+        include: Glob patterns on relative paths of files to process
+        exclude: Glob patterns on relative paths of files or directories to skip
+        symlinks: Symlink policy, see iter_epub_files()
+        retry_failed: With claim, retry books marked failed ('' for all,
+                      otherwise a glob on their path)
+        **converter_options: Extra EPUBToLaTeXConverter keyword arguments
         
     Returns:
         Tuple of (successful_count, failed_count)
     """
     dir_path = Path(directory)
     if not dir_path.exists():
-        print(f"✗ Error: Directory not found: {directory}")
+        events.error('batch', f"Error: Directory not found: {directory}")
         return (0, 0)
     
     if not dir_path.is_dir():
-        print(f"✗ Error: Not a directory: {directory}")
+        events.error('batch', f"Error: Not a directory: {directory}")
         return (0, 0)
     
-    # Find all EPUB files
-    epub_files = list(dir_path.glob('*.epub')) + list(dir_path.glob('*.EPUB'))
-    
-    if not epub_files:
-        print(f"⚠ Warning: No EPUB files found in {directory}")
+    # Find EPUB files lazily, so conversion starts before a big tree is walked
+    try:
+        epub_files = iter_epub_files(dir_path, recursive=recursive, include=include,
+                                     exclude=exclude, symlinks=symlinks)
+    except ValueError as e:
+        events.error('batch', f"Error: {str(e)}")
         return (0, 0)
     
-    print(f"\nFound {len(epub_files)} EPUB file(s) in {directory}")
-    print("=" * 60)
+    if shard:
+        epub_files = _select_shard(dir_path, epub_files, shard, claim)
+    
+    events.info('batch', f"Processing EPUB files in {directory}", rule='=', directory=str(directory))
+    batch_start = time.perf_counter()
     
     successful = 0
     failed = 0
+    found = 0
     
-    for i, epub_file in enumerate(epub_files, 1):
-        print(f"\n[{i}/{len(epub_files)}] Processing: {epub_file.name}")
-        print("-" * 60)
+    for epub_file in epub_files:
+        found += 1
+        claimed = None
+        if claim:
+            claimed = _claim_book(epub_file, output_dir, dir_path, lock_ttl, retry_failed)
+            if claimed is None:
+                continue
         
+        book_id = epub_file.relative_to(dir_path).as_posix()
+        events.info('batch', f"[{found}] Processing: {book_id}", rule='-', index=found)
+        
+        success = False
+        error = None
         try:
-            # Determine output path
-            if output_dir:
-                out_dir = Path(output_dir)
-                out_dir.mkdir(parents=True, exist_ok=True)
-                output_tex = out_dir / epub_file.with_suffix('.tex').name
-            else:
-                output_tex = epub_file.with_suffix('.tex')
-            
-            # Convert EPUB to LaTeX
-            converter = EPUBToLaTeXConverter(str(epub_file), str(output_tex))
-            if converter.convert():
+            with (_hold_lock(*claimed, lock_ttl) if claimed else nullcontext()), events.book(book_id):
+                output_tex = _book_output_path(epub_file, output_dir, split or update, dir_path)
+                success, error = _process_book(epub_file, output_tex, compile_latex_flag, compiler,
+                                               split=split, update=update, low_memory=low_memory,
+                                               **converter_options)
+            if success:
                 successful += 1
-                
-                # Compile to PDF if requested
-                if compile_latex_flag:
-                    print(f"\nCompiling {output_tex.name}...")
-                    if compile_latex(str(output_tex), compiler=compiler):
-                        print(f"✓ PDF compilation successful")
-                    else:
-                        print(f"⚠ Warning: PDF compilation failed, but LaTeX file is available")
             else:
                 failed += 1
-                print(f"✗ Failed to convert {epub_file.name}")
                 
         except Exception as e:
             failed += 1
-            print(f"✗ Error processing {epub_file.name}: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            error = f"{type(e).__name__}: {e}"
+            events.error('batch', f"Error processing {epub_file.name}: {str(e)}", book=book_id,
+                         traceback=traceback.format_exc())
+        finally:
+            if claimed:
+                _mark_claimed(*claimed, success, error)
+                _release_lock(*claimed)
+    
+    if not found:
+        events.warning('batch', f"No EPUB files found in {directory}")
+        return (0, 0)
+    
+    _batch_summary("Batch processing complete!", successful, failed,
+                   time.perf_counter() - batch_start)
+    
+    return (successful, failed)
+
+
+# Seconds of conversion per unit of each signal read from an EPUB's zip
+# directory (measured on a single core): XHTML is parsed and rendered,
+# images are only copied, and every item has a fixed overhead
+BOOK_COST_WEIGHTS = {'xhtml_bytes': 2e-6, 'image_bytes': 2e-8, 'items': 1e-3}
+
+XHTML_SUFFIXES = ('.xhtml', '.html', '.htm')
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.bmp', '.tif', '.tiff')
+
+
+def estimate_book_cost(epub_file) -> Dict:
+    """
+    Estimate the conversion time of a book from its zip directory alone.
+    
+    Only the central directory is read (no member is decompressed), so
+    this is cheap enough to run over a whole library before scheduling it.
+    
+    Args:
+        epub_file: Path to the EPUB file
+        
+    Returns:
+        Dictionary with xhtml_bytes, image_bytes, items and the estimated
+        cost in seconds (0 for an unreadable file, which fails fast anyway)
+    """
+    signals = {'xhtml_bytes': 0, 'image_bytes': 0, 'items': 0}
+    try:
+        with zipfile.ZipFile(epub_file) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                signals['items'] += 1
+                name = info.filename.lower()
+                if name.endswith(XHTML_SUFFIXES):
+                    signals['xhtml_bytes'] += info.file_size
+                elif name.endswith(IMAGE_SUFFIXES):
+                    signals['image_bytes'] += info.file_size
+    except (OSError, zipfile.BadZipFile):
+        pass
+    signals['cost'] = sum(BOOK_COST_WEIGHTS[key] * signals[key] for key in BOOK_COST_WEIGHTS)
+    return signals
+
+
+def predict_makespan(costs: Iterable[float], workers: int) -> float:
+    """
+    Makespan of running jobs in the given order on identical workers.
+    
+    Each job starts on the worker that becomes free first, like books
+    submitted to a process pool.
+    """
+    free_at = [0.0] * max(1, workers)
+    for cost in costs:
+        heapq.heapreplace(free_at, free_at[0] + cost)
+    return max(free_at)
+
+
+def _longest_first(epub_files: Iterable[Path]) -> Tuple[List[Path], Dict[Path, float]]:
+    """
+    Order a batch by decreasing estimated cost (longest processing time first).
+    
+    With the biggest books started first, no large book is left to stretch
+    the tail of the run on its own. This needs the full listing.
+    
+    Returns:
+        Tuple of (ordered files, estimated cost per file)
+    """
+    costs = {epub_file: estimate_book_cost(epub_file)['cost'] for epub_file in epub_files}
+    return sorted(costs, key=costs.get, reverse=True), costs
+
+
+async def process_directory_async(directory: str, output_dir: Optional[str] = None,
+                                  compile_latex_flag: bool = False, compiler: str = 'pdflatex',
+                                  jobs: Optional[int] = None, tex_jobs: Optional[int] = None,
+                                  shard: Optional[Tuple[int, int]] = None, claim: bool = False,
+                                  lock_ttl: float = 3600, recursive: bool = True,
+                                  include: Optional[List[str]] = None,
+                                  exclude: Optional[List[str]] = None, symlinks: str = 'files',
+                                  longest_first: bool = False, retry_failed: Optional[str] = None,
+                                  **converter_options) -> Tuple[int, int]:
+    """
+    Process all EPUB files in a directory with overlapping stages.
+    
+    Conversion is CPU-bound and runs in a pool of jobs worker processes
+    (which also do the EPUB reads and .tex/image writes), while TeX passes
+    run as asyncio subprocesses limited to tex_jobs at a time. While one
+    book is being compiled the workers are already converting the next ones.
+    
+    With longest_first, the books are started in decreasing order of their
+    estimate_book_cost(), and the predicted conversion makespan is reported
+    along with the actual one.
+    
+    Args:
+        directory: Path to directory containing EPUB files
+        output_dir: Optional output directory for LaTeX files
+        compile_latex_flag: Whether to compile LaTeX to PDF
+        compiler: LaTeX compiler to use
+        jobs: Number of conversion processes (default: CPU count)
+        tex_jobs: Maximum number of concurrent TeX processes (default: jobs)
+        shard: Optional (index, count) pair, see process_directory()
+        claim: Coordinate with other nodes through lock files
+        lock_ttl: Seconds after which a lock is considered abandoned
+        recursive: Descend into subdirectories
+        include: Glob patterns on relative paths of files to process
+        exclude: Glob patterns on relative paths of files or directories to skip
+        symlinks: Symlink policy, see iter_epub_files()
+        longest_first: Start the most expensive books first
+        retry_failed: With claim, retry books marked failed, see process_directory()
+        **converter_options: Extra EPUBToLaTeXConverter keyword arguments
+        
+    Returns:
+        Tuple of (successful_count, failed_count)
+    """
+    dir_path = Path(directory)
+    if not dir_path.is_dir():
+        events.error('batch', f"Error: Not a directory: {directory}")
+        return (0, 0)
+    
+    try:
+        epub_files = iter_epub_files(dir_path, recursive=recursive, include=include,
+                                     exclude=exclude, symlinks=symlinks)
+        if longest_first:
+            # Before sharding, which keeps the order within each part
+            epub_files, costs = _longest_first(epub_files)
+    except ValueError as e:
+        events.error('batch', f"Error: {str(e)}")
+        return (0, 0)
+    
+    if shard:
+        epub_files = _select_shard(dir_path, epub_files, shard, claim)
+    
+    jobs = jobs or os.cpu_count() or 1
+    predicted = None
+    if longest_first:
+        epub_files = list(epub_files)
+        predicted = predict_makespan((costs[f] for f in epub_files), jobs)
+        events.info('schedule', f"Longest first: {len(epub_files)} book(s), "
+                    f"{sum(costs[f] for f in epub_files):.1f}s of conversion estimated, "
+                    f"predicted makespan {predicted:.1f}s", books=len(epub_files),
+                    predicted_makespan=round(predicted, 3))
+    tex_jobs = tex_jobs or jobs
+    split = converter_options.get('split') or converter_options.get('update')
+    
+    events.info('batch', f"Processing EPUB files in {directory}", directory=str(directory))
+    events.info('batch', f"Converting with {jobs} process(es), compiling with up to "
+                f"{tex_jobs} TeX process(es)", rule='=', jobs=jobs, tex_jobs=tex_jobs)
+    batch_start = time.perf_counter()
+    
+    loop = asyncio.get_running_loop()
+    tex_limit = asyncio.Semaphore(tex_jobs)
+    # Bound the books in flight so a huge directory does not turn into one
+    # pending task per file up front
+    in_flight = asyncio.Semaphore(jobs + tex_jobs)
+    counts = {'successful': 0, 'failed': 0, 'in_flight': 0, 'converted_at': batch_start}
+    
+    async def run_book(epub_file: Path, pool: ProcessPoolExecutor):
+        claimed = None
+        book_id = epub_file.relative_to(dir_path).as_posix()
+        # Tasks run in a copy of the context, so this only tags this book
+        _current_book.set(book_id)
+        try:
+            if claim:
+                claimed = _claim_book(epub_file, output_dir, dir_path, lock_ttl, retry_failed)
+                if claimed is None:
+                    return
+            
+            with _hold_lock(*claimed, lock_ttl) if claimed else nullcontext():
+                output_tex = _book_output_path(epub_file, output_dir, split, dir_path)
+                success, error = await loop.run_in_executor(
+                    pool, _convert_book, str(epub_file), str(output_tex), converter_options, book_id)
+                counts['converted_at'] = time.perf_counter()
+                if claimed:
+                    _mark_claimed(*claimed, success, error)
+                if not success:
+                    counts['failed'] += 1
+                    return
+                
+                counts['successful'] += 1
+                if compile_latex_flag:
+                    if not await compile_latex_async(str(output_tex), compiler=compiler,
+                                                     limit=tex_limit):
+                        events.warning('compile', f"PDF compilation failed for {epub_file.name}, "
+                                       f"but LaTeX file is available")
+        except Exception as e:
+            counts['failed'] += 1
+            events.error('batch', f"Error processing {epub_file.name}: {str(e)}",
+                         traceback=traceback.format_exc())
+        finally:
+            if claimed:
+                _release_lock(*claimed)
+            in_flight.release()
+            counts['in_flight'] -= 1
+            events.debug('batch', queue_depth=counts['in_flight'])
+    
+    # Worker processes send their events back here, so every sink (and the
+    # metrics in particular) sees the whole batch from a single process
+    relay = multiprocessing.Queue() if events.min_level is not None else None
+    
+    def drain():
+        for event in iter(relay.get, None):
+            events.dispatch(event)
+    
+    drainer = None
+    if relay is not None:
+        drainer = threading.Thread(target=drain, daemon=True)
+        drainer.start()
+    
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker_events,
+                                 initargs=(relay, events.min_level)) as pool:
+            tasks = []
+            for epub_file in epub_files:
+                await in_flight.acquire()
+                counts['in_flight'] += 1
+                events.debug('batch', queue_depth=counts['in_flight'])
+                tasks.append(asyncio.create_task(run_book(epub_file, pool)))
+            await asyncio.gather(*tasks)
+    finally:
+        if drainer is not None:
+            relay.put(None)
+            drainer.join()
+    
+    if not tasks:
+        events.warning('batch', f"No EPUB files found in {directory}")
+        return (0, 0)
+    
+    if predicted is not None:
+        actual = counts['converted_at'] - batch_start
+        events.info('schedule', f"Conversion makespan: predicted {predicted:.1f}s, actual {actual:.1f}s",
+                    predicted_makespan=round(predicted, 3), actual_makespan=round(actual, 3))
+    _batch_summary("Batch processing complete!", counts['successful'], counts['failed'],
+                   time.perf_counter() - batch_start)
+    
+    return (counts['successful'], counts['failed'])
+
+
+class JobQueue:
+    """
+    Durable SQLite-backed queue of book conversion jobs.
+    
+    Each job records its input, output and conversion options, so workers
+    only need the database path. Workers lease jobs for a limited time and
+    extend the lease with heartbeats while they work; a job whose lease ran
+    out (worker crashed or was OOM-killed) goes back to the pool, so a
+    restarted run resumes where it stopped without redoing finished books.
+    A job whose lease ran out max_attempts times (e.g. a book that gets its
+    worker OOM-killed every time) is marked failed instead, so the queue
+    still drains.
+    
+    The database uses SQLite's rollback journal rather than WAL, since WAL
+    needs shared memory and does not work across hosts. Sharing the file
+    over NFS then depends on the server's locking being reliable, and lease
+    expiry relies on the hosts' clocks being reasonably in sync.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY,
+            epub_path TEXT NOT NULL UNIQUE,
+            output_tex TEXT NOT NULL,
+            options TEXT NOT NULL DEFAULT '{}',
+            priority REAL NOT NULL DEFAULT 0,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            worker TEXT,
+            lease_expires REAL,
+            heartbeat_at REAL,
+            enqueued_at REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL,
+            duration REAL,
+            error TEXT
+        );
+        CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, lease_expires);
+    """
+    
+    def __init__(self, db_path: str, lease_seconds: float = 300, max_attempts: int = 3):
+        """
+        Open (and create if needed) a job queue.
+        
+        Args:
+            db_path: Path to the SQLite database file
+            lease_seconds: How long a leased job stays reserved without a heartbeat
+            max_attempts: Leases a job may lose before it is marked failed
+        """
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # Autocommit mode; write transactions are opened explicitly with
+        # BEGIN IMMEDIATE so concurrent workers serialize on the write lock
+        self.conn = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(self.SCHEMA)
+        columns = {row['name'] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        if 'priority' not in columns:
+            # Queue created before job priorities existed
+            try:
+                self.conn.execute("ALTER TABLE jobs ADD COLUMN priority REAL NOT NULL DEFAULT 0")
+            except sqlite3.OperationalError:
+                # Another worker added it first
+                pass
+    
+    def close(self):
+        """Close the database connection."""
+        self.conn.close()
+    
+    def enqueue(self, jobs: List[Tuple[str, str, Dict]]) -> int:
+        """
+        Add jobs to the queue; inputs that are already queued are left alone.
+        
+        Args:
+            jobs: (epub_path, output_tex, options) tuples, optionally followed
+                  by a priority; higher priorities are leased first
+            
+        Returns:
+            Number of newly queued jobs
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO jobs (epub_path, output_tex, options, priority, enqueued_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [(job[0], job[1], json.dumps(job[2], sort_keys=True), job[3] if len(job) > 3 else 0, now)
+                 for job in jobs])
+            added = self.conn.total_changes - before
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return added
+    
+    def lease(self, worker: str) -> Optional[Dict]:
+        """
+        Reserve the next pending job, or one whose lease has expired.
+        
+        Jobs are taken by decreasing priority, then in the order they were queued.
+        Expired jobs that already used up max_attempts are marked failed.
+        
+        Args:
+            worker: Identifier of the leasing worker
+            
+        Returns:
+            Job as a dictionary, or None when there is nothing to do
+        """
+        now = time.time()
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.conn.execute(
+                "UPDATE jobs SET status = 'failed', finished_at = ?, lease_expires = NULL, "
+                "error = 'Lease expired on each of ' || attempts || ' attempts (worker killed?)' "
+                "WHERE status = 'running' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts))
+            row = self.conn.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' "
+                "OR (status = 'running' AND lease_expires < ?) "
+                "ORDER BY priority DESC, id LIMIT 1", (now,)).fetchone()
+            if row is None:
+                self.conn.execute("COMMIT")
+                return None
+            self.conn.execute(
+                "UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1, "
+                "lease_expires = ?, heartbeat_at = ?, started_at = ?, error = NULL "
+                "WHERE id = ?",
+                (worker, now + self.lease_seconds, now, now, row['id']))
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['worker'] = worker
+        return job
+    
+    def heartbeat(self, job_id: int, worker: str) -> bool:
+        """
+        Extend the lease of a running job.
+        
+        Returns:
+            False if the job is no longer leased by this worker
+        """
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE jobs SET heartbeat_at = ?, lease_expires = ? "
+            "WHERE id = ? AND worker = ? AND status = 'running'",
+            (now, now + self.lease_seconds, job_id, worker))
+        return cursor.rowcount == 1
+    
+    def complete(self, job_id: int, worker: str, success: bool,
+                 duration: float, error: Optional[str] = None) -> bool:
+        """
+        Record the outcome of a job.
+        
+        Returns:
+            False if the job had meanwhile been taken over by another worker
+        """
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, duration = ?, error = ?, "
+            "lease_expires = NULL WHERE id = ? AND worker = ? AND status = 'running'",
+            ('done' if success else 'failed', time.time(), duration, error, job_id, worker))
+        return cursor.rowcount == 1
+    
+    def retry(self, pattern: Optional[str] = None) -> int:
+        """
+        Put failed jobs back into the queue.
+        
+        Attempt counts are kept: a retried job that was failed for losing
+        max_attempts leases is failed again as soon as its next lease expires.
+        
+        Args:
+            pattern: Optional glob on the EPUB path to retry selectively
+            
+        Returns:
+            Number of jobs requeued
+        """
+        query = "UPDATE jobs SET status = 'pending', worker = NULL, error = NULL WHERE status = 'failed'"
+        params = ()
+        if pattern:
+            query += " AND epub_path GLOB ?"
+            params = (pattern,)
+        return self.conn.execute(query, params).rowcount
+    
+    def counts(self) -> Dict[str, int]:
+        """Number of jobs per status."""
+        rows = self.conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+    
+    def failures(self) -> List[Dict]:
+        """Failed jobs with their error text."""
+        rows = self.conn.execute(
+            "SELECT epub_path, attempts, duration, error FROM jobs "
+            "WHERE status = 'failed' ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+
+# Converter options holding paths, stored absolute in queued jobs
+QUEUE_PATH_OPTIONS = ('profile_dir', 'ir_cache')
+
+
+def enqueue_directory(db_path: str, directory: str, output_dir: Optional[str] = None,
+                      compile_latex_flag: bool = False, compiler: str = 'pdflatex',
+                      recursive: bool = True, include: Optional[List[str]] = None,
+                      exclude: Optional[List[str]] = None, symlinks: str = 'files',
+                      longest_first: bool = False, **converter_options) -> int:
+    """
+    Queue every EPUB of a directory as a job in a SQLite job queue.
+    
+    With longest_first, each job's priority is its estimate_book_cost(), so
+    workers take the most expensive books first.
+    
+    Args:
+        db_path: Path to the queue database
+        directory: Path to directory containing EPUB files
+        output_dir: Optional output directory for LaTeX files
+        compile_latex_flag: Whether workers should compile LaTeX to PDF
+        compiler: LaTeX compiler to use
+        recursive: Descend into subdirectories
+        include: Glob patterns on relative paths of files to queue
+        exclude: Glob patterns on relative paths of files or directories to skip
+        symlinks: Symlink policy, see iter_epub_files()
+        longest_first: Prioritize jobs by estimated cost
+        **converter_options: EPUBToLaTeXConverter keyword arguments for the jobs
+        
+    Returns:
+        Number of newly queued jobs
+    """
+    dir_path = Path(directory)
+    if not dir_path.is_dir():
+        events.error('queue', f"Error: Not a directory: {directory}")
+        return 0
+    
+    split = converter_options.get('split') or converter_options.get('update')
+    options = dict(converter_options, compile=compile_latex_flag, compiler=compiler)
+    # Workers may run in another directory or on another host
+    for name in QUEUE_PATH_OPTIONS:
+        if options.get(name):
+            options[name] = str(Path(options[name]).resolve())
+    
+    queue = JobQueue(db_path)
+    added = 0
+    found = 0
+    try:
+        jobs = []
+        for epub_file in iter_epub_files(dir_path, recursive=recursive, include=include,
+                                         exclude=exclude, symlinks=symlinks):
+            output_tex = _book_output_path(epub_file, output_dir, split, dir_path)
+            priority = estimate_book_cost(epub_file)['cost'] if longest_first else 0
+            jobs.append((str(epub_file.resolve()), str(output_tex.resolve()), options, priority))
+            # Insert in batches so huge trees are queued without one giant list
+            if len(jobs) >= 1000:
+                added += queue.enqueue(jobs)
+                found += len(jobs)
+                jobs = []
+        if jobs:
+            added += queue.enqueue(jobs)
+            found += len(jobs)
+        counts = queue.counts()
+    finally:
+        queue.close()
+    
+    events.info('queue', f"Queued {added} new job(s) from {directory} ({found - added} already queued)",
+                added=added, found=found)
+    events.info('queue', "Queue: " + ", ".join(f"{status}={count}" for status, count in sorted(counts.items())),
+                detail=True, counts=counts)
+    return added
+
+
+def run_queue_worker(db_path: str, worker: Optional[str] = None,
+                     lease_seconds: float = 300, max_attempts: int = 3) -> Tuple[int, int]:
+    """
+    Process jobs from a SQLite job queue until none are left.
+    
+    A background thread heartbeats the current job every third of the lease,
+    so long conversions keep their lease while a crashed worker's jobs
+    become available to others once the lease runs out. A job taken over by
+    another worker meanwhile is not counted: its new owner reports it.
+    
+    Args:
+        db_path: Path to the queue database
+        worker: Worker identifier (defaults to hostname:pid)
+        lease_seconds: Lease duration for each job
+        max_attempts: Leases a job may lose before it is marked failed
+        
+    Returns:
+        Tuple of (successful_count, failed_count)
+    """
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    queue = JobQueue(db_path, lease_seconds=lease_seconds, max_attempts=max_attempts)
+    worker_start = time.monotonic()
+    successful = 0
+    failed = 0
+    
+    try:
+        while True:
+            job = queue.lease(worker)
+            if job is None:
+                break
+            
+            if events.min_level is not None and events.min_level <= LOG_LEVELS['debug']:
+                counts = queue.counts()
+                events.debug('queue', queue_depth=counts.get('pending', 0) + counts.get('running', 0))
+            
+            epub_file = Path(job['epub_path'])
+            events.info('queue', f"[{worker}] Job {job['id']} (attempt {job['attempts'] + 1}): "
+                        f"{epub_file.name}", rule='-', book=job['epub_path'], job=job['id'],
+                        worker=worker, attempt=job['attempts'] + 1)
+            
+            stop = threading.Event()
+            
+            def heartbeat(job_id=job['id']):
+                # sqlite3 connections must stay on the thread that made them
+                beat_queue = JobQueue(db_path, lease_seconds=lease_seconds)
+                try:
+                    while not stop.wait(lease_seconds / 3):
+                        if not beat_queue.heartbeat(job_id, worker):
+                            break
+                finally:
+                    beat_queue.close()
+            
+            beat = threading.Thread(target=heartbeat, daemon=True)
+            beat.start()
+            
+            options = dict(job['options'])
+            compile_latex_flag = options.pop('compile', False)
+            compiler = options.pop('compiler', 'pdflatex')
+            start = time.monotonic()
+            error = None
+            try:
+                Path(job['output_tex']).parent.mkdir(parents=True, exist_ok=True)
+                with events.book(job['epub_path']):
+                    success, error = _process_book(epub_file, Path(job['output_tex']),
+                                                   compile_latex_flag, compiler, **options)
+            except Exception as e:
+                success = False
+                error = f"{type(e).__name__}: {e}"
+            finally:
+                stop.set()
+                beat.join()
+            
+            duration = time.monotonic() - start
+            if not queue.complete(job['id'], worker, success, duration, error):
+                # The lease ran out and the job went to another worker, whose outcome counts
+                events.warning('queue', f"Job {job['id']} was taken over by another worker "
+                               f"(lease expired), result discarded", book=job['epub_path'],
+                               job=job['id'])
+                continue
+            if success:
+                successful += 1
+            else:
+                failed += 1
+                events.error('queue', f"Job {job['id']} failed: {error}", book=job['epub_path'],
+                             job=job['id'], error=error)
+    finally:
+        queue.close()
+    
+    _batch_summary(f"Worker {worker} finished: queue is empty", successful, failed,
+                   time.monotonic() - worker_start)
+    
+    return (successful, failed)
+
+
+def _latex_command(compiler: str, tex_name: str, draft_flag: Optional[str] = None) -> List[str]:
+    """Command line for one LaTeX pass, with options for error robustness."""
+    return [
+        compiler,
+        '-interaction=nonstopmode',  # Don't stop on errors
+        '-halt-on-error',            # But halt on critical errors
+        '-file-line-error',          # Better error messages
+    ] + ([draft_flag] if draft_flag else []) + [tex_name]
+
+
+# Engine option for a pass that only updates the auxiliary files
+TEX_DRAFT_FLAGS = {'pdflatex': '-draftmode', 'lualatex': '-draftmode', 'xelatex': '-no-pdf'}
+
+
+class _PassSchedule:
+    """
+    Decide which passes of a compile run in the engine's draft mode.
+    
+    A draft pass writes the auxiliary files but no PDF, and does not embed
+    images. Only a pass that is sure to be followed by another runs as a
+    draft: one that starts without a .aux (a fresh build), since writing it
+    always calls for a rerun. Any other pass may turn out to be the last,
+    so it produces the PDF, and a build never takes more passes than
+    without drafts.
+    """
+    
+    def __init__(self, compiler: str, max_passes: int, draft: bool):
+        self.flag = TEX_DRAFT_FLAGS.get(Path(compiler).name) if draft else None
+        self.max_passes = max_passes
+        self.final = True
+        self.drafts = 0
+    
+    def command(self, compiler: str, tex_path: Path, pass_num: int) -> List[str]:
+        """Command line of pass pass_num, decided from the files on disk before it runs."""
+        self.final = (self.flag is None or pass_num == self.max_passes
+                      or tex_path.with_suffix('.aux').exists())
+        if not self.final:
+            self.drafts += 1
+        return _latex_command(compiler, tex_path.name, None if self.final else self.flag)
+    
+    def another_pass(self, rerun: bool) -> bool:
+        """Whether to run another pass after the current one."""
+        # A draft is always followed by the pass that writes the PDF
+        return rerun or not self.final
+    
+    def cleanup(self, tex_path: Path):
+        """Remove what draft passes leave behind (xelatex -no-pdf writes a .xdv)."""
+        if self.drafts and self.flag == '-no-pdf':
+            try:
+                tex_path.with_suffix('.xdv').unlink()
+            except OSError:
+                pass
+
+
+def parse_size(spec: str) -> int:
+    """
+    Parse a memory size such as '512M', '2G' or '1500000' (bytes).
+    
+    Args:
+        spec: Size with an optional K, M, G or T suffix (powers of 1024)
+        
+    Returns:
+        Size in bytes
+        
+    Raises:
+        ValueError: If the specification is malformed
+    """
+    match = re.fullmatch(r'\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*', spec, re.IGNORECASE)
+    if not match:
+        raise ValueError(f"Invalid size '{spec}', expected e.g. 512M or 2G")
+    return int(float(match.group(1)) * 1024 ** ' KMGT'.index(match.group(2).upper() or ' '))
+
+
+class CompileLimits:
+    """
+    Resource limits, priority and timeout of the TeX subprocesses.
+    
+    Every pass runs in its own session, hence its own process group, so a
+    timeout kills TeX together with whatever it spawned (mktexpk, shell
+    escapes) instead of only the direct child. The limits are applied to
+    the started process with prlimit() and setpriority() rather than from
+    a preexec_fn, which is unsafe while other threads run; they survive the
+    exec and are inherited by TeX's own children.
+    
+    The timeout of a pass grows with the size of the document: timeout
+    seconds plus timeout_per_mb for each megabyte of .tex source.
+    """
+    
+    def __init__(self, memory: Optional[int] = None, cpu: Optional[int] = None,
+                 nice: Optional[int] = None, ionice: Optional[str] = None,
+                 timeout: float = 120.0, timeout_per_mb: float = 60.0):
+        """
+        Args:
+            memory: Address-space limit in bytes (RLIMIT_AS)
+            cpu: CPU time limit in seconds per pass (RLIMIT_CPU)
+            nice: Niceness added to each TeX process
+            ionice: I/O scheduling as 'CLASS[:LEVEL]' for ionice(1), e.g. '3'
+                    for idle or '2:7' for the lowest best-effort level
+            timeout: Base timeout of a pass in seconds
+            timeout_per_mb: Extra seconds per megabyte of .tex source
+        """
+        self.memory = memory
+        self.cpu = cpu
+        self.nice = nice
+        self.ionice = ionice
+        self.timeout = timeout
+        self.timeout_per_mb = timeout_per_mb
+    
+    def timeout_for(self, tex_path: Path) -> float:
+        """Timeout of one pass over tex_path (and its chapters/ in split mode)."""
+        size = tex_path.stat().st_size if tex_path.exists() else 0
+        chapters_dir = tex_path.parent / 'chapters'
+        if chapters_dir.is_dir():
+            size += sum(chapter.stat().st_size for chapter in chapters_dir.glob('*.tex'))
+        return self.timeout + self.timeout_per_mb * size / (1024 * 1024)
+    
+    def command(self, command: List[str]) -> List[str]:
+        """Command line wrapped in ionice(1) if I/O scheduling was requested."""
+        if not self.ionice or shutil.which('ionice') is None:
+            return command
+        io_class, _, level = self.ionice.partition(':')
+        return ['ionice', '-c', io_class] + (['-n', level] if level else []) + command
+    
+    def apply(self, pid: int):
+        """Apply the limits and niceness to a freshly started process."""
+        try:
+            if resource is not None and hasattr(resource, 'prlimit'):
+                if self.memory:
+                    resource.prlimit(pid, resource.RLIMIT_AS, (self.memory, self.memory))
+                if self.cpu:
+                    # The soft limit sends SIGXCPU, the hard one a second later SIGKILL
+                    resource.prlimit(pid, resource.RLIMIT_CPU, (self.cpu, self.cpu + 1))
+            if self.nice and hasattr(os, 'setpriority'):
+                os.setpriority(os.PRIO_PROCESS, pid, min(19, os.getpriority(os.PRIO_PROCESS, pid) + self.nice))
+        except ProcessLookupError:
+            # Already finished
+            pass
+    
+    def to_dict(self) -> Dict:
+        """JSON-serializable form."""
+        return dict(vars(self))
+
+
+# Limits used by compile_latex() and friends unless given explicitly
+_compile_limits = CompileLimits()
+
+
+def configure_compile_limits(limits: Optional[CompileLimits] = None) -> CompileLimits:
+    """
+    Set the default limits of TeX subprocesses in this process.
+    
+    Limits belong to the machine running TeX rather than to a book, so the
+    command line sets them once for every compile of the run (including
+    the compiles of a queue worker).
+    
+    Returns:
+        The previous default
+    """
+    global _compile_limits
+    previous = _compile_limits
+    _compile_limits = limits or CompileLimits()
+    return previous
+
+
+def _kill_group(pid: int):
+    """Kill a TeX process together with its process group."""
+    try:
+        if hasattr(os, 'killpg'):
+            os.killpg(pid, signal.SIGKILL)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _run_tex(command: List[str], cwd: Path, timeout: float,
+             limits: CompileLimits) -> Tuple[Optional[int], bool]:
+    """
+    Run one TeX pass in its own process group under limits.
+    
+    Everything worth reading ends up in the .log file, so the terminal
+    output is discarded.
+    
+    Returns:
+        Tuple of (return code, timed out)
+    """
+    process = subprocess.Popen(limits.command(command), cwd=cwd, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                               start_new_session=True)
+    try:
+        limits.apply(process.pid)
+        return process.wait(timeout=timeout), False
+    except subprocess.TimeoutExpired:
+        _kill_group(process.pid)
+        process.wait()
+        return None, True
+    except BaseException:
+        # Interrupted: TeX no longer shares our process group, so Ctrl-C
+        # does not reach it by itself
+        _kill_group(process.pid)
+        process.wait()
+        raise
+
+
+def _killed_by_limit(returncode: Optional[int]) -> Optional[str]:
+    """Name of the resource limit that killed TeX, judging from its return code."""
+    if returncode is not None and hasattr(signal, 'SIGXCPU') and returncode == -signal.SIGXCPU:
+        return 'CPU time limit'
+    return None
+
+
+# Engines accepted by --compiler
+TEX_ENGINES = ('pdflatex', 'xelatex', 'lualatex')
+
+_TEX_COMMENT = re.compile(r'(?<!\\)%.*')
+_TEX_USEPACKAGE = re.compile(r'\\(usepackage|RequirePackage|documentclass)\s*(?:\[[^\]]*\])?\s*\{([^}]*)\}')
+
+
+def _binary_identity(path: Optional[str]) -> Optional[List]:
+    """Path, mtime and size of a binary: changes when TeX is upgraded."""
+    if path is None:
+        return None
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return [os.path.realpath(path), info.st_mtime_ns, info.st_size]
+
+
+class Toolchain:
+    """
+    The TeX installation reachable through PATH, as found by probe_toolchain().
+    
+    Engines are located on PATH without being run. Packages are looked up
+    with a single kpsewhich call for all the files not checked yet; the
+    ones found are remembered (and saved to the disk cache, if any), the
+    missing ones are asked again next time, since they may have been
+    installed meanwhile.
+    
+    Attributes:
+        engines: Engine name -> [path, mtime, size], None if not installed
+        kpsewhich: Identity of kpsewhich, None if not installed
+        found: Package and class files known to be installed
+    """
+    
+    def __init__(self, path: str, cache_dir: Optional[str] = None):
+        self.path = path
+        self.engines = {engine: _binary_identity(shutil.which(engine, path=path)) for engine in TEX_ENGINES}
+        self.kpsewhich = _binary_identity(shutil.which('kpsewhich', path=path))
+        self.found = set()
+        self.cache_path = None
+        if cache_dir is not None:
+            key = hashlib.sha256(json.dumps([path, self.engines, self.kpsewhich]).encode('utf-8'))
+            self.cache_path = Path(cache_dir) / f"toolchain-{key.hexdigest()[:16]}.json"
+            try:
+                self.found = set(json.loads(self.cache_path.read_text(encoding='utf-8'))['found'])
+            except (OSError, ValueError, KeyError, TypeError):
+                pass
+        self._lock = threading.Lock()
+    
+    def has_engine(self, compiler: str) -> bool:
+        """Whether compiler (an engine name or any command) is installed."""
+        if compiler not in self.engines:
+            self.engines[compiler] = _binary_identity(shutil.which(compiler, path=self.path))
+        return self.engines[compiler] is not None
+    
+    def missing(self, files: Iterable[str]) -> List[str]:
+        """
+        Return the files (e.g. 'soul.sty') kpsewhich cannot find.
+        
+        Without kpsewhich nothing can be checked and nothing is reported.
+        """
+        with self._lock:
+            unknown = sorted(set(files) - self.found)
+            if not unknown or self.kpsewhich is None:
+                return []
+            try:
+                completed = subprocess.run([self.kpsewhich[0]] + unknown, stdin=subprocess.DEVNULL,
+                                           stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                           text=True, timeout=60)
+            except (OSError, subprocess.TimeoutExpired) as e:
+                events.warning('toolchain', f"Cannot check LaTeX packages: {str(e)}")
+                return []
+            # kpsewhich prints the path of each file found, nothing for the others
+            located = {Path(line.strip()).name for line in completed.stdout.splitlines() if line.strip()}
+            newly_found = [name for name in unknown if name in located]
+            if newly_found:
+                self.found.update(newly_found)
+                self._save()
+            return [name for name in unknown if name not in located]
+    
+    def _save(self):
+        """Write the packages found to the disk cache."""
+        if self.cache_path is None:
+            return
+        try:
+            self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(json.dumps({'found': sorted(self.found)}), encoding='utf-8')
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+    
+    def to_dict(self) -> Dict:
+        """JSON-serializable form."""
+        return {
+            'engines': {engine: identity[0] if identity else None for engine, identity in self.engines.items()},
+            'kpsewhich': self.kpsewhich[0] if self.kpsewhich else None,
+            'found': sorted(self.found),
+        }
+
+
+# Toolchains probed by this process, by PATH, see probe_toolchain()
+_toolchains: Dict[str, Toolchain] = {}
+_toolchain_cache_dir = None
+_toolchains_lock = threading.Lock()
+
+
+def configure_toolchain_cache(cache_dir: Optional[str]):
+    """Keep the packages found by kpsewhich in cache_dir across runs (None: this process only)."""
+    global _toolchain_cache_dir
+    with _toolchains_lock:
+        _toolchain_cache_dir = cache_dir
+        _toolchains.clear()
+
+
+def probe_toolchain() -> Toolchain:
+    """
+    Return the Toolchain of the current PATH, probing it once per process.
+    
+    Instead of running the engine for every book (a process per book on a
+    large batch), engines are only located on PATH; the disk cache, if
+    configured, is keyed by PATH and the identity (path, mtime, size) of
+    the engines and kpsewhich, so it is invalidated by a TeX upgrade.
+    """
+    path = os.environ.get('PATH', os.defpath)
+    with _toolchains_lock:
+        toolchain = _toolchains.get(path)
+        if toolchain is None:
+            toolchain = _toolchains[path] = Toolchain(path, _toolchain_cache_dir)
+        return toolchain
+
+
+def _required_tex_files(tex_path: Path) -> List[str]:
+    """Class and package files loaded by the preamble of a .tex file."""
+    files = []
+    with open(tex_path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = _TEX_COMMENT.sub('', line)
+            if '\\begin{document}' in line:
+                break
+            for command, names in _TEX_USEPACKAGE.findall(line):
+                suffix = '.cls' if command == 'documentclass' else '.sty'
+                files.extend(name.strip() + suffix for name in names.split(',') if name.strip())
+    return files
+
+
+def _check_toolchain(tex_path: Path, compiler: str, stage: str) -> bool:
+    """
+    Fail fast, before any TeX pass, when the engine or a package is missing.
+    
+    Returns:
+        False (after reporting what is missing) if the document cannot compile
+    """
+    toolchain = probe_toolchain()
+    if not toolchain.has_engine(compiler):
+        events.error(stage, f"Error: LaTeX compiler '{compiler}' not found")
+        events.info(stage, "Please install TeX Live or MiKTeX", detail=True)
+        return False
+    missing = toolchain.missing(_required_tex_files(tex_path))
+    if missing:
+        events.error(stage, f"Error: LaTeX package(s) not installed: {', '.join(missing)}", missing=missing)
+        events.info(stage, "Install them with your TeX distribution (e.g. tlmgr install "
+                    f"{' '.join(Path(name).stem for name in missing)})", detail=True)
+        return False
+    return True
+
+
+# TeX wraps its log at max_print_line characters (79 by default)
+TEX_LOG_LINE_WIDTH = 79
+
+# Auxiliary files whose change between passes means another pass is needed
+TEX_AUX_SUFFIXES = ('.aux', '.toc', '.lof', '.lot', '.out')
+
+_TEX_FILE_LINE_ERROR = re.compile(r'^(.+?\.(?:tex|sty|cls|def|cfg|aux|toc|ltx|fd)):(\d+): (.*)$')
+_TEX_CONTEXT_LINE = re.compile(r'^l\.(\d+) ?(.*)$')
+_TEX_BOX = re.compile(r'^(Overfull|Underfull) \\[hv]box')
+_TEX_UNDEFINED = re.compile(r"(Reference|Citation) [`'](.+?)' on page \d+ undefined")
+_TEX_RERUN = re.compile(r'Rerun to get|may have changed\. Rerun|Please rerun|\(rerunfilecheck\)\s+Rerun')
+
+
+class TeXLog:
+    """
+    Diagnostics parsed from one TeX .log file.
+    
+    Lines are fed one at a time (see parse_tex_log()), so arbitrarily large
+    logs are parsed in constant memory.
+    
+    Attributes:
+        errors: Dicts with 'type', 'message', 'file', 'line' and 'context';
+                compile_latex() adds 'source' when the document has a source map
+        overfull: Number of overfull boxes
+        underfull: Number of underfull boxes
+        undefined_references: Labels of undefined \\ref's, in order of appearance
+        undefined_citations: Keys of undefined \\cite's
+        rerun: Whether TeX asked for another pass
+    """
+    
+    def __init__(self):
+        self.errors: List[Dict] = []
+        self.overfull = 0
+        self.underfull = 0
+        self.undefined_references: List[str] = []
+        self.undefined_citations: List[str] = []
+        self.rerun = False
+        # Error still waiting for its 'l.NNN' context line
+        self._pending = None
+    
+    def _add_error(self, message: str, file: Optional[str] = None, line: Optional[int] = None):
+        # 'LaTeX Error: ...' and 'Package foo Error: ...' carry their own type
+        error_type, sep, rest = message.partition(' Error: ')
+        if sep:
+            error_type, message = error_type + ' Error', rest
+        else:
+            error_type = message.rstrip('.')
+        error = {'type': error_type, 'message': message, 'file': file, 'line': line, 'context': None}
+        self.errors.append(error)
+        self._pending = error
+    
+    def feed(self, line: str):
+        """Parse one (unwrapped) log line."""
+        if self._pending is not None:
+            context = _TEX_CONTEXT_LINE.match(line)
+            if context:
+                if self._pending['line'] is None:
+                    self._pending['line'] = int(context.group(1))
+                self._pending['context'] = context.group(2).strip()
+                self._pending = None
+                return
+        
+        if line.startswith('! '):
+            self._add_error(line[2:].strip())
+            return
+        match = _TEX_FILE_LINE_ERROR.match(line)
+        if match:
+            self._add_error(match.group(3).strip(), match.group(1), int(match.group(2)))
+            return
+        
+        box = _TEX_BOX.match(line)
+        if box:
+            if box.group(1) == 'Overfull':
+                self.overfull += 1
+            else:
+                self.underfull += 1
+            return
+        
+        if 'Warning' in line or 'Rerun' in line or 'rerun' in line:
+            for kind, name in _TEX_UNDEFINED.findall(line):
+                target = self.undefined_references if kind == 'Reference' else self.undefined_citations
+                if name not in target:
+                    target.append(name)
+            if _TEX_RERUN.search(line):
+                self.rerun = True
+    
+    def to_dict(self) -> Dict:
+        return {
+            'errors': self.errors,
+            'overfull': self.overfull,
+            'underfull': self.underfull,
+            'undefined_references': self.undefined_references,
+            'undefined_citations': self.undefined_citations,
+            'rerun': self.rerun,
+        }
+
+
+def parse_tex_log(log_path) -> TeXLog:
+    """
+    Stream a TeX .log file into a TeXLog.
+    
+    TeX hard-wraps log lines at TEX_LOG_LINE_WIDTH characters; wrapped
+    lines are joined back together before they are parsed.
+    """
+    log = TeXLog()
+    with open(log_path, 'r', encoding='utf-8', errors='replace') as f:
+        pending = ''
+        for raw in f:
+            line = raw.rstrip('\n')
+            if len(line) == TEX_LOG_LINE_WIDTH:
+                pending += line
+                continue
+            log.feed(pending + line)
+            pending = ''
+        if pending:
+            log.feed(pending)
+    return log
+
+
+class CompileResult:
+    """
+    Outcome of compile_latex(): true when a PDF was produced.
+    
+    Attributes:
+        tex_path: The compiled .tex file
+        pdf_path: The PDF, or None if none was produced
+        passes: Number of TeX passes run
+        log: TeXLog of the last pass (None if TeX never ran)
+        timed_out: Whether a pass was killed for exceeding the timeout
+    """
+    
+    def __init__(self, tex_path: Path):
+        self.tex_path = tex_path
+        self.pdf_path = None
+        self.passes = 0
+        self.log = None
+        self.timed_out = False
+    
+    def __bool__(self) -> bool:
+        return self.pdf_path is not None
+    
+    @property
+    def errors(self) -> List[Dict]:
+        return self.log.errors if self.log else []
+    
+    def to_dict(self) -> Dict:
+        return {
+            'tex': str(self.tex_path),
+            'pdf': str(self.pdf_path) if self.pdf_path else None,
+            'passes': self.passes,
+            'timed_out': self.timed_out,
+            'diagnostics': self.log.to_dict() if self.log else None,
+        }
+
+
+def _aux_snapshot(tex_path: Path) -> Dict[str, str]:
+    """Hashes of the auxiliary files of a document, including \\include'd chapters."""
+    candidates = [tex_path.with_suffix(suffix) for suffix in TEX_AUX_SUFFIXES]
+    chapters_dir = tex_path.parent / 'chapters'
+    if chapters_dir.is_dir():
+        candidates.extend(chapters_dir.glob('*.aux'))
+    snapshot = {}
+    for path in candidates:
+        try:
+            snapshot[str(path)] = hashlib.sha1(path.read_bytes()).hexdigest()
+        except OSError:
+            continue
+    return snapshot
+
+
+def _finish_pass(result: CompileResult, pass_num: int, returncode: int, duration: float,
+                 aux_before: Dict[str, str], draft: bool = False) -> bool:
+    """
+    Parse the log of a finished pass, report it, and decide whether to rerun.
+    
+    TeX only prints rerun hints for some changes (labels, outlines), so a
+    change in the auxiliary files (e.g. a new .toc) also triggers a rerun.
+    """
+    tex_path = result.tex_path
+    result.passes = pass_num
+    log_path = tex_path.with_suffix('.log')
+    result.log = parse_tex_log(log_path) if log_path.exists() else TeXLog()
+    log = result.log
+    
+    aux_changed = _aux_snapshot(tex_path) != aux_before
+    rerun = log.rerun or aux_changed
+    events.info('compile', f"Pass {pass_num}" + (" (draft)" if draft else ""), detail=True,
+                tex_pass=pass_num, draft=draft, returncode=returncode, pass_duration=round(duration, 6),
+                errors=len(log.errors), overfull=log.overfull, underfull=log.underfull,
+                undefined_references=len(log.undefined_references), rerun_hint=log.rerun,
+                aux_changed=aux_changed)
+    
+    if log.errors:
+        _locate_errors(log.errors, tex_path)
+        events.warning('compile', f"Compilation errors on pass {pass_num}:", tex_pass=pass_num,
+                       errors=log.errors[:5])
+        for error in log.errors[:5]:  # Show first 5 errors
+            where = f"{error['file'] or tex_path.name}:{error['line']}: " if error['line'] else ''
+            source = error.get('source')
+            origin = f" [{source['item']} {source['path']}]" if source else ''
+            events.info('compile', f"  {where}{error['message']}{origin}", detail=True)
+    return rerun
+
+
+def _locate_errors(errors: List[Dict], tex_path: Path):
+    """Add a 'source' entry (see SourceMap.lookup()) to errors, if the document has a source map."""
+    source_map = SourceMap.load(tex_path.with_suffix('.srcmap.json'))
+    if source_map is None:
+        return
+    for error in errors:
+        if error['line']:
+            error['source'] = source_map.lookup(error['file'] or tex_path.name, error['line'])
+
+
+def _finish_compile(result: CompileResult) -> CompileResult:
+    """Record and report the outcome once the last pass has run."""
+    pdf_path = result.tex_path.with_suffix('.pdf')
+    log = result.log
+    if log and (log.overfull or log.underfull or log.undefined_references or log.undefined_citations):
+        events.info('compile', f"{log.overfull} overfull and {log.underfull} underfull box(es), "
+                    f"{len(log.undefined_references)} undefined reference(s), "
+                    f"{len(log.undefined_citations)} undefined citation(s)", detail=True)
+    if pdf_path.exists():
+        result.pdf_path = pdf_path
+        events.success('compile', f"PDF generated successfully: {pdf_path}", pdf=str(pdf_path),
+                       passes=result.passes)
+    else:
+        events.error('compile', "Error: PDF not generated (compilation may have failed)")
+    return result
+
+
+def compile_latex(tex_file: str, compiler: str = 'pdflatex', max_passes: int = 3,
+                  limits: Optional[CompileLimits] = None, draft: bool = True) -> CompileResult:
+    """
+    Compile LaTeX file to PDF with error-robust compilation.
+    
+    The compiler's terminal output is discarded; after each pass the .log
+    file is streamed through parse_tex_log(). Another pass runs only while
+    TeX asks for one or the auxiliary files changed, up to max_passes.
+    With draft, the first pass of a fresh build runs in the engine's draft
+    mode (-draftmode, or -no-pdf for xelatex) and skips writing the PDF and
+    its images; see _PassSchedule.
+    
+    Args:
+        tex_file: Path to the .tex file
+        compiler: LaTeX compiler to use (pdflatex, xelatex, lualatex)
+        max_passes: Maximum number of compilation passes (for TOC, refs, etc.)
+        limits: Resource limits and timeout of each pass (default: the ones
+                set with configure_compile_limits())
+        draft: Run the first pass of a fresh build in draft mode
+        
+    Returns:
+        CompileResult, true if a PDF was produced
+    """
+    with events.stage('compile') as summary:
+        result = _compile_latex(tex_file, compiler, max_passes, limits or _compile_limits, draft)
+        summary['success'] = bool(result)
+        return result
+
+
+def _compile_latex(tex_file: str, compiler: str, max_passes: int,
+                   limits: CompileLimits, draft: bool) -> CompileResult:
+    """Body of compile_latex()."""
+    tex_path = Path(tex_file)
+    result = CompileResult(tex_path)
+    if not tex_path.exists():
+        events.error('compile', f"Error: LaTeX file not found: {tex_file}")
+        return result
+    
+    # Check that the compiler and the packages are available
+    if not _check_toolchain(tex_path, compiler, 'compile'):
+        return result
+    
+    schedule = _PassSchedule(compiler, max_passes, draft)
+    timeout = limits.timeout_for(tex_path)
+    
+    try:
+        events.info('compile', f"Compiling {tex_path.name} with {compiler}...", compiler=compiler)
+        
+        # Multiple passes for TOC, references, etc.
+        for pass_num in range(1, max_passes + 1):
+            aux_before = _aux_snapshot(tex_path)
+            pass_start = time.perf_counter()
+            try:
+                # Run in the directory containing the .tex file (via cwd rather
+                # than os.chdir, which would affect every thread of the process)
+                compile_options = schedule.command(compiler, tex_path, pass_num)
+                returncode, timed_out = _run_tex(compile_options, tex_path.parent, timeout, limits)
+            except Exception as e:
+                events.warning('compile', f"Compilation error on pass {pass_num}: {str(e)}",
+                               tex_pass=pass_num)
+                break
+            if timed_out:
+                result.timed_out = True
+                events.warning('compile', f"Compilation timeout on pass {pass_num} ({timeout:.1f}s)",
+                               tex_pass=pass_num, timeout=round(timeout, 1))
+                break
+            if _killed_by_limit(returncode):
+                events.warning('compile', f"TeX stopped by the {_killed_by_limit(returncode)} "
+                               f"on pass {pass_num}", tex_pass=pass_num)
+            
+            rerun = _finish_pass(result, pass_num, returncode, time.perf_counter() - pass_start,
+                                 aux_before, draft=not schedule.final)
+            if not schedule.another_pass(rerun):
+                break
+        
+        schedule.cleanup(tex_path)
+        return _finish_compile(result)
+            
+    except Exception as e:
+        events.error('compile', f"Error during compilation: {str(e)}")
+        return result
+
+
+async def compile_latex_async(tex_file: str, compiler: str = 'pdflatex', max_passes: int = 3,
+                              limit: Optional[asyncio.Semaphore] = None,
+                              limits: Optional[CompileLimits] = None,
+                              draft: bool = True) -> CompileResult:
+    """
+    Asyncio counterpart of compile_latex().
+    
+    Passes run through asyncio.create_subprocess_exec, so the event loop
+    keeps converting other books while TeX runs. Each pass acquires limit,
+    if given, which caps the number of concurrent TeX processes.
+    
+    Args:
+        tex_file: Path to the .tex file
+        compiler: LaTeX compiler to use (pdflatex, xelatex, lualatex)
+        max_passes: Maximum number of compilation passes (for TOC, refs, etc.)
+        limit: Optional semaphore bounding concurrent TeX processes
+        limits: Resource limits and timeout of each pass, see compile_latex()
+        draft: Run the first pass of a fresh build in draft mode, see compile_latex()
+        
+    Returns:
+        CompileResult, true if a PDF was produced
+    """
+    with events.stage('compile') as summary:
+        result = await _compile_latex_async(tex_file, compiler, max_passes, limit,
+                                            limits or _compile_limits, draft)
+        summary['success'] = bool(result)
+        return result
+
+
+async def _compile_latex_async(tex_file: str, compiler: str, max_passes: int,
+                               limit: Optional[asyncio.Semaphore],
+                               limits: CompileLimits, draft: bool) -> CompileResult:
+    """Body of compile_latex_async()."""
+    tex_path = Path(tex_file)
+    result = CompileResult(tex_path)
+    if not tex_path.exists():
+        events.error('compile', f"Error: LaTeX file not found: {tex_file}")
+        return result
+    
+    if not _check_toolchain(tex_path, compiler, 'compile'):
+        return result
+    
+    limit = limit or asyncio.Semaphore(1)
+    schedule = _PassSchedule(compiler, max_passes, draft)
+    timeout = limits.timeout_for(tex_path)
+    
+    events.info('compile', f"Compiling {tex_path.name} with {compiler}...", compiler=compiler)
+    for pass_num in range(1, max_passes + 1):
+        async with limit:
+            aux_before = _aux_snapshot(tex_path)
+            pass_start = time.perf_counter()
+            try:
+                compile_options = limits.command(schedule.command(compiler, tex_path, pass_num))
+                process = await asyncio.create_subprocess_exec(
+                    *compile_options,
+                    cwd=tex_path.parent,
+                    stdin=asyncio.subprocess.DEVNULL,
+                    stdout=asyncio.subprocess.DEVNULL,
+                    stderr=asyncio.subprocess.DEVNULL,
+                    start_new_session=True
+                )
+                try:
+                    limits.apply(process.pid)
+                    await asyncio.wait_for(process.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    _kill_group(process.pid)
+                    await process.wait()
+                    result.timed_out = True
+                    events.warning('compile', f"Compilation timeout on pass {pass_num} of {tex_path.name} "
+                                   f"({timeout:.1f}s)", tex_pass=pass_num, timeout=round(timeout, 1))
+                    break
+                except BaseException:
+                    # Cancelled: TeX is in its own process group
+                    _kill_group(process.pid)
+                    raise
+            except Exception as e:
+                events.warning('compile', f"Compilation error on pass {pass_num} of {tex_path.name}: "
+                               f"{str(e)}", tex_pass=pass_num)
+                break
+        if _killed_by_limit(process.returncode):
+            events.warning('compile', f"TeX stopped by the {_killed_by_limit(process.returncode)} "
+                           f"on pass {pass_num} of {tex_path.name}", tex_pass=pass_num)
+        
+        rerun = _finish_pass(result, pass_num, process.returncode, time.perf_counter() - pass_start,
+                             aux_before, draft=not schedule.final)
+        if not schedule.another_pass(rerun):
+            break
+    
+    schedule.cleanup(tex_path)
+    return _finish_compile(result)
+
+
+_TEX_INCLUDE = re.compile(r'^\\include\{(.+)\}$')
+
+
+class BisectResult:
+    """
+    Outcome of bisect_chapters().
+    
+    Attributes:
+        tex_path: The main .tex file
+        preamble_errors: Errors of the preamble on its own (a failing preamble
+                         makes every chapter fail, so chapters are not tried)
+        chapters: One dict per \\include'd chapter, in document order, with
+                  'chapter' (e.g. 'chapters/003'), 'ok', 'errors' and 'timed_out'
+        partial: CompileResult of the placeholder build, if one was requested
+    """
+    
+    def __init__(self, tex_path: Path):
+        self.tex_path = tex_path
+        self.preamble_errors: List[Dict] = []
+        self.chapters: List[Dict] = []
+        self.partial = None
+    
+    @property
+    def failed(self) -> List[Dict]:
+        return [chapter for chapter in self.chapters if not chapter['ok']]
+    
+    def to_dict(self) -> Dict:
+        return {
+            'tex': str(self.tex_path),
+            'preamble_errors': self.preamble_errors,
+            'chapters': self.chapters,
+            'partial': self.partial.to_dict() if self.partial is not None else None,
+        }
+
+
+def _split_main_tex(text: str) -> Tuple[str, List[str]]:
+    """
+    Split a main file written in split mode into the preamble (up to and
+    including \\begin{document}, without \\includeonly) and its \\include targets.
+    """
+    head, sep, body = text.partition('\\begin{document}')
+    if not sep:
+        raise ValueError("no \\begin{document}")
+    head = ''.join(line for line in head.splitlines(keepends=True)
+                   if not line.startswith('\\includeonly{'))
+    includes = []
+    for line in body.splitlines():
+        match = _TEX_INCLUDE.match(line.strip())
+        if match:
+            includes.append(match.group(1))
+    return head + sep + '\n', includes
+
+
+def _compile_probe(tex_path: Path, work_dir: Path, name: str, document: str,
+                   compiler: str) -> Tuple[bool, List[Dict], bool]:
+    """
+    Run one TeX pass over a standalone document in its own output directory.
+    
+    Returns:
+        Tuple of (ok, errors, timed_out)
+    """
+    probe_dir = work_dir / name
+    probe_dir.mkdir()
+    probe_tex = probe_dir / f"{name}.tex"
+    probe_tex.write_text(document, encoding='utf-8')
+    # Paths relative to the book directory, so chapters and images resolve as usual
+    relative = probe_dir.relative_to(tex_path.parent)
+    command = _latex_command(compiler, (relative / probe_tex.name).as_posix())
+    command.insert(-1, f"-output-directory={relative.as_posix()}")
+    # The whole book's timeout bounds any of its chapters
+    returncode, timed_out = _run_tex(command, tex_path.parent, _compile_limits.timeout_for(tex_path),
+                                     _compile_limits)
+    if timed_out:
+        return False, [], True
+    log_path = probe_dir / f"{name}.log"
+    log = parse_tex_log(log_path) if log_path.exists() else TeXLog()
+    _locate_errors(log.errors, tex_path)
+    return returncode == 0 and not log.errors, log.errors, False
+
+
+def bisect_chapters(tex_file: str, compiler: str = 'pdflatex', jobs: Optional[int] = None,
+                    placeholder: bool = False) -> BisectResult:
+    """
+    Find the chapters of a split-mode book that fail to compile.
+    
+    Every \\include'd chapter is compiled on its own, \\input into a
+    document with the book's preamble, in parallel TeX runs that each get
+    their own output directory. The preamble is compiled on its own first,
+    since when it fails every chapter would. Errors are located with the
+    source map if the book has one.
+    
+    Args:
+        tex_file: Main .tex file written with split=True
+        compiler: LaTeX compiler to use (pdflatex, xelatex, lualatex)
+        jobs: Maximum concurrent TeX processes (default: number of CPUs)
+        placeholder: Also build <book>-partial.pdf, with each failing
+                     chapter replaced by a placeholder page
+        
+    Returns:
+        BisectResult
+    """
+    with events.stage('bisect') as summary:
+        result = _bisect_chapters(Path(tex_file), compiler, jobs or os.cpu_count() or 1, placeholder)
+        summary['failed_chapters'] = len(result.failed)
+        return result
+
+
+def _bisect_chapters(tex_path: Path, compiler: str, jobs: int, placeholder: bool) -> BisectResult:
+    """Body of bisect_chapters()."""
+    result = BisectResult(tex_path)
+    try:
+        main_tex = tex_path.read_text(encoding='utf-8')
+        head, includes = _split_main_tex(main_tex)
+    except (OSError, ValueError) as e:
+        events.error('bisect', f"Error: cannot read {tex_path}: {str(e)}")
+        return result
+    if not includes:
+        events.error('bisect', f"Error: {tex_path.name} has no \\include'd chapters "
+                     "(convert with --split)")
+        return result
+    if not _check_toolchain(tex_path, compiler, 'bisect'):
+        return result
+    
+    work_dir = Path(tempfile.mkdtemp(prefix='.bisect-', dir=tex_path.parent))
+    try:
+        ok, errors, _ = _compile_probe(tex_path, work_dir, 'preamble',
+                                       head + '\\mbox{}\n\\end{document}\n', compiler)
+        if not ok:
+            result.preamble_errors = errors
+            events.error('bisect', "The preamble fails on its own; chapters were not tried",
+                         errors=errors[:5])
+            for error in errors[:5]:
+                events.info('bisect', f"  {error['line'] or '?'}: {error['message']}", detail=True)
+            return result
+        
+        events.info('bisect', f"Compiling {len(includes)} chapter(s) standalone, "
+                    f"{min(jobs, len(includes))} at a time...", chapters=len(includes), jobs=jobs)
+        
+        def probe(target: str) -> Tuple[bool, List[Dict], bool]:
+            document = f"{head}\\input{{{target}}}\n\\end{{document}}\n"
+            return _compile_probe(tex_path, work_dir, Path(target).name, document, compiler)
+        
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            outcomes = list(pool.map(probe, includes))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    
+    for target, (ok, errors, timed_out) in zip(includes, outcomes):
+        result.chapters.append({'chapter': target, 'ok': ok, 'errors': errors, 'timed_out': timed_out})
+        if ok:
+            continue
+        reason = 'timed out' if timed_out else (errors[0]['message'] if errors else 'TeX failed')
+        events.warning('bisect', f"{target}: {reason}", chapter=target, errors=errors[:5],
+                       timed_out=timed_out)
+        for error in errors[:5]:
+            source = error.get('source')
+            origin = f" [{source['item']} {source['path']}]" if source else ''
+            events.info('bisect', f"  {error['file'] or target}:{error['line']}: {error['message']}{origin}",
+                        detail=True)
+    
+    if not result.failed:
+        events.info('bisect', "Every chapter compiles on its own; the failure comes from "
+                    "the combination (cross-references, TOC or state leaking between chapters)")
+        return result
+    events.warning('bisect', f"{len(result.failed)} of {len(includes)} chapter(s) fail to compile",
+                   failed=[chapter['chapter'] for chapter in result.failed])
+    
+    if placeholder:
+        failing = {chapter['chapter'] for chapter in result.failed}
+        lines = []
+        for line in main_tex.splitlines(keepends=True):
+            match = _TEX_INCLUDE.match(line.strip())
+            if match and match.group(1) in failing:
+                line = ("\\clearpage\n\\begin{center}\\fbox{Chapter \\texttt{"
+                        f"{match.group(1)}" "} could not be typeset}\\end{center}\n\\clearpage\n")
+            lines.append(line)
+        partial_path = tex_path.with_name(f"{tex_path.stem}-partial.tex")
+        _write_if_changed(partial_path, ''.join(lines))
+        result.partial = compile_latex(str(partial_path), compiler=compiler)
+    return result
+
+
+def _profile_label(func: Tuple[str, int, str]) -> str:
+    """Frame label for collapsed stacks, e.g. '_convert_element (epub2tex.py:1720)'."""
+    filename, line, name = func
+    if filename == '~':
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def _collapsed_stacks(stats: Dict, min_fraction: float = 1e-5) -> Iterator[str]:
+    """
+    Derive collapsed stacks ('a;b;c microseconds') from pstats data.
+    
+    cProfile only keeps caller/callee pairs, so full stacks are rebuilt by
+    walking the call graph from its roots and splitting each function's time
+    between its callers in proportion to the time each caller edge
+    accounted for. Recursive edges are folded into the first occurrence and
+    paths worth less than min_fraction of the total time are dropped to
+    bound the output.
+    
+    Args:
+        stats: pstats.Stats(...).stats mapping
+        min_fraction: Smallest share of the total time kept on a path
+        
+    Yields:
+        Lines in the format read by flamegraph.pl and speedscope
+    """
+    callees: Dict = {}
+    for func, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            callees.setdefault(caller, []).append((func, edge[3]))
+    
+    roots = [func for func, row in stats.items() if not row[4]]
+    min_seconds = min_fraction * sum(stats[root][3] for root in roots)
+    totals: Dict[str, float] = {}
+    
+    def walk(func, budget, path, labels):
+        _, _, own_time, cumulative, _ = stats[func]
+        scale = budget / cumulative if cumulative else 0.0
+        labels.append(_profile_label(func))
+        path.add(func)
+        own = own_time * scale
+        if own >= min_seconds:
+            stack = ';'.join(labels)
+            totals[stack] = totals.get(stack, 0.0) + own
+        for callee, edge_time in callees.get(func, ()):
+            share = edge_time * scale
+            if callee not in path and share >= min_seconds:
+                walk(callee, share, path, labels)
+        path.discard(func)
+        labels.pop()
+    
+    for root in roots:
+        walk(root, stats[root][3], set(), [])
+    
+    for stack, seconds in totals.items():
+        yield f"{stack} {int(round(seconds * 1_000_000))}"
+
+
+def _write_profile(profiler: cProfile.Profile, profile_dir: str, name: str) -> Tuple[Path, Path]:
+    """
+    Save a finished profile as NAME.pstats and NAME.folded in profile_dir.
+    
+    Returns:
+        Tuple of (pstats path, collapsed-stacks path)
+    """
+    directory = Path(profile_dir)
+    directory.mkdir(parents=True, exist_ok=True)
+    stats_path = directory / f"{name}.pstats"
+    folded_path = directory / f"{name}.folded"
+    profiler.dump_stats(str(stats_path))
+    with open(folded_path, 'w', encoding='utf-8') as f:
+        for line in _collapsed_stacks(pstats.Stats(profiler).stats):
+            f.write(line + '\n')
+    return stats_path, folded_path
+
+
+class TagStats:
+    """
+    Per-tag counters collected while a book is converted.
+    
+    For every tag dispatched by _convert_element it records the number of
+    nodes, inclusive time (the element and everything below it) and exclusive
+    time (inclusive minus the time spent in child elements), plus the bytes
+    of text run through _escape_latex for that tag's own text nodes and
+    attributes. Text nodes themselves are counted under '#text'. Tags that fall through to the default
+    branch of _convert_element are counted separately in self.unknown.
+    """
+    
+    def __init__(self):
+        # tag -> [nodes, inclusive seconds, exclusive seconds, escaped bytes]
+        self.tags: Dict[str, List[float]] = {}
+        self.unknown: Dict[str, int] = {}
+        # One [tag, child seconds] frame per element being converted
+        self._stack: List[list] = []
+    
+    def _entry(self, tag: str) -> List[float]:
+        entry = self.tags.get(tag)
+        if entry is None:
+            entry = self.tags[tag] = [0, 0.0, 0.0, 0]
+        return entry
+    
+    def enter(self, tag: str):
+        """Start timing an element."""
+        self._stack.append([tag, 0.0])
+    
+    def leave(self, elapsed: float):
+        """Stop timing the innermost element, which took elapsed seconds."""
+        tag, child_time = self._stack.pop()
+        entry = self._entry(tag)
+        entry[0] += 1
+        entry[1] += elapsed
+        entry[2] += elapsed - child_time
+        if self._stack:
+            self._stack[-1][1] += elapsed
+    
+    def add_text(self, nbytes: int):
+        """Attribute escaped text to the innermost tag."""
+        tag = '#text'
+        for frame in reversed(self._stack):
+            if frame[0] != '#text':
+                tag = frame[0]
+                break
+        self._entry(tag)[3] += nbytes
     
-    print("\n" + "=" * 60)
-    print(f"Batch processing complete!")
-    print(f"  Successful: {successful}")
-    print(f"  Failed: {failed}")
-    print("=" * 60)
+    def add_unknown(self, tag: str):
+        """Record a tag handled by the default branch."""
+        self.unknown[tag] = self.unknown.get(tag, 0) + 1
     
-    return (successful, failed)
+    def to_dict(self) -> Dict:
+        """JSON-serializable view, tags sorted by exclusive time."""
+        tags = {}
+        for tag, (nodes, inclusive, exclusive, text_bytes) in sorted(
+                self.tags.items(), key=lambda kv: kv[1][2], reverse=True):
+            tags[tag] = {
+                'nodes': nodes,
+                'inclusive_seconds': round(inclusive, 6),
+                'exclusive_seconds': round(exclusive, 6),
+                'text_bytes': text_bytes,
+            }
+        return {'tags': tags, 'unknown': dict(sorted(self.unknown.items()))}
+    
+    def write_json(self, path: Path):
+        """Export the counters as JSON."""
+        Path(path).write_text(json.dumps(self.to_dict(), indent=2) + '\n', encoding='utf-8')
+    
+    def summary(self, limit: int = 20) -> str:
+        """Human-readable table of the tags with the most exclusive time."""
+        data = self.to_dict()
+        lines = [f"  {'tag':<12} {'nodes':>8} {'incl. ms':>10} {'excl. ms':>10} {'text KB':>9}"]
+        for tag, row in list(data['tags'].items())[:limit]:
+            lines.append(f"  {tag:<12} {row['nodes']:>8} "
+                         f"{row['inclusive_seconds'] * 1000:>10.1f} "
+                         f"{row['exclusive_seconds'] * 1000:>10.1f} "
+                         f"{row['text_bytes'] / 1024:>9.1f}")
+        if data['unknown']:
+            unknown = ', '.join(f"{tag} ({count})" for tag, count in data['unknown'].items())
+            lines.append(f"  Unhandled tags: {unknown}")
+        return '\n'.join(lines)
 
 
-def compile_latex(tex_file: str, compiler: str = 'pdflatex', max_passes: int = 2) -> bool:
+class SourceMap:
     """
-    Compile LaTeX file to PDF with error-robust compilation.
+    Line ranges of the generated .tex files, mapped back to the EPUB item
+    and the element that produced them.
     
-    Args:
-        tex_file: Path to the .tex file
-        compiler: LaTeX compiler to use (pdflatex, xelatex, lualatex)
-        max_passes: Maximum number of compilation passes (for TOC, refs, etc.)
-        
-    Returns:
-        True if compilation successful, False otherwise
+    Each file gets a list of [first line, last line, item index, element path]
+    entries in line order (1-based, inclusive), where the element path is an
+    XPath-like location such as 'body/div[2]/p[3]'. A block's range includes
+    the blank lines that follow it, so the ranges of one item are contiguous.
     """
-    tex_path = Path(tex_file)
-    if not tex_path.exists():
-        print(f"✗ Error: LaTeX file not found: {tex_file}")
-        return False
     
-    # Check if compiler is available
-    try:
-        subprocess.run([compiler, '--version'], 
-                      stdout=subprocess.DEVNULL, 
-                      stderr=subprocess.DEVNULL,
-                      check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print(f"✗ Error: LaTeX compiler '{compiler}' not found")
-        print(f"  Please install TeX Live or MiKTeX")
-        return False
+    VERSION = 1
     
-    # Compilation options for error robustness
-    compile_options = [
-        compiler,
-        '-interaction=nonstopmode',  # Don't stop on errors
-        '-halt-on-error',            # But halt on critical errors
-        '-file-line-error',          # Better error messages
-        tex_path.name
-    ]
+    def __init__(self):
+        self.items: List[str] = []
+        self.files: Dict[str, List[list]] = {}
+        self._item_index: Dict[str, int] = {}
     
-    original_dir = os.getcwd()
-    success = True
+    def _item(self, name: str) -> int:
+        index = self._item_index.get(name)
+        if index is None:
+            index = self._item_index[name] = len(self.items)
+            self.items.append(name)
+        return index
     
-    try:
-        # Change to the directory containing the .tex file
-        os.chdir(tex_path.parent)
+    def add_item(self, tex_file: str, item: str, base_line: int, spans: List[Tuple[int, int, str]]):
+        """
+        Record the blocks of one item.
         
-        print(f"\nCompiling LaTeX with {compiler}...")
+        Args:
+            tex_file: .tex file the item was written to, relative to the main file
+            item: EPUB item name
+            base_line: Number of lines in tex_file before the item's text
+            spans: (first, last, element path) with 0-based lines relative to the item
+        """
+        index = self._item(item)
+        entries = self.files.setdefault(tex_file, [])
+        for first, last, path in spans:
+            entries.append([base_line + first + 1, base_line + last + 1, index, path])
+    
+    def copy_file(self, other: 'SourceMap', tex_file: str):
+        """Take over the entries of tex_file from another map (a reused chapter)."""
+        entries = other.files.get(tex_file)
+        if entries is None:
+            return
+        self.files[tex_file] = [[first, last, self._item(other.items[index]), path]
+                                for first, last, index, path in entries]
+    
+    def lookup(self, tex_file: str, line: int) -> Optional[Dict]:
+        """
+        Find the element that produced a line.
         
-        # Multiple passes for TOC, references, etc.
-        for pass_num in range(1, max_passes + 1):
-            print(f"  Pass {pass_num}/{max_passes}...")
-            
-            try:
-                result = subprocess.run(
-                    compile_options,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=120,  # 2 minute timeout per pass
-                    text=True
-                )
-                
-                # Check for compilation errors in output
-                if result.returncode != 0:
-                    # Try to extract error message
-                    error_lines = []
-                    for line in result.stdout.split('\n'):
-                        if '!' in line or 'Error' in line or 'error' in line:
-                            error_lines.append(line)
-                    
-                    if error_lines:
-                        print(f"⚠ Warning: Compilation errors on pass {pass_num}:")
-                        for line in error_lines[:5]:  # Show first 5 errors
-                            print(f"    {line}")
-                    
-                    # Continue to next pass anyway for robustness
-                    # The PDF might still be generated with some warnings
-                
-            except subprocess.TimeoutExpired:
-                print(f"⚠ Warning: Compilation timeout on pass {pass_num}")
-                success = False
-                break
-            except Exception as e:
-                print(f"⚠ Warning: Compilation error on pass {pass_num}: {str(e)}")
-                success = False
-                break
+        Args:
+            tex_file: .tex file as named in the map or in a TeX log (e.g. './chapters/001.tex')
+            line: 1-based line number
         
-        # Check if PDF was generated
-        pdf_path = tex_path.with_suffix('.pdf')
-        if pdf_path.exists():
-            print(f"✓ PDF generated successfully: {pdf_path}")
-            return True
-        else:
-            print(f"✗ Error: PDF not generated (compilation may have failed)")
-            return False
-            
+        Returns:
+            Dict with 'item', 'path' and 'lines', or None if the line was not
+            produced by an item (e.g. the preamble)
+        """
+        name = Path(tex_file).as_posix()
+        while name.startswith('./'):
+            name = name[2:]
+        entries = self.files.get(name)
+        if not entries:
+            return None
+        position = bisect.bisect_right([entry[0] for entry in entries], line) - 1
+        if position < 0:
+            return None
+        first, last, index, path = entries[position]
+        if line > last:
+            return None
+        return {'item': self.items[index], 'path': path, 'lines': [first, last]}
+    
+    def to_dict(self) -> Dict:
+        return {'version': self.VERSION, 'items': self.items, 'files': self.files}
+    
+    def write_json(self, path: Path):
+        """Export the map as compact JSON."""
+        Path(path).write_text(json.dumps(self.to_dict(), separators=(',', ':')) + '\n',
+                              encoding='utf-8')
+    
+    @classmethod
+    def load(cls, path) -> Optional['SourceMap']:
+        """Read a map written by write_json(); None if missing, unreadable or outdated."""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('version') != cls.VERSION:
+            return None
+        source_map = cls()
+        for name in data.get('items', []):
+            source_map._item(name)
+        source_map.files = data.get('files', {})
+        return source_map
+
+
+# Features of the generated LaTeX that need a package, with what reveals
+# their use; see EPUBToLaTeXConverter(minimal_preamble=True)
+PREAMBLE_FEATURES = {
+    'math': re.compile(r'\\text\{|(?<!\\)\$|\\begin\{(?:equation|align|gather|multline)'),
+    'graphics': re.compile(r'\\includegraphics'),
+    'color': re.compile(r'\\(?:textcolor|color|colorbox|fcolorbox|pagecolor|rowcolor|cellcolor|columncolor'
+                        r'|sethlcolor|definecolor)\b|\\hl\{|\\begin\{(?:mdframed|shadedquotation)\}'),
+    'highlight': re.compile(r'\\(?:hl|sethlcolor|so|st|ul|caps)\{'),
+    'framed': re.compile(r'\\begin\{(?:mdframed|shadedquotation)\}'),
+    'links': re.compile(r'\\(?:href|url|hyperref|hyperlink|hypertarget)\b'),
+    'booktabs': re.compile(r'\\(?:toprule|midrule|bottomrule|cmidrule)\b'),
+    'tabularx': re.compile(r'\\begin\{tabularx\}'),
+    'longtable': re.compile(r'\\begin\{longtable\}'),
+    'array': re.compile(r'\\newcolumntype\b|[<>]\{'),
+    'rowcolor': re.compile(r'\\(?:rowcolor|cellcolor|columncolor)\b'),
+    'lists': re.compile(r'\\begin\{(?:itemize|enumerate|description)\}\[|\\setlist\b'),
+    'strikeout': re.compile(r'\\(?:sout|uline|uuline|uwave|xout|dashuline|dotuline)\b'),
+    'verbatim': re.compile(r'\\begin\{(?:Verbatim|BVerbatim|LVerbatim)\}|\\(?:Verb|fvset|VerbatimInput)\b'),
+}
+
+
+# Threads writing image files in the background during text conversion
+IMAGE_WRITE_THREADS = 4
+
+
+# Bump when the IR layout, or what is kept from the HTML, changes
+IR_VERSION = 1
+
+# The only attributes the renderer reads, besides class
+IR_ATTRIBUTES = ('src', 'alt', 'href')
+
+
+class IRString(str):
+    """
+    Text that is rendered like any other text node but left out of
+    get_text(): comments, script and style contents, and the like.
+    """
+
+    __slots__ = ()
+
+
+class IRElement:
+    """
+    Element of the compact intermediate representation (IR) of a document.
+
+    An IR tree keeps only what the LaTeX renderer uses: tag names, resolved
+    classes, a few attributes, and text. Text nodes are plain str (IRString
+    for the ones bs4 leaves out of get_text()). The renderer works on IR
+    trees and bs4 trees alike, so IRElement provides the part of the bs4 Tag
+    interface it uses.
+    """
+
+    __slots__ = ('name', 'classes', 'attrs', 'children')
+
+    def __init__(self, name: str, classes: Optional[tuple] = None, attrs: Optional[Dict[str, str]] = None,
+                 children: Optional[list] = None):
+        self.name = name
+        self.classes = classes
+        self.attrs = attrs
+        self.children = children if children is not None else []
+
+    def get(self, key: str, default=None):
+        if key == 'class':
+            return list(self.classes) if self.classes is not None else default
+        if self.attrs is None:
+            return default
+        return self.attrs.get(key, default)
+
+    def _matches(self, name) -> bool:
+        return self.name == name if isinstance(name, str) else self.name in name
+
+    def _descendants(self) -> Iterator:
+        for child in self.children:
+            yield child
+            if isinstance(child, IRElement):
+                yield from child._descendants()
+
+    def find_all(self, name, recursive: bool = True) -> List['IRElement']:
+        nodes = self._descendants() if recursive else self.children
+        return [node for node in nodes if isinstance(node, IRElement) and node._matches(name)]
+
+    def find(self, name, recursive: bool = True) -> Optional['IRElement']:
+        nodes = self._descendants() if recursive else self.children
+        for node in nodes:
+            if isinstance(node, IRElement) and node._matches(name):
+                return node
+        return None
+
+    def get_text(self) -> str:
+        return ''.join(node for node in self._descendants()
+                       if isinstance(node, str) and not isinstance(node, IRString))
+
+    @classmethod
+    def from_tag(cls, tag: Tag) -> 'IRElement':
+        """Build the IR of a bs4 tree."""
+        children = []
+        for child in tag.children:
+            if isinstance(child, Tag):
+                children.append(cls.from_tag(child))
+            elif isinstance(child, NavigableString):
+                # Same split as bs4's get_text(): only NavigableString and CData are content
+                if type(child) in (NavigableString, CData):
+                    children.append(str(child))
+                else:
+                    children.append(IRString(child))
+        classes = tag.get('class')
+        attrs = {key: tag.attrs[key] for key in IR_ATTRIBUTES if key in tag.attrs} or None
+        return cls(tag.name, tuple(classes) if classes is not None else None, attrs, children)
+
+    def to_tuple(self) -> tuple:
+        """Nested tuples for marshal: (name, classes, attrs, children), IRString as (text,)."""
+        children = tuple(child.to_tuple() if isinstance(child, IRElement)
+                         else (str(child),) if isinstance(child, IRString) else child
+                         for child in self.children)
+        attrs = tuple(self.attrs.items()) if self.attrs else None
+        return (self.name, self.classes, attrs, children)
+
+    @classmethod
+    def from_tuple(cls, data: tuple) -> 'IRElement':
+        """Inverse of to_tuple()."""
+        name, classes, attrs, children = data
+        nodes = []
+        for child in children:
+            if isinstance(child, str):
+                nodes.append(child)
+            elif len(child) == 1:
+                nodes.append(IRString(child[0]))
+            else:
+                nodes.append(cls.from_tuple(child))
+        return cls(name, classes, dict(attrs) if attrs else None, nodes)
+
+
+# Element node types the renderer accepts
+_ELEMENT_TYPES = (Tag, IRElement)
+
+
+# Converter of a chapter worker process, see _init_chapter_worker()
+_chapter_converter = None
+
+
+def _init_chapter_worker(converter_class, options: Dict, attributes: Dict):
+    """Process pool initializer: set up a converter like the parent's."""
+    global _chapter_converter
+    # The parent reports failures; workers stay silent
+    events.set_sinks([])
+    _chapter_converter = converter_class('', os.devnull, **options)
+    for name, value in attributes.items():
+        setattr(_chapter_converter, name, value)
+
+
+def _convert_chapter(content: bytes) -> Tuple[Optional[str], list, Optional[str], int, int]:
+    """
+    Convert one document item in a chapter worker.
+    
+    Returns:
+        Tuple of (LaTeX or None, source map spans, error message or None,
+        IR cache hits, IR cache misses)
+    """
+    converter = _chapter_converter
+    hits, misses = converter.ir_cache_hits, converter.ir_cache_misses
+    try:
+        latex_text = converter._convert_html_to_latex(content.decode('utf-8', errors='ignore'))
+        error = None
     except Exception as e:
-        print(f"✗ Error during compilation: {str(e)}")
-        return False
-    finally:
-        os.chdir(original_dir)
+        latex_text, error = None, str(e)
+    return (latex_text, converter._item_spans, error,
+            converter.ir_cache_hits - hits, converter.ir_cache_misses - misses)
 
 
 class EPUBToLaTeXConverter:
@@ -223,21 +2976,98 @@ class EPUBToLaTeXConverter:
     Ultra-robust EPUB to LaTeX converter with style preservation.
     """
     
-    def __init__(self, epub_path: str, output_path: Optional[str] = None):
+    # Bump when the layout of the incremental-update state file changes
+    STATE_VERSION = 1
+    
+    def __init__(self, epub_path: str, output_path: Optional[str] = None,
+                 split: bool = False, include_only: Optional[List[str]] = None,
+                 update: bool = False, low_memory: bool = False,
+                 tag_stats: bool = False, profile_dir: Optional[str] = None,
+                 profile_threshold: float = 0.0, source_map: bool = False,
+                 longtable_threshold: int = 100, ir_cache: Optional[str] = None,
+                 chapter_jobs: int = 1, minimal_preamble: bool = False):
         """
         Initialize the converter.
         
         Args:
             epub_path: Path to the input EPUB file
             output_path: Path to the output LaTeX file (optional)
+            split: Write each document item to its own file under 'chapters/'
+                   and pull them into the main file with \\include
+            include_only: Chapter names (e.g. '003') to pass to \\includeonly
+                          in split mode, so only those chapters are typeset
+            update: Only regenerate chapters whose source changed since the
+                    previous run (implies split); untouched files keep their mtime
+            low_memory: Release each item's parse tree and raw content as soon
+                        as it is converted, and report peak traced memory
+            tag_stats: Collect per-tag counters and timings in self.tag_stats,
+                       print a summary and export them next to the output
+            profile_dir: Run the conversion under cProfile and write
+                         <book>-<hash>.pstats and .folded files there
+            profile_threshold: Only keep profiles of conversions that took
+                               at least this many seconds
+            source_map: Write <output>.srcmap.json mapping the line ranges of
+                        the generated LaTeX to the EPUB items and elements
+            longtable_threshold: Tables with more rows than this are written
+                                 as a page-breaking longtable
+            ir_cache: Directory caching the parsed IR of each document item,
+                      keyed by content, shared between books and runs
+            chapter_jobs: Convert the document items of this book in that many
+                          worker processes (not combined with tag_stats)
+            minimal_preamble: Only load the packages needed by the features the
+                              book actually uses, instead of the full preamble
         """
         self.epub_path = epub_path
         self.output_path = output_path or self._default_output_path()
         self.book = None
         self.images = {}
         self.image_counter = 0
+        # Background image writes, see _extract_images()
+        self._image_pool = None
+        self._image_writes = []
         self.output_dir = Path(self.output_path).parent
         self.images_dir = self.output_dir / "images"
+        self.split = split or update
+        self.include_only = include_only
+        self.update = update
+        self.chapters_dir = self.output_dir / "chapters"
+        self.chapter_digits = 3
+        self.state_path = Path(self.output_path).with_suffix('.epub2tex.json')
+        self.previous_state = {}
+        self.chapters_reused = 0
+        self.chapters_written = 0
+        self.low_memory = low_memory
+        self.peak_memory = None
+        self.error = None
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.tag_stats = None
+        self.tag_stats_path = Path(self.output_path).with_suffix('.tagstats.json')
+        self.profile_dir = profile_dir
+        self.profile_threshold = profile_threshold
+        self.longtable_threshold = longtable_threshold
+        self.ir_cache = ir_cache
+        # Per-tag counters live in this process, so they need serial conversion
+        self.chapter_jobs = 1 if tag_stats else max(1, chapter_jobs)
+        self.ir_cache_hits = 0
+        self.ir_cache_misses = 0
+        self.minimal_preamble = minimal_preamble
+        # PREAMBLE_FEATURES found in the generated LaTeX (minimal preamble only)
+        self.features = set()
+        # Class list -> formatting plan, see _class_plan()
+        self._class_plans = {}
+        # Number of table cells being converted around the current element
+        self._table_depth = 0
+        self.source_map = SourceMap() if source_map else None
+        self.source_map_path = Path(self.output_path).with_suffix('.srcmap.json')
+        # (first, last, element path) of the blocks of the item converted last
+        self._item_spans = []
+        if tag_stats:
+            # Shadow the hot-path methods on this instance only, so the
+            # uninstrumented path pays nothing
+            self.tag_stats = TagStats()
+            self._convert_element = self._timed_convert_element
+            self._escape_latex = self._counted_escape_latex
         
         # LaTeX special characters mapping
         self.latex_special_chars = {
@@ -332,7 +3162,7 @@ class EPUBToLaTeXConverter:
         Returns:
             List of class names
         """
-        if not isinstance(element, Tag):
+        if not isinstance(element, _ELEMENT_TYPES):
             return []
         
         classes = element.get('class', [])
@@ -340,6 +3170,48 @@ class EPUBToLaTeXConverter:
             classes = classes.split()
         return classes
     
+    def _class_plan(self, classes) -> Tuple[str, str, Optional[Tuple[str, str]], str, bool]:
+        """
+        Compile a list of CSS classes into a formatting plan, once per
+        distinct class list per conversion.
+        
+        Args:
+            classes: List of CSS class names
+            
+        Returns:
+            Tuple of (inline prefix, inline suffix, (begin, end) of the first
+            block_class_mapping environment or None, table row prefix,
+            whether the 'epigraph' class is present)
+        """
+        key = tuple(classes)
+        plan = self._class_plans.get(key)
+        if plan is not None:
+            return plan
+        
+        # Each recognized class wraps the result of the previous ones
+        prefix = suffix = ''
+        block = None
+        for class_name in classes:
+            if class_name in self.class_mapping:
+                class_prefix, class_suffix = self.class_mapping[class_name]
+                prefix = class_prefix + prefix
+                suffix = suffix + class_suffix
+            if block is None and class_name in self.block_class_mapping:
+                env_name, env_options = self.block_class_mapping[class_name]
+                block = (f"\\begin{{{env_name}}}{env_options or ''}\n", f"\\end{{{env_name}}}\n\n")
+        row_prefix = "\\rowcolor{highlightyellow} " if 'highlight-row' in classes else ''
+        plan = self._class_plans[key] = (prefix, suffix, block, row_prefix, 'epigraph' in classes)
+        return plan
+    
+    def _element_plan(self, element: Tag) -> Optional[Tuple[str, str, Optional[Tuple[str, str]], str, bool]]:
+        """_class_plan() of an element's classes, or None if it has none."""
+        classes = element.get('class')
+        if not classes:
+            return None
+        if isinstance(classes, str):
+            classes = classes.split()
+        return self._class_plan(classes)
+    
     def _apply_class_formatting(self, content: str, classes: List[str], inline: bool = True) -> str:
         """
         Apply LaTeX formatting based on CSS classes.
@@ -352,20 +3224,12 @@ class EPUBToLaTeXConverter:
         Returns:
             Formatted content with class-based LaTeX commands
         """
-        if not classes:
+        # Block-level formatting is handled differently
+        if not classes or not inline:
             return content
         
-        mapping = self.class_mapping if inline else self.block_class_mapping
-        
-        # Apply formatting for each recognized class
-        for class_name in classes:
-            if class_name in mapping:
-                if inline:
-                    prefix, suffix = mapping[class_name]
-                    content = f"{prefix}{content}{suffix}"
-                # Block-level formatting is handled differently
-        
-        return content
+        prefix, suffix, _, _, _ = self._class_plan(classes)
+        return f"{prefix}{content}{suffix}"
     
     def _escape_latex(self, text: str) -> str:
         """
@@ -381,25 +3245,60 @@ class EPUBToLaTeXConverter:
             text = text.replace(char, replacement)
         return text
     
+    def _counted_escape_latex(self, text: str) -> str:
+        """_escape_latex() that records the escaped bytes (tag_stats mode)."""
+        self.tag_stats.add_text(len(text.encode('utf-8')))
+        return EPUBToLaTeXConverter._escape_latex(self, text)
+    
     def _extract_images(self):
-        """Extract and save images from EPUB file."""
+        """
+        Map the EPUB images to file names and start writing them.
+        
+        The text conversion only needs the mapping, so it is computed here
+        from the manifest while a background thread pool writes the files;
+        _finish_images() waits for them.
+        """
         if not self.images_dir.exists():
             self.images_dir.mkdir(parents=True, exist_ok=True)
         
+        self._image_pool = ThreadPoolExecutor(max_workers=IMAGE_WRITE_THREADS)
         for item in self.book.get_items_of_type(ebooklib.ITEM_IMAGE):
             img_name = item.get_name()
             # Create a clean filename
             img_filename = f"image_{self.image_counter}_{Path(img_name).name}"
             self.image_counter += 1
             
-            # Save image
             img_path = self.images_dir / img_filename
-            with open(img_path, 'wb') as f:
-                f.write(item.get_content())
+            self._image_writes.append(self._image_pool.submit(self._write_image, img_path, item))
             
             # Store mapping
             self.images[img_name] = img_filename
     
+    def _write_image(self, path: Path, item) -> int:
+        """Write one image from the image pool; return the number of bytes written."""
+        # Left untouched when identical, to keep its mtime
+        data = item.get_content()
+        written = len(data) if _write_if_changed(path, data) else 0
+        self._release_item(item)
+        return written
+    
+    def _finish_images(self):
+        """Wait for the image writes started by _extract_images() and count their bytes."""
+        if self._image_pool is None:
+            return
+        errors = []
+        for future in self._image_writes:
+            try:
+                self.bytes_written += future.result()
+            except Exception as e:
+                errors.append(e)
+        self._image_pool.shutdown()
+        self._image_pool = None
+        self._image_writes = []
+        if errors:
+            events.warning('images', f"Error extracting images: {str(errors[0])}",
+                           failed=len(errors))
+    
     def _convert_heading(self, tag: Tag) -> str:
         """
         Convert HTML heading tags to LaTeX sections with class support.
@@ -425,10 +3324,10 @@ class EPUBToLaTeXConverter:
         content = ''.join(self._convert_element(child, inline=True, in_heading=True) for child in tag.children)
         
         # Apply class-based formatting if present (inline formatting for heading content)
-        classes = self._get_element_classes(tag)
-        if classes:
+        plan = self._element_plan(tag)
+        if plan:
             # For headings, we only apply inline formatting to the content
-            content = self._apply_class_formatting(content, classes, inline=True)
+            content = f"{plan[0]}{content}{plan[1]}"
         
         # \paragraph and \subparagraph are run-in headings that should not have blank lines after them
         # to avoid "Paragraph ended before \ttl@straight@i was complete" error with titlesec
@@ -453,8 +3352,9 @@ class EPUBToLaTeXConverter:
             return ""
         
         # Apply class-based formatting if present
-        classes = self._get_element_classes(tag)
-        content = self._apply_class_formatting(content, classes, inline=True)
+        plan = self._element_plan(tag)
+        if plan:
+            content = f"{plan[0]}{content}{plan[1]}"
         
         return f"{content}\n\n"
     
@@ -469,43 +3369,99 @@ class EPUBToLaTeXConverter:
         Returns:
             LaTeX list environment
         """
+        parts = []
+        self._emit_list(tag, parts, '')
+        return ''.join(parts)
+    
+    def _emit_list(self, tag: Tag, out: List[str], indent: str):
+        """
+        Append the LaTeX of a list to out, nested lists included.
+        
+        Nested lists are indented by four spaces per level, with their empty
+        lines dropped. Every fragment ends with a newline, so indenting each
+        fragment as it is emitted is the same as indenting the finished list,
+        without re-splitting the output of every nested list at every level.
+        
+        Args:
+            tag: BeautifulSoup ul/ol tag
+            out: List of output fragments
+            indent: Indentation of this list ('' at the top level)
+        """
+        if indent:
+            def emit(text: str):
+                out.extend(f"{indent}{line}\n" for line in text.split('\n') if line)
+        else:
+            emit = out.append
+        
         list_type = 'enumerate' if tag.name == 'ol' else 'itemize'
-        result = f"\\begin{{{list_type}}}\n"
+        emit(f"\\begin{{{list_type}}}\n")
         
         for item in tag.find_all('li', recursive=False):
             # Check if this item contains a nested list
             nested_lists = item.find_all(['ul', 'ol'], recursive=False)
             
-            # Get item content excluding nested lists
-            item_content = ""
-            for child in item.children:
-                if isinstance(child, Tag) and child.name in ['ul', 'ol']:
-                    # Skip nested lists in main content - we'll add them after
-                    continue
-                else:
-                    item_content += self._convert_element(child, inline=True)
+            # Get item content excluding nested lists (they are added after it)
+            item_content = ''.join(self._convert_element(child, inline=True) for child in item.children
+                                   if not (isinstance(child, _ELEMENT_TYPES) and child.name in ['ul', 'ol']))
             
             # Apply class-based formatting to list item
-            classes = self._get_element_classes(item)
-            item_content = self._apply_class_formatting(item_content.strip(), classes, inline=True)
+            item_content = item_content.strip()
+            plan = self._element_plan(item)
+            if plan:
+                item_content = f"{plan[0]}{item_content}{plan[1]}"
             
-            result += f"    \\item {item_content}\n"
+            emit(f"    \\item {item_content}\n")
             
             # Add nested lists
             for nested in nested_lists:
-                nested_content = self._convert_list(nested)
-                # Indent nested list
-                nested_lines = nested_content.split('\n')
-                result += '\n'.join('    ' + line for line in nested_lines if line)
-                result += '\n'
+                self._emit_list(nested, out, indent + '    ')
         
-        result += f"\\end{{{list_type}}}\n\n"
-        return result
+        emit(f"\\end{{{list_type}}}\n\n")
+    
+    def _table_rows(self, tag: Tag) -> List[Tag]:
+        """
+        Rows of a table itself: its own <tr> children and those of its
+        thead/tbody/tfoot sections, but not the rows of nested tables.
+        """
+        rows = []
+        for child in tag.children:
+            if not isinstance(child, _ELEMENT_TYPES):
+                continue
+            name = child.name.lower()
+            if name == 'tr':
+                rows.append(child)
+            elif name in ('thead', 'tbody', 'tfoot'):
+                rows.extend(row for row in child.find_all('tr', recursive=False))
+        return rows
+    
+    def _convert_table_row(self, row: Tag) -> str:
+        """Convert one table row to 'cell & cell \\\\' followed by a rule."""
+        # Handle special row highlighting (e.g., highlight-row class)
+        plan = self._element_plan(row)
+        row_prefix = plan[3] if plan else ""
+        
+        cell_contents = []
+        self._table_depth += 1
+        try:
+            for cell in row.find_all(['td', 'th'], recursive=False):
+                # Process children of each cell
+                content = ''.join(self._convert_element(child, inline=True) for child in cell.children).strip()
+                cell_contents.append(content)
+        finally:
+            self._table_depth -= 1
+        
+        return row_prefix + " & ".join(cell_contents) + " \\\\\n\\hline\n"
     
     def _convert_table(self, tag: Tag) -> str:
         """
         Convert HTML table to LaTeX tabular with class support.
         
+        Tables with more than longtable_threshold rows become a longtable,
+        which breaks across pages and repeats the header rows (those in
+        <thead>, or leading rows made only of <th> cells) on every page.
+        A table nested in a cell of another one becomes a bare tabular: a
+        float or a longtable cannot appear inside a cell.
+        
         Args:
             tag: BeautifulSoup tag object
             
@@ -513,58 +3469,82 @@ class EPUBToLaTeXConverter:
             LaTeX table environment
         """
         # Find caption
-        caption_tag = tag.find('caption')
+        caption_tag = tag.find('caption', recursive=False)
         caption_text = ""
         if caption_tag:
             caption_text = ''.join(self._convert_element(c, inline=True) for c in caption_tag.children)
         
-        # Find all rows (excluding caption)
-        rows = tag.find_all('tr')
+        # Find the table's own rows (excluding caption and nested tables)
+        rows = self._table_rows(tag)
         if not rows:
             return ""
         
         # Determine number of columns
         first_row = rows[0]
-        cols = len(first_row.find_all(['td', 'th']))
+        cols = len(first_row.find_all(['td', 'th'], recursive=False))
         
         if cols == 0:
             return ""
         
-        # Create table
         col_format = '|' + 'l|' * cols
-        result = "\\begin{table}[h]\n\\centering\n"
+        if self._table_depth:
+            # Caption dropped: \caption only works in a float
+            return (f"\\begin{{tabular}}{{{col_format}}}\n\\hline\n"
+                    + ''.join(self._convert_table_row(row) for row in rows)
+                    + "\\end{tabular}")
+        if len(rows) > self.longtable_threshold:
+            head_rows = [row for section in tag.find_all('thead', recursive=False)
+                         for row in section.find_all('tr', recursive=False)]
+            return self._convert_longtable(rows, head_rows, col_format, caption_text)
+        
+        # Create table
+        parts = ["\\begin{table}[h]\n\\centering\n"]
         
         # Add caption if present
         if caption_text:
-            result += f"\\caption{{{caption_text}}}\n"
+            parts.append(f"\\caption{{{caption_text}}}\n")
         
-        result += f"\\begin{{tabular}}{{{col_format}}}\n"
-        result += "\\hline\n"
+        parts.append(f"\\begin{{tabular}}{{{col_format}}}\n")
+        parts.append("\\hline\n")
+        parts.extend(self._convert_table_row(row) for row in rows)
+        parts.append("\\end{tabular}\n\\end{table}\n\n")
+        return ''.join(parts)
+    
+    def _convert_longtable(self, rows: List[Tag], head_rows: List[Tag], col_format: str,
+                           caption_text: str) -> str:
+        """
+        Convert the rows of a large table to a page-breaking longtable.
         
-        for i, row in enumerate(rows):
-            # Check for row classes
-            row_classes = self._get_element_classes(row)
-            
-            # Handle special row highlighting (e.g., highlight-row class)
-            row_prefix = ""
-            if row_classes and 'highlight-row' in row_classes:
-                row_prefix = "\\rowcolor{highlightyellow} "
-            
-            cells = row.find_all(['td', 'th'])
-            cell_contents = []
-            for cell in cells:
-                # Process children of each cell
-                content = ''.join(self._convert_element(child, inline=True) for child in cell.children).strip()
-                cell_contents.append(content)
-            
-            # Build row content
-            row_content = " & ".join(cell_contents)
+        Args:
+            rows: The table's own rows
+            head_rows: Those of its rows that are in a <thead>
+            col_format: Column specification
+            caption_text: Converted caption, or ''
             
-            result += row_prefix + row_content + " \\\\\n"
-            result += "\\hline\n"
+        Returns:
+            LaTeX longtable environment
+        """
+        header_count = 0
+        for row in rows:
+            in_thead = any(row is head_row for head_row in head_rows)
+            cells = row.find_all(['td', 'th'], recursive=False)
+            if not (in_thead or (cells and all(cell.name.lower() == 'th' for cell in cells))):
+                break
+            header_count += 1
         
-        result += "\\end{tabular}\n\\end{table}\n\n"
-        return result
+        parts = [f"\\begin{{longtable}}{{{col_format}}}\n"]
+        if caption_text:
+            parts.append(f"\\caption{{{caption_text}}}\\\\\n")
+        parts.append("\\hline\n")
+        if header_count:
+            header = ''.join(self._convert_table_row(row) for row in rows[:header_count])
+            parts.append(header)
+            parts.append("\\endfirsthead\n\\hline\n")
+            parts.append(header)
+            parts.append("\\endhead\n")
+        parts.extend(self._convert_table_row(row) for row in rows[header_count:])
+        parts.append("\\end{longtable}\n\n")
+        return ''.join(parts)
     
     def _convert_image(self, tag: Tag) -> str:
         """
@@ -640,17 +3620,15 @@ class EPUBToLaTeXConverter:
         content = ''.join(self._convert_element(child, inline=False) for child in tag.children)
         
         # Check for classes
-        classes = self._get_element_classes(tag)
+        plan = self._element_plan(tag)
         
         # If it has special block classes, apply them
-        for class_name in classes:
-            if class_name in self.block_class_mapping:
-                env_name, env_options = self.block_class_mapping[class_name]
-                options_str = env_options if env_options else ''
-                return f"\\begin{{{env_name}}}{options_str}\n{content}\\end{{{env_name}}}\n\n"
+        if plan and plan[2]:
+            begin, end = plan[2]
+            return f"{begin}{content}{end}"
         
         # Check for inline classes like 'epigraph'
-        if classes and 'epigraph' in classes:
+        if plan and plan[4]:
             # Apply italic formatting for epigraph
             content_lines = content.strip().split('\n')
             formatted_content = '\n'.join(f"{{\\itshape {line}}}" if line.strip() else line 
@@ -669,22 +3647,22 @@ class EPUBToLaTeXConverter:
         Returns:
             LaTeX description environment
         """
-        result = "\\begin{description}\n"
+        parts = ["\\begin{description}\n"]
         
         current_term = None
         for child in tag.children:
-            if isinstance(child, Tag):
+            if isinstance(child, _ELEMENT_TYPES):
                 if child.name == 'dt':
                     # Definition term
                     current_term = ''.join(self._convert_element(c, inline=True) for c in child.children).strip()
                 elif child.name == 'dd' and current_term:
                     # Definition description
                     content = ''.join(self._convert_element(c, inline=True) for c in child.children).strip()
-                    result += f"    \\item[{current_term}] {content}\n"
+                    parts.append(f"    \\item[{current_term}] {content}\n")
                     current_term = None
         
-        result += "\\end{description}\n\n"
-        return result
+        parts.append("\\end{description}\n\n")
+        return ''.join(parts)
     
     def _convert_figure(self, tag: Tag) -> str:
         """
@@ -763,7 +3741,7 @@ class EPUBToLaTeXConverter:
             Converted LaTeX content
         """
         # Get classes
-        classes = self._get_element_classes(tag)
+        plan = self._element_plan(tag)
         
         # Process children
         content = ''.join(self._convert_element(child, inline=inline, in_heading=in_heading) for child in tag.children)
@@ -772,16 +3750,14 @@ class EPUBToLaTeXConverter:
             return content
         
         # Apply class-based formatting
-        if classes and not inline:
+        if plan and not inline:
             # Check for block-level class mappings
-            for class_name in classes:
-                if class_name in self.block_class_mapping:
-                    env_name, env_options = self.block_class_mapping[class_name]
-                    options_str = env_options if env_options else ''
-                    return f"\\begin{{{env_name}}}{options_str}\n{content}\\end{{{env_name}}}\n\n"
-        elif classes and inline:
+            if plan[2]:
+                begin, end = plan[2]
+                return f"{begin}{content}{end}"
+        elif plan and inline:
             # Apply inline formatting
-            content = self._apply_class_formatting(content, classes, inline=True)
+            content = f"{plan[0]}{content}{plan[1]}"
         
         return content
     
@@ -790,7 +3766,7 @@ class EPUBToLaTeXConverter:
         Recursively convert HTML element to LaTeX.
         
         Args:
-            element: BeautifulSoup element (Tag or NavigableString)
+            element: BeautifulSoup element (Tag or NavigableString) or IR node
             inline: Whether to process as inline content
             in_heading: Whether we're inside a heading (section title) - if True, avoid line breaks
             
@@ -798,7 +3774,7 @@ class EPUBToLaTeXConverter:
             Converted LaTeX string
         """
         # Handle text nodes
-        if isinstance(element, NavigableString):
+        if isinstance(element, str):
             text = str(element)
             # Clean up whitespace
             if inline:
@@ -806,7 +3782,7 @@ class EPUBToLaTeXConverter:
             return self._escape_latex(text)
         
         # Handle tag elements
-        if not isinstance(element, Tag):
+        if not isinstance(element, _ELEMENT_TYPES):
             return ""
         
         tag_name = element.name.lower()
@@ -914,21 +3890,94 @@ class EPUBToLaTeXConverter:
         
         # Default: process children
         else:
-            result = ""
-            for child in element.children:
-                result += self._convert_element(child, inline=inline, in_heading=in_heading)
-            return result
+            if self.tag_stats is not None:
+                self.tag_stats.add_unknown(tag_name)
+            return ''.join(self._convert_element(child, inline=inline, in_heading=in_heading)
+                           for child in element.children)
     
-    def _convert_html_to_latex(self, html_content: str) -> str:
+    def _timed_convert_element(self, element, inline: bool = False, in_heading: bool = False) -> str:
+        """_convert_element() wrapped with per-tag counters (tag_stats mode)."""
+        stats = self.tag_stats
+        stats.enter(element.name.lower() if isinstance(element, _ELEMENT_TYPES) else '#text')
+        start = time.perf_counter()
+        try:
+            return EPUBToLaTeXConverter._convert_element(self, element, inline, in_heading)
+        finally:
+            stats.leave(time.perf_counter() - start)
+    
+    def _is_plain_container(self, element) -> bool:
+        """Whether a block element's LaTeX is just its children's, concatenated."""
+        if element.name.lower() not in ('div', 'section', 'article', 'main'):
+            return False
+        plan = self._element_plan(element)
+        return not (plan and plan[2])
+    
+    def _convert_mapped(self, element, path: str, line: int) -> str:
         """
-        Convert HTML content to LaTeX.
+        Convert the children of a block container, recording the line range
+        of each child block in self._item_spans (source_map mode).
+        
+        Plain containers are descended into; everything else is converted
+        with _convert_element() as usual, so the output is unchanged.
+        
+        Args:
+            element: Container whose children are converted
+            path: Element path of the container
+            line: 0-based line, relative to the item, the output starts on
+            
+        Returns:
+            Converted LaTeX string
+        """
+        parts = []
+        counters = {}
+        spans = self._item_spans
+        for child in element.children:
+            if not isinstance(child, _ELEMENT_TYPES):
+                text = self._convert_element(child, inline=False)
+                if not text.strip() and '\n' in text and spans and spans[-1][1] == line - 1:
+                    # Whitespace between blocks joins the block before it
+                    spans[-1] = (spans[-1][0], line + text.count('\n') - 1, spans[-1][2])
+            else:
+                name = child.name.lower()
+                counters[name] = counters.get(name, 0) + 1
+                child_path = f"{path}/{name}[{counters[name]}]" if path else f"{name}[{counters[name]}]"
+                if self._is_plain_container(child):
+                    text = self._convert_mapped(child, child_path, line)
+                else:
+                    text = self._convert_element(child, inline=False)
+                    if text.strip():
+                        first = line + text[:len(text) - len(text.lstrip())].count('\n')
+                        last = line + text.count('\n') - (1 if text.endswith('\n') else 0)
+                        spans.append((first, last, child_path))
+            parts.append(text)
+            line += text.count('\n')
+        return ''.join(parts)
+    
+    def _parse_html(self, html_content: str) -> IRElement:
+        """
+        Parse HTML content into the IR of its body.
+        
+        With ir_cache set, the IR is looked up in, and stored to, the cache
+        directory under a hash of the content, so re-rendering a book with
+        different settings does not parse any HTML.
         
         Args:
             html_content: HTML string
             
         Returns:
-            LaTeX string
+            IR of the body (of the whole document if it has no body)
         """
+        cache_path = None
+        if self.ir_cache is not None:
+            key = hashlib.sha256(f"{IR_VERSION}\0{html_content}".encode('utf-8'))
+            cache_path = Path(self.ir_cache) / f"{key.hexdigest()}.ir"
+            try:
+                ir = IRElement.from_tuple(marshal.loads(cache_path.read_bytes()))
+                self.ir_cache_hits += 1
+                return ir
+            except (OSError, ValueError, EOFError, TypeError):
+                self.ir_cache_misses += 1
+        
         # Suppress XML/HTML parser warning
         import warnings
         from bs4 import XMLParsedAsHTMLWarning
@@ -940,8 +3989,50 @@ class EPUBToLaTeXConverter:
         body = soup.find('body')
         if not body:
             body = soup
+        ir = IRElement.from_tag(body)
+        
+        if self.low_memory:
+            # bs4 trees are full of parent/sibling reference cycles; tearing the
+            # tree down explicitly frees it now instead of at the next GC cycle.
+            # The BeautifulSoup root has no next_element chain of its own, so
+            # its top-level children have to be decomposed one by one.
+            for child in list(soup.contents):
+                child.decompose()
+            soup.decompose()
+        
+        if cache_path is not None:
+            try:
+                data = marshal.dumps(ir.to_tuple(), 4)
+                cache_path.parent.mkdir(parents=True, exist_ok=True)
+                # Unique temporary name, so parallel workers never see a partial file
+                temp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.{threading.get_ident()}")
+                temp_path.write_bytes(data)
+                os.replace(temp_path, cache_path)
+            except (OSError, ValueError) as e:
+                # ValueError: nesting deeper than marshal supports
+                events.debug('ir_cache', f"IR not cached: {str(e)}")
+        return ir
+    
+    def _convert_html_to_latex(self, html_content: str) -> str:
+        """
+        Convert HTML content to LaTeX.
+        
+        The HTML is parsed into the IR first (see _parse_html()), and the
+        LaTeX is rendered from the IR.
+        
+        Args:
+            html_content: HTML string
+            
+        Returns:
+            LaTeX string
+        """
+        body = self._parse_html(html_content)
         
-        return self._convert_element(body, inline=False)
+        if self.source_map is None:
+            return self._convert_element(body, inline=False)
+        self._item_spans = []
+        root = 'body' if body.name == 'body' else ''
+        return self._convert_mapped(body, root, 0)
     
     def _get_metadata(self) -> Dict[str, str]:
         """
@@ -974,41 +4065,56 @@ class EPUBToLaTeXConverter:
         
         return metadata
     
-    def _generate_preamble(self, metadata: Dict[str, str]) -> str:
+    def _generate_preamble(self, metadata: Dict[str, str],
+                           include_only: Optional[List[str]] = None,
+                           features: Optional[set] = None) -> str:
         """
         Generate LaTeX preamble with packages and settings.
         
         Args:
             metadata: Document metadata
+            include_only: Optional list of \\include targets for \\includeonly
+            features: Features the book uses (see PREAMBLE_FEATURES); when
+                      given, only the packages they need are loaded
             
         Returns:
             LaTeX preamble string
         """
-        preamble = r"""\documentclass[12pt,a4paper]{book}
+        # (features needing the block, text); blocks needing nothing are
+        # always kept, 'full' ones only in the full preamble
+        blocks = [
+            ((), r"""\documentclass[12pt,a4paper]{book}
 
 % Encoding and fonts
 \usepackage[utf8]{inputenc}
 \usepackage[T1]{fontenc}
 \usepackage{lmodern}
 
-% Math support
+"""),
+            (('math',), r"""% Math support
 \usepackage{amsmath}
 \usepackage{amssymb}
 
-% Language support (use english as fallback if french not available)
+"""),
+            ((), r"""% Language support (use english as fallback if french not available)
 \usepackage[english]{babel}
 
-% Graphics and images
+"""),
+            (('graphics',), r"""% Graphics and images
 \usepackage{graphicx}
 \usepackage{float}
 
-% Page layout
+"""),
+            ((), r"""% Page layout
 \usepackage[margin=2.5cm]{geometry}
 
-% Colors and highlighting
+"""),
+            (('color',), r"""% Colors and highlighting
 \usepackage{xcolor}
-\usepackage{soul}
-\definecolor{highlightyellow}{RGB}{255,255,200}
+"""),
+            (('highlight',), r"""\usepackage{soul}
+"""),
+            (('color',), r"""\definecolor{highlightyellow}{RGB}{255,255,200}
 
 % Define additional colors for class-based formatting
 \definecolor{lightblue}{RGB}{173,216,230}
@@ -1016,7 +4122,8 @@ class EPUBToLaTeXConverter:
 \definecolor{lightgray}{RGB}{211,211,211}
 \definecolor{lightgreen}{RGB}{144,238,144}
 
-% Framed boxes for special content
+"""),
+            (('framed',), r"""% Framed boxes for special content
 \usepackage{mdframed}
 
 % Define custom environments for class-based blocks
@@ -1024,7 +4131,8 @@ class EPUBToLaTeXConverter:
 {\begin{mdframed}[backgroundcolor=lightgray!20]}
 {\end{mdframed}}
 
-% Hyperlinks
+"""),
+            (('links',), r"""% Hyperlinks
 \usepackage{hyperref}
 \hypersetup{
     colorlinks=true,
@@ -1035,156 +4143,577 @@ class EPUBToLaTeXConverter:
     pdftitle={""" + metadata['title'] + r"""}
 }
 
-% Tables
-\usepackage{booktabs}
-\usepackage{tabularx}
-\usepackage{longtable}
-\usepackage{array}
-\usepackage{colortbl}  % For row coloring in tables
-
-% Lists
+"""),
+            (('booktabs', 'tabularx', 'longtable', 'array', 'rowcolor'), "% Tables\n"),
+            (('booktabs',), "\\usepackage{booktabs}\n"),
+            (('tabularx',), "\\usepackage{tabularx}\n"),
+            (('longtable',), "\\usepackage{longtable}\n"),
+            (('array',), "\\usepackage{array}\n"),
+            (('rowcolor',), "\\usepackage{colortbl}  % For row coloring in tables\n"),
+            (('booktabs', 'tabularx', 'longtable', 'array', 'rowcolor'), "\n"),
+            (('lists',), r"""% Lists
 \usepackage{enumitem}
 
-% Typography
-\usepackage{microtype}
-\usepackage{setspace}
+"""),
+            ((), "% Typography\n"),
+            (('full',), "\\usepackage{microtype}\n"),
+            ((), r"""\usepackage{setspace}
 \setstretch{1.2}
 
-% Strikethrough and underline
+"""),
+            (('strikeout',), r"""% Strikethrough and underline
 \usepackage[normalem]{ulem}
 
-% Better verbatim
+"""),
+            (('verbatim',), r"""% Better verbatim
 \usepackage{fancyvrb}
 
-% Better section spacing
+"""),
+            (('full',), r"""% Better section spacing
 \usepackage{titlesec}
 
-% Page breaks and spacing
+"""),
+            ((), r"""% Page breaks and spacing
 \setlength{\parskip}{0.5em}
 \setlength{\parindent}{1.5em}
 
 % Title information
 \title{""" + metadata['title'] + r"""}
 \author{""" + metadata['author'] + r"""}
+"""),
+        ]
+        preamble = ''.join(text for needs, text in blocks
+                           if features is None or not needs or features.intersection(needs))
+        
+        if metadata['date']:
+            preamble += r"\date{" + metadata['date'] + "}\n"
+        else:
+            preamble += r"\date{\today}" + "\n"
+        
+        if include_only:
+            preamble += r"\includeonly{" + ','.join(include_only) + "}\n"
+        
+        preamble += r"""
+\begin{document}
+
+\maketitle
+\tableofcontents
+\clearpage
+
 """
+        return preamble
+    
+    def _generate_epilogue(self) -> str:
+        """
+        Generate LaTeX epilogue.
+        
+        Returns:
+            LaTeX epilogue string
+        """
+        return "\n\\end{document}\n"
+    
+    def _document_items(self) -> List:
+        """Return the EPUB document items in the order they are converted."""
+        return list(self.book.get_items_of_type(ebooklib.ITEM_DOCUMENT))
+    
+    def _convert_item(self, item) -> Optional[str]:
+        """
+        Convert a single EPUB document item to LaTeX.
+        
+        Args:
+            item: ebooklib document item
+            
+        Returns:
+            LaTeX string, or None if the item could not be converted
+        """
+        try:
+            html_content = item.get_content().decode('utf-8', errors='ignore')
+            return self._convert_html_to_latex(html_content)
+        except Exception as e:
+            self._item_failed(item, str(e))
+            return None
+    
+    def _item_failed(self, item, error: str):
+        """Report an item that could not be converted."""
+        events.warning('convert', f"Failed to process item {item.get_name()}: {error}",
+                       item=item.get_name())
+        events.info('convert', "Skipping this item and continuing...", detail=True)
+    
+    def _convert_items(self, items: List) -> Iterator[Optional[str]]:
+        """
+        Convert document items, yielding their LaTeX (None for failed items)
+        in the order given, with self._item_spans set for each one.
+        
+        With chapter_jobs > 1 the items are converted in a process pool, at
+        most a few per worker ahead of the one being written, so results are
+        not piled up in memory while earlier ones are still being converted.
+        
+        Args:
+            items: ebooklib document items
+            
+        Yields:
+            LaTeX string or None, per item
+        """
+        if self.chapter_jobs <= 1 or len(items) < 2:
+            for item in items:
+                yield self._convert_item(item)
+            return
+        
+        options = {
+            'low_memory': self.low_memory,
+            'source_map': self.source_map is not None,
+            'longtable_threshold': self.longtable_threshold,
+            'ir_cache': self.ir_cache,
+        }
+        # Everything else the rendering depends on, including customized mappings
+        attributes = {name: getattr(self, name) for name in
+                      ('images', 'latex_special_chars', 'format_mapping', 'class_mapping',
+                       'block_class_mapping')}
+        window = self.chapter_jobs * 4
+        pool = ProcessPoolExecutor(max_workers=min(self.chapter_jobs, len(items)),
+                                   initializer=_init_chapter_worker,
+                                   initargs=(type(self), options, attributes))
+        try:
+            pending = collections.deque()
+            remaining = iter(items)
+            while True:
+                while len(pending) < window:
+                    item = next(remaining, None)
+                    if item is None:
+                        break
+                    pending.append((item, pool.submit(_convert_chapter, item.get_content())))
+                if not pending:
+                    break
+                item, future = pending.popleft()
+                try:
+                    latex_text, spans, error, ir_hits, ir_misses = future.result()
+                except Exception as e:
+                    # The worker died or the result could not be sent back
+                    latex_text, error, ir_hits, ir_misses = None, str(e), 0, 0
+                self.ir_cache_hits += ir_hits
+                self.ir_cache_misses += ir_misses
+                if error is not None:
+                    self._item_failed(item, error)
+                    yield None
+                    continue
+                self._item_spans = spans
+                yield latex_text
+        finally:
+            pool.shutdown(cancel_futures=True)
+    
+    def _record_features(self, latex_text: str):
+        """Note which PREAMBLE_FEATURES a piece of generated LaTeX uses."""
+        for name, pattern in PREAMBLE_FEATURES.items():
+            if name not in self.features and pattern.search(latex_text):
+                self.features.add(name)
+    
+    def _release_item(self, item):
+        """Drop an item's raw bytes once they are no longer needed (low-memory mode)."""
+        if self.low_memory:
+            item.content = b''
+    
+    def _write_output(self, path: Path, data) -> bool:
+        """_write_if_changed() that counts the bytes actually written."""
+        if not _write_if_changed(path, data):
+            return False
+        self.bytes_written += len(data.encode('utf-8') if isinstance(data, str) else data)
+        return True
+    
+    def _chapter_name(self, number: int) -> str:
+        """Return the zero-padded chapter name used in split mode (e.g. '007')."""
+        return f"{number:0{self.chapter_digits}d}"
+    
+    def _write_single(self, metadata: Dict[str, str]) -> Tuple[int, int]:
+        """
+        Write the whole book to a single .tex file, item by item.
         
-        if metadata['date']:
-            preamble += r"\date{" + metadata['date'] + "}\n"
-        else:
-            preamble += r"\date{\today}" + "\n"
+        Args:
+            metadata: Document metadata
+            
+        Returns:
+            Tuple of (items_processed, items_failed)
+        """
+        items_processed = 0
+        items_failed = 0
         
-        preamble += r"""
-\begin{document}
-
-\maketitle
-\tableofcontents
-\clearpage
-
-"""
-        return preamble
+        events.info('write', f"Writing LaTeX file: {self.output_path}", output=str(self.output_path))
+        tex_name = Path(self.output_path).name
+        self.features = set()
+        with open(self.output_path, 'w', encoding='utf-8') as f:
+            if self.minimal_preamble:
+                # The preamble depends on the body, which goes to a spool
+                # file first; source map lines are shifted once it is known
+                body = tempfile.TemporaryFile('w+', encoding='utf-8', dir=self.output_dir)
+                line = 0
+            else:
+                body = f
+                preamble = self._generate_preamble(metadata)
+                f.write(preamble)
+                line = preamble.count('\n')
+            mapped = []
+            items = self._document_items()
+            for item, latex_text in zip(items, self._convert_items(items)):
+                self._release_item(item)
+                if latex_text is None:
+                    items_failed += 1
+                    continue
+                body.write(latex_text)
+                if self.minimal_preamble:
+                    self._record_features(latex_text)
+                if self.source_map is not None:
+                    mapped.append((item.get_name(), line, self._item_spans))
+                    line += latex_text.count('\n')
+                items_processed += 1
+            offset = 0
+            if self.minimal_preamble:
+                preamble = self._generate_preamble(metadata, features=self.features)
+                f.write(preamble)
+                offset = preamble.count('\n')
+                body.seek(0)
+                shutil.copyfileobj(body, f)
+                body.close()
+            for name, base_line, spans in mapped:
+                self.source_map.add_item(tex_name, name, base_line + offset, spans)
+            f.write(self._generate_epilogue())
+        self.bytes_written += os.path.getsize(self.output_path)
+        
+        return items_processed, items_failed
     
-    def _generate_epilogue(self) -> str:
+    def _conversion_fingerprint(self) -> str:
         """
-        Generate LaTeX epilogue.
+        Hash the settings that influence the generated LaTeX, so cached
+        chapters are only reused when they would be regenerated identically.
         
         Returns:
-            LaTeX epilogue string
+            Hex digest of the converter configuration
         """
-        return "\n\\end{document}\n"
+        config = {
+            'state_version': self.STATE_VERSION,
+            'format_mapping': self.format_mapping,
+            'class_mapping': self.class_mapping,
+            'block_class_mapping': self.block_class_mapping,
+            'images': self.images,
+            'chapter_digits': self.chapter_digits,
+            'longtable_threshold': self.longtable_threshold,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def _load_state(self) -> Dict:
+        """
+        Load the state saved by the previous split run, if any.
+        
+        Returns:
+            State dictionary, empty when missing or unreadable
+        """
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if state.get('version') != self.STATE_VERSION:
+            return {}
+        return state
+    
+    def _save_state(self, state: Dict):
+        """Persist item hashes so the next --update run can skip unchanged chapters."""
+        _write_if_changed(self.state_path, json.dumps(state, indent=1, sort_keys=True))
+    
+    def _write_split(self, metadata: Dict[str, str]) -> Tuple[int, int]:
+        """
+        Write each document item to chapters/NNN.tex and a main file that
+        \\include's them, so chapters can be edited and recompiled on their own.
+        
+        In update mode, items whose content hash matches the previous run are
+        not reconverted, and files whose content did not change are not
+        rewritten, so make-style tools and LaTeX's per-chapter .aux files see
+        only the chapters that really changed.
+        
+        Args:
+            metadata: Document metadata
+            
+        Returns:
+            Tuple of (items_processed, items_failed)
+        """
+        items_processed = 0
+        items_failed = 0
+        includes = []
+        
+        items = self._document_items()
+        self.chapter_digits = max(3, len(str(len(items))))
+        
+        fingerprint = self._conversion_fingerprint()
+        previous = self.previous_state
+        if previous.get('fingerprint') != fingerprint:
+            previous = {}
+        previous_chapters = previous.get('chapters', {})
+        chapters_state = {}
+        self.features = set()
+        # Reused chapters are not reconverted, so their entries come from the
+        # last map; without one every chapter is reconverted
+        previous_map = None
+        reuse = bool(previous_chapters)
+        if self.source_map is not None and reuse:
+            previous_map = SourceMap.load(self.source_map_path)
+            reuse = previous_map is not None
+        
+        chapters = []
+        for number, item in enumerate(items, 1):
+            chapter = self._chapter_name(number)
+            chapter_path = self.chapters_dir / f"{chapter}.tex"
+            digest = hashlib.sha256(item.get_content()).hexdigest()
+            entry = {'item': item.get_name(), 'sha256': digest}
+            reused = reuse and previous_chapters.get(chapter) == entry and chapter_path.exists()
+            chapters.append((item, chapter, chapter_path, entry, reused))
+        
+        converted = self._convert_items([item for item, _, _, _, reused in chapters if not reused])
+        for item, chapter, chapter_path, entry, reused in chapters:
+            chapter_file = f"{self.chapters_dir.name}/{chapter}.tex"
+            if reused:
+                self.chapters_reused += 1
+                self._release_item(item)
+                if previous_map is not None:
+                    self.source_map.copy_file(previous_map, chapter_file)
+                if self.minimal_preamble:
+                    self._record_features(chapter_path.read_text(encoding='utf-8'))
+            else:
+                latex_text = next(converted)
+                self._release_item(item)
+                if latex_text is None:
+                    items_failed += 1
+                    continue
+                if self.minimal_preamble:
+                    self._record_features(latex_text)
+                if self._write_output(chapter_path, latex_text):
+                    self.chapters_written += 1
+                if self.source_map is not None:
+                    self.source_map.add_item(chapter_file, item.get_name(), 0, self._item_spans)
+            
+            chapters_state[chapter] = entry
+            includes.append(f"{self.chapters_dir.name}/{chapter}")
+            items_processed += 1
+        
+        # Drop chapter files left over from a previous, longer version of the book
+        for chapter in previous_chapters:
+            if chapter not in chapters_state:
+                stale = self.chapters_dir / f"{chapter}.tex"
+                if stale.exists():
+                    stale.unlink()
+        
+        include_only = None
+        if self.include_only:
+            include_only = [f"{self.chapters_dir.name}/{name}" for name in self.include_only]
+        
+        events.info('write', f"Writing LaTeX file: {self.output_path}", output=str(self.output_path))
+        features = self.features if self.minimal_preamble else None
+        main_tex = [self._generate_preamble(metadata, include_only=include_only, features=features)]
+        for target in includes:
+            main_tex.append(f"\\include{{{target}}}\n")
+        main_tex.append(self._generate_epilogue())
+        self._write_output(Path(self.output_path), ''.join(main_tex))
+        
+        if self.update:
+            events.debug('cache', "Chapter reuse", cache='chapters', hits=self.chapters_reused,
+                         misses=len(items) - self.chapters_reused)
+        
+        self._save_state({
+            'version': self.STATE_VERSION,
+            'fingerprint': fingerprint,
+            'chapters': chapters_state,
+        })
+        
+        return items_processed, items_failed
     
     def convert(self) -> bool:
         """
         Perform the EPUB to LaTeX conversion.
         
+        In low-memory mode each chapter's parse tree is torn down with
+        decompose() and its raw bytes dropped as soon as it has been written,
+        so apart from the archive contents ebooklib reads up front, peak memory
+        is governed by the largest chapter rather than the size of the book.
+        The peak traced by tracemalloc is stored in self.peak_memory.
+        
+        With profile_dir the conversion runs under cProfile; if it took at
+        least profile_threshold seconds the profile is saved there as a
+        .pstats file plus a .folded collapsed-stack file for flame graphs.
+        
+        Progress goes to the module event log, tagged with the book ID of
+        the surrounding batch or, for a single conversion, the file name.
+        
         Returns:
             True if successful, False otherwise
         """
+        with events.book(_current_book.get() or Path(self.epub_path).name):
+            with events.stage('book') as summary:
+                success = self._convert_profiled()
+                summary.update(success=success, bytes_read=self.bytes_read,
+                               bytes_written=self.bytes_written, images=len(self.images))
+                return success
+    
+    def _convert_profiled(self) -> bool:
+        """convert() under cProfile when profile_dir is set."""
+        if self.profile_dir is None:
+            return self._convert_tracked()
+        
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Another profiler or a debugger is already hooked in
+            events.warning('profile', f"Profiling disabled: {str(e)}")
+            return self._convert_tracked()
+        start = time.perf_counter()
+        try:
+            return self._convert_tracked()
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.profile_threshold:
+                # The hash keeps same-named books from different folders apart
+                digest = hashlib.sha1(os.path.abspath(self.epub_path).encode('utf-8')).hexdigest()[:8]
+                name = f"{Path(self.epub_path).stem}-{digest}"
+                try:
+                    stats_path, _ = _write_profile(profiler, self.profile_dir, name)
+                    events.info('profile', f"Profile ({elapsed:.2f}s): {stats_path}", detail=True,
+                                profile=str(stats_path), duration=round(elapsed, 6))
+                except OSError as e:
+                    events.warning('profile', f"Could not write profile: {str(e)}")
+    
+    def _convert_tracked(self) -> bool:
+        """convert() with peak-memory tracing in low-memory mode."""
+        if not self.low_memory:
+            return self._convert()
+        
+        started_tracing = not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        try:
+            return self._convert()
+        finally:
+            self.peak_memory = tracemalloc.get_traced_memory()[1]
+            if started_tracing:
+                tracemalloc.stop()
+            events.info('convert', f"Peak traced memory: {self.peak_memory / (1024 * 1024):.1f} MB",
+                        detail=True, peak_memory=self.peak_memory)
+    
+    def _convert(self) -> bool:
+        """Conversion body of convert(); see convert() for the details."""
+        # The class mappings may have been changed since the last conversion
+        self._class_plans.clear()
+        try:
+            return self._convert_book()
+        finally:
+            # Never leave image writes running past convert(), even on failure
+            self._finish_images()
+    
+    def _convert_book(self) -> bool:
+        """Read, convert and write the book while the images are being written."""
         try:
-            print(f"Reading EPUB file: {self.epub_path}")
-            
             # Validate EPUB file exists
             if not os.path.exists(self.epub_path):
-                print(f"✗ Error: EPUB file not found: {self.epub_path}")
+                self.error = f"EPUB file not found: {self.epub_path}"
+                events.error('read', f"Error: {self.error}")
                 return False
             
             # Try to read EPUB with error handling
-            try:
-                self.book = epub.read_epub(self.epub_path)
-            except Exception as e:
-                print(f"✗ Error: Failed to read EPUB file: {str(e)}")
-                print("  The file may be corrupted or not a valid EPUB format.")
-                return False
-            
-            print("Extracting images...")
-            try:
-                self._extract_images()
-            except Exception as e:
-                print(f"⚠ Warning: Error extracting images: {str(e)}")
-                print("  Continuing without images...")
-            
-            print("Extracting metadata...")
-            try:
-                metadata = self._get_metadata()
-            except Exception as e:
-                print(f"⚠ Warning: Error extracting metadata: {str(e)}")
-                print("  Using default metadata...")
-                metadata = {
-                    'title': 'Untitled',
-                    'author': 'Unknown',
-                    'date': '',
-                }
-            
-            print("Converting content to LaTeX...")
-            latex_content = self._generate_preamble(metadata)
+            with events.stage('read', f"Reading EPUB file: {self.epub_path}"):
+                try:
+                    self.bytes_read = os.path.getsize(self.epub_path)
+                    self.book = epub.read_epub(self.epub_path)
+                except Exception as e:
+                    self.error = f"Failed to read EPUB file: {str(e)}"
+                    events.error('read', f"Error: {self.error}")
+                    events.info('read', "The file may be corrupted or not a valid EPUB format.",
+                                detail=True)
+                    return False
             
-            # Process all document items with error handling
-            items_processed = 0
-            items_failed = 0
+            if self.update:
+                self.previous_state = self._load_state()
             
-            for item in self.book.get_items_of_type(ebooklib.ITEM_DOCUMENT):
+            with events.stage('images', "Extracting images..."):
                 try:
-                    html_content = item.get_content().decode('utf-8', errors='ignore')
-                    
-                    # Convert HTML to LaTeX
-                    latex_text = self._convert_html_to_latex(html_content)
-                    latex_content += latex_text
-                    items_processed += 1
+                    self._extract_images()
                 except Exception as e:
-                    items_failed += 1
-                    print(f"⚠ Warning: Failed to process item {item.get_name()}: {str(e)}")
-                    print("  Skipping this item and continuing...")
-                    continue
+                    events.warning('images', f"Error extracting images: {str(e)}")
+                    events.info('images', "Continuing without images...", detail=True)
             
-            latex_content += self._generate_epilogue()
+            with events.stage('metadata', "Extracting metadata..."):
+                try:
+                    metadata = self._get_metadata()
+                except Exception as e:
+                    events.warning('metadata', f"Error extracting metadata: {str(e)}")
+                    events.info('metadata', "Using default metadata...", detail=True)
+                    metadata = {
+                        'title': 'Untitled',
+                        'author': 'Unknown',
+                        'date': '',
+                    }
             
-            print(f"Writing LaTeX file: {self.output_path}")
-            try:
-                # Ensure output directory exists
-                os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+            with events.stage('convert', "Converting content to LaTeX..."):
+                try:
+                    # Ensure output directory exists
+                    os.makedirs(os.path.dirname(os.path.abspath(self.output_path)), exist_ok=True)
+                    if self.split:
+                        self.chapters_dir.mkdir(parents=True, exist_ok=True)
+                except Exception as e:
+                    self.error = f"Failed to create output directory: {str(e)}"
+                    events.error('convert', f"Error: {self.error}")
+                    return False
                 
-                with open(self.output_path, 'w', encoding='utf-8') as f:
-                    f.write(latex_content)
-            except Exception as e:
-                print(f"✗ Error: Failed to write output file: {str(e)}")
-                return False
+                try:
+                    if self.split:
+                        items_processed, items_failed = self._write_split(metadata)
+                    else:
+                        items_processed, items_failed = self._write_single(metadata)
+                except OSError as e:
+                    self.error = f"Failed to write output file: {str(e)}"
+                    events.error('write', f"Error: {self.error}")
+                    return False
             
-            print(f"\n✓ Conversion successful!")
-            print(f"  Output: {self.output_path}")
-            print(f"  Items processed: {items_processed}")
+            self._finish_images()
+            events.success('convert', "Conversion successful!", output=str(self.output_path),
+                           items_processed=items_processed, items_failed=items_failed,
+                           images=len(self.images))
+            events.info('convert', f"Output: {self.output_path}", detail=True)
+            if self.split:
+                events.info('convert', f"Chapters: {self.chapters_dir}", detail=True)
+            if self.update:
+                events.info('convert', f"Chapters rewritten: {self.chapters_written}, "
+                            f"reused from previous run: {self.chapters_reused}", detail=True,
+                            chapters_written=self.chapters_written,
+                            chapters_reused=self.chapters_reused)
+            events.info('convert', f"Items processed: {items_processed}", detail=True)
             if items_failed > 0:
-                print(f"  Items failed: {items_failed}")
+                events.info('convert', f"Items failed: {items_failed}", detail=True)
             if self.images:
-                print(f"  Images: {len(self.images)} images extracted to {self.images_dir}")
+                events.info('convert', f"Images: {len(self.images)} images extracted to {self.images_dir}",
+                            detail=True)
+            if self.minimal_preamble:
+                events.info('convert', "Preamble features: " + (', '.join(sorted(self.features)) or 'none'),
+                            detail=True, features=sorted(self.features))
+            if self.tag_stats is not None:
+                self.tag_stats.write_json(self.tag_stats_path)
+                events.info('tag_stats', "  Tag statistics (by exclusive time):\n" + self.tag_stats.summary())
+                events.info('tag_stats', f"Tag statistics: {self.tag_stats_path}", detail=True,
+                            path=str(self.tag_stats_path))
+            if self.ir_cache is not None:
+                events.info('convert', f"IR cache: {self.ir_cache_hits} hit(s), "
+                            f"{self.ir_cache_misses} miss(es)", detail=True)
+                events.debug('cache', "IR cache", cache='ir', hits=self.ir_cache_hits,
+                             misses=self.ir_cache_misses)
+            if self.source_map is not None:
+                self.source_map.write_json(self.source_map_path)
+                events.info('source_map', f"Source map: {self.source_map_path}", detail=True,
+                            path=str(self.source_map_path))
             
             return True
             
         except Exception as e:
-            print(f"✗ Error during conversion: {str(e)}")
-            import traceback
-            traceback.print_exc()
+            self.error = f"Error during conversion: {str(e)}"
+            events.error('convert', self.error, traceback=traceback.format_exc())
             return False
 
-
 def main():
     """Main entry point for the converter."""
     parser = argparse.ArgumentParser(
@@ -1210,6 +4739,67 @@ Examples:
   # Process directory with custom output location
   python epub2tex.py --directory /path/to/epubs --output-dir /path/to/output
   
+  # Process a directory tree, skipping drafts
+  python epub2tex.py --directory /path/to/library --output-dir /path/to/output --exclude 'drafts'
+  
+  # Split a directory across 4 machines (run with 1/4 ... 4/4 on each node)
+  python epub2tex.py --directory /shared/epubs --output-dir /shared/out --shard 1/4 --claim
+  python epub2tex.py --directory /shared/epubs --output-dir /shared/out --claim --claim-retry-failed
+  
+  # Convert 8 books at a time while up to 4 are compiled
+  python epub2tex.py --directory /path/to/epubs --compile --jobs 8 --tex-jobs 4
+  
+  # Start the biggest books first so none of them is left running alone at the end
+  python epub2tex.py --directory /path/to/epubs --jobs 8 --longest-first
+  
+  # Durable batch: enqueue once, then start any number of workers
+  python epub2tex.py --directory /path/to/epubs --queue jobs.db --compile
+  python epub2tex.py --worker --queue jobs.db
+  python epub2tex.py --worker --queue jobs.db --max-attempts 2
+  python epub2tex.py --retry-failed '*/broken_*' --queue jobs.db
+  
+  # Write one .tex file per chapter, included from the main file
+  python epub2tex.py book.epub --split
+  
+  # Reconvert a corrected EPUB, regenerating only the chapters that changed
+  python epub2tex.py book.epub --update --compile
+  
+  # Typeset only chapter 3 (\\includeonly) while working on it
+  python epub2tex.py book.epub --split --include-only 003 --compile
+  
+  # Find out which HTML constructs make a book slow
+  python epub2tex.py book.epub --tag-stats
+  
+  # Spread the chapters of one very large book over 8 cores
+  python epub2tex.py compendium.epub --chapter-jobs 8
+  
+  # Plain novel: skip the packages it does not need, for faster TeX passes
+  python epub2tex.py novel.epub --minimal-preamble --compile
+  
+  # Keep parsed chapters, so later runs with other settings skip the HTML parsing
+  python epub2tex.py --directory /path/to/epubs --ir-cache ~/.cache/epub2tex
+  
+  # Report TeX errors with the EPUB item and element that produced the line
+  python epub2tex.py book.epub --source-map --compile
+  
+  # Check engines and LaTeX packages once, remembering the result across runs
+  python epub2tex.py --directory /path/to/epubs --compile --toolchain-cache ~/.cache/epub2tex
+  
+  # Keep runaway TeX runs from starving the conversion workers
+  python epub2tex.py --directory /path/to/epubs --compile --jobs 8 --tex-memory 2G --tex-nice 10
+  
+  # Find the chapters that break the build and typeset the rest
+  python epub2tex.py book.epub --compile --bisect --bisect-placeholder
+  
+  # Keep profiles of the books that take longer than 30 seconds
+  python epub2tex.py --directory /path/to/epubs --profile-dir profiles --profile-threshold 30
+  
+  # Machine-readable progress for a log pipeline, nothing on the console
+  python epub2tex.py --directory /path/to/epubs --log-json events.jsonl --quiet
+  
+  # Long-running worker exporting metrics for node-exporter's textfile collector
+  python epub2tex.py --worker --queue jobs.db --metrics-file /var/lib/node_exporter/epub2tex.prom
+  
   # Display help
   python epub2tex.py --help
 
@@ -1234,6 +4824,23 @@ The converter will:
         '-d', '--directory',
         help='Path to directory containing EPUB files (processes all EPUBs in directory)'
     )
+    input_group.add_argument(
+        '--worker',
+        action='store_true',
+        help='Process jobs from the --queue database until it is empty'
+    )
+    input_group.add_argument(
+        '--retry-failed',
+        nargs='?',
+        const='',
+        metavar='GLOB',
+        help='Requeue failed jobs of the --queue database (optionally only EPUB paths matching GLOB)'
+    )
+    input_group.add_argument(
+        '--queue-status',
+        action='store_true',
+        help='Show job counts and failures of the --queue database'
+    )
     
     # Output options
     parser.add_argument(
@@ -1246,6 +4853,165 @@ The converter will:
         help='Output directory for LaTeX files (only for directory mode)'
     )
     
+    parser.add_argument(
+        '--no-recursive',
+        action='store_true',
+        help='Directory mode: only look at the top level of the directory'
+    )
+    parser.add_argument(
+        '--include',
+        action='append',
+        metavar='GLOB',
+        help='Directory mode: only process files whose relative path matches GLOB (repeatable)'
+    )
+    parser.add_argument(
+        '--exclude',
+        action='append',
+        metavar='GLOB',
+        help='Directory mode: skip files or directories whose relative path matches GLOB (repeatable)'
+    )
+    parser.add_argument(
+        '--symlinks',
+        default='files',
+        choices=SYMLINK_POLICIES,
+        help="Directory mode: follow symlinked 'files' only (default), 'follow' directories too, or 'ignore' them"
+    )
+    parser.add_argument(
+        '--shard',
+        metavar='I/N',
+        help='Directory mode: only process the I-th of N disjoint subsets (1-based, stable hash of the relative path)'
+    )
+    parser.add_argument(
+        '--claim',
+        action='store_true',
+        help='Directory mode: coordinate nodes with lock files in the output directory; '
+             'idle nodes take over books no one has claimed'
+    )
+    parser.add_argument(
+        '--lock-ttl',
+        type=float,
+        default=3600,
+        metavar='SECONDS',
+        help='Age after which a --claim lock is considered abandoned (default: 3600)'
+    )
+    parser.add_argument(
+        '--claim-retry-failed',
+        nargs='?',
+        const='',
+        metavar='GLOB',
+        help='With --claim: retry books marked failed by any node (optionally only EPUB paths matching GLOB)'
+    )
+    
+    parser.add_argument(
+        '-j', '--jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Directory mode: convert N books in parallel processes, overlapping with TeX runs (default: 1)'
+    )
+    parser.add_argument(
+        '--tex-jobs',
+        type=int,
+        metavar='N',
+        help='Maximum concurrent TeX processes, in directory mode with --jobs (default: same as --jobs) '
+             'and with --bisect (default: number of CPUs)'
+    )
+    
+    parser.add_argument(
+        '--longest-first',
+        action='store_true',
+        help='Directory mode with --jobs or --queue: start the books with the highest estimated cost '
+             '(XHTML bytes, image bytes, item count) first and report the predicted makespan'
+    )
+    
+    # Job queue options
+    parser.add_argument(
+        '--queue',
+        metavar='DB',
+        help='SQLite job queue: with --directory, enqueue the books instead of converting them'
+    )
+    parser.add_argument(
+        '--lease',
+        type=float,
+        default=300,
+        metavar='SECONDS',
+        help='Queue lease duration; workers heartbeat every third of it (default: 300)'
+    )
+    parser.add_argument(
+        '--max-attempts',
+        type=int,
+        default=3,
+        metavar='N',
+        help='Mark a queued job failed once its lease expired N times (default: 3)'
+    )
+    
+    parser.add_argument(
+        '--split',
+        action='store_true',
+        help='Write each chapter to chapters/NNN.tex and \\include it from the main file'
+    )
+    parser.add_argument(
+        '--update',
+        action='store_true',
+        help='Incremental split mode: only regenerate chapters whose source changed since the last run'
+    )
+    parser.add_argument(
+        '--chapter-jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Convert the chapters of each book in N parallel processes (default: 1)'
+    )
+    parser.add_argument(
+        '--low-memory',
+        action='store_true',
+        help='Free each chapter\'s parse tree right after conversion and report peak traced memory'
+    )
+    parser.add_argument(
+        '--tag-stats',
+        action='store_true',
+        help='Count nodes, time and escaped text per HTML tag; print a summary and write <output>.tagstats.json'
+    )
+    parser.add_argument(
+        '--minimal-preamble',
+        action='store_true',
+        help='Only load the LaTeX packages needed by the features the book uses (links, tables, colors, ...)'
+    )
+    parser.add_argument(
+        '--longtable-rows',
+        type=int,
+        default=100,
+        metavar='N',
+        help='Write tables with more than N rows as a page-breaking longtable with a repeated header (default: 100)'
+    )
+    parser.add_argument(
+        '--ir-cache',
+        metavar='DIR',
+        help='Cache the parsed form of each chapter in DIR, so later conversions with other settings skip HTML parsing'
+    )
+    parser.add_argument(
+        '--source-map',
+        action='store_true',
+        help='Write <output>.srcmap.json mapping LaTeX line ranges to EPUB items and elements'
+    )
+    parser.add_argument(
+        '--profile-dir',
+        metavar='DIR',
+        help='Profile each book with cProfile and write .pstats and collapsed-stack (.folded) files to DIR'
+    )
+    parser.add_argument(
+        '--profile-threshold',
+        type=float,
+        default=0.0,
+        metavar='SECONDS',
+        help='With --profile-dir, only keep profiles of books that took at least SECONDS (default: 0)'
+    )
+    parser.add_argument(
+        '--include-only',
+        metavar='CHAPTERS',
+        help='Comma-separated chapter names to typeset via \\includeonly (single file, requires --split)'
+    )
+    
     # Compilation options
     parser.add_argument(
         '-c', '--compile',
@@ -1258,6 +5024,82 @@ The converter will:
         choices=['pdflatex', 'xelatex', 'lualatex'],
         help='LaTeX compiler to use (default: pdflatex)'
     )
+    parser.add_argument(
+        '--toolchain-cache',
+        metavar='DIR',
+        help='Remember in DIR which LaTeX packages kpsewhich found, keyed by PATH and the TeX binaries'
+    )
+    parser.add_argument(
+        '--tex-timeout',
+        type=float,
+        default=120,
+        metavar='SECONDS',
+        help='Base timeout of each TeX pass; the whole process group is killed when it runs out (default: 120)'
+    )
+    parser.add_argument(
+        '--tex-timeout-per-mb',
+        type=float,
+        default=60,
+        metavar='SECONDS',
+        help='Extra timeout per megabyte of .tex source, so big books get more time (default: 60)'
+    )
+    parser.add_argument(
+        '--tex-memory',
+        metavar='SIZE',
+        help='Address-space limit of each TeX process (RLIMIT_AS), e.g. 2G'
+    )
+    parser.add_argument(
+        '--tex-cpu',
+        type=int,
+        metavar='SECONDS',
+        help='CPU time limit of each TeX pass (RLIMIT_CPU)'
+    )
+    parser.add_argument(
+        '--tex-nice',
+        type=int,
+        metavar='N',
+        help='Run TeX with its niceness increased by N'
+    )
+    parser.add_argument(
+        '--tex-ionice',
+        metavar='CLASS[:LEVEL]',
+        help="Run TeX under ionice(1), e.g. '3' (idle) or '2:7' (lowest best-effort)"
+    )
+    parser.add_argument(
+        '--bisect',
+        action='store_true',
+        help='If compilation fails, compile each chapter standalone in parallel to find the failing ones '
+             '(implies --split; --tex-jobs limits the parallel TeX runs)'
+    )
+    parser.add_argument(
+        '--bisect-placeholder',
+        action='store_true',
+        help='With --bisect, also build <output>-partial.pdf with the failing chapters replaced by a placeholder'
+    )
+    
+    # Logging options
+    parser.add_argument(
+        '--log-json',
+        metavar='FILE',
+        help="Append structured JSON-lines events to FILE ('-' for stdout; console output then goes to stderr)"
+    )
+    parser.add_argument(
+        '--metrics-file',
+        metavar='FILE',
+        help='Keep a Prometheus textfile-collector file (e.g. /var/lib/node_exporter/epub2tex.prom) up to date'
+    )
+    parser.add_argument(
+        '--metrics-interval',
+        type=float,
+        default=15.0,
+        metavar='SECONDS',
+        help='Time between --metrics-file rewrites (default: 15)'
+    )
+    parser.add_argument(
+        '-q', '--quiet',
+        action='store_true',
+        help='No console progress output (errors are still reported through the exit status and --log-json)'
+    )
     
     parser.add_argument(
         '-v', '--version',
@@ -1266,6 +5108,88 @@ The converter will:
     )
     
     args = parser.parse_args()
+    configure_events(json_log=args.log_json, quiet=args.quiet,
+                     show_book=args.jobs > 1 or args.worker,
+                     metrics_file=args.metrics_file, metrics_interval=args.metrics_interval)
+    
+    try:
+        configure_compile_limits(CompileLimits(
+            memory=parse_size(args.tex_memory) if args.tex_memory else None,
+            cpu=args.tex_cpu,
+            nice=args.tex_nice,
+            ionice=args.tex_ionice,
+            timeout=args.tex_timeout,
+            timeout_per_mb=args.tex_timeout_per_mb,
+        ))
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    configure_toolchain_cache(args.toolchain_cache)
+    
+    if args.bisect_placeholder and not args.bisect:
+        print("Error: --bisect-placeholder requires --bisect.")
+        sys.exit(1)
+    if args.bisect and not args.compile:
+        print("Error: --bisect requires --compile.")
+        sys.exit(1)
+    if args.bisect and (args.directory or args.queue):
+        print("Error: --bisect works on a single EPUB file.")
+        sys.exit(1)
+    if args.longest_first and not (args.directory and (args.jobs > 1 or args.queue)):
+        print("Error: --longest-first requires --directory with --jobs or --queue.")
+        sys.exit(1)
+    if args.claim_retry_failed is not None and not (args.directory and args.claim):
+        print("Error: --claim-retry-failed requires --directory with --claim.")
+        sys.exit(1)
+    if args.include_only and not args.epub_file:
+        # Chapter names are per book
+        print("Error: --include-only works on a single EPUB file.")
+        sys.exit(1)
+    if args.include_only and not (args.split or args.update):
+        print("Error: --include-only requires --split.")
+        sys.exit(1)
+    include_only = args.include_only.split(',') if args.include_only else None
+    converter_options = {
+        'split': args.split or args.bisect,
+        'update': args.update,
+        'low_memory': args.low_memory,
+        'tag_stats': args.tag_stats,
+        'profile_dir': args.profile_dir,
+        'profile_threshold': args.profile_threshold,
+        'source_map': args.source_map,
+        'longtable_threshold': args.longtable_rows,
+        'ir_cache': args.ir_cache,
+        'chapter_jobs': args.chapter_jobs,
+        'minimal_preamble': args.minimal_preamble,
+    }
+    
+    # Job queue modes
+    if (args.worker or args.retry_failed is not None or args.queue_status) and not args.queue:
+        print("Error: --worker, --retry-failed and --queue-status require --queue.")
+        sys.exit(1)
+    
+    if args.worker:
+        successful, failed = run_queue_worker(args.queue, lease_seconds=args.lease,
+                                              max_attempts=args.max_attempts)
+        sys.exit(0 if failed == 0 else 1)
+    
+    if args.retry_failed is not None:
+        queue = JobQueue(args.queue)
+        requeued = queue.retry(args.retry_failed or None)
+        queue.close()
+        events.info('queue', f"Requeued {requeued} failed job(s)", requeued=requeued)
+        sys.exit(0)
+    
+    if args.queue_status:
+        queue = JobQueue(args.queue)
+        counts = queue.counts()
+        failures = queue.failures()
+        queue.close()
+        for status in ('pending', 'running', 'done', 'failed'):
+            print(f"  {status}: {counts.get(status, 0)}")
+        for job in failures:
+            print(f"✗ {job['epub_path']} (attempts: {job['attempts']}): {job['error']}")
+        sys.exit(0)
     
     # Directory mode
     if args.directory:
@@ -1273,11 +5197,63 @@ The converter will:
             print("Error: Cannot specify output_file with --directory. Use --output-dir instead.")
             sys.exit(1)
         
+        discovery = {
+            'recursive': not args.no_recursive,
+            'include': args.include,
+            'exclude': args.exclude,
+            'symlinks': args.symlinks,
+        }
+        
+        if args.queue:
+            enqueue_directory(
+                args.queue,
+                args.directory,
+                output_dir=args.output_dir,
+                compile_latex_flag=args.compile,
+                compiler=args.compiler,
+                longest_first=args.longest_first,
+                **discovery,
+                **converter_options
+            )
+            sys.exit(0)
+        
+        shard = None
+        if args.shard:
+            try:
+                shard = parse_shard(args.shard)
+            except ValueError as e:
+                print(f"Error: {e}")
+                sys.exit(1)
+        
+        if args.jobs > 1:
+            successful, failed = asyncio.run(process_directory_async(
+                args.directory,
+                output_dir=args.output_dir,
+                compile_latex_flag=args.compile,
+                compiler=args.compiler,
+                jobs=args.jobs,
+                tex_jobs=args.tex_jobs,
+                shard=shard,
+                claim=args.claim,
+                lock_ttl=args.lock_ttl,
+                retry_failed=args.claim_retry_failed,
+                longest_first=args.longest_first,
+                **discovery,
+                **converter_options
+            ))
+            sys.exit(0 if failed == 0 else 1)
+        
         successful, failed = process_directory(
             args.directory,
             output_dir=args.output_dir,
             compile_latex_flag=args.compile,
-            compiler=args.compiler
+            compiler=args.compiler,
+            shard=shard,
+            claim=args.claim,
+            lock_ttl=args.lock_ttl,
+            retry_failed=args.claim_retry_failed,
+            **discovery,
+            **converter_options
         )
         sys.exit(0 if failed == 0 else 1)
     
@@ -1292,7 +5268,8 @@ The converter will:
         sys.exit(1)
     
     # Create converter and run
-    converter = EPUBToLaTeXConverter(args.epub_file, args.output_file)
+    converter = EPUBToLaTeXConverter(args.epub_file, args.output_file,
+                                     include_only=include_only, **converter_options)
     success = converter.convert()
     
     if not success:
@@ -1301,12 +5278,15 @@ The converter will:
     # Compile if requested
     if args.compile:
         tex_output = args.output_file or converter.output_path
-        print(f"\nCompiling {tex_output}...")
-        if compile_latex(tex_output, compiler=args.compiler):
-            print(f"✓ Compilation successful")
-        else:
-            print(f"⚠ Warning: Compilation failed, but LaTeX file is available")
-            sys.exit(1)
+        with events.book(Path(args.epub_file).name):
+            if compile_latex(tex_output, compiler=args.compiler):
+                events.success('compile', "Compilation successful")
+            else:
+                events.warning('compile', "Compilation failed, but LaTeX file is available")
+                if args.bisect:
+                    bisect_chapters(tex_output, compiler=args.compiler, jobs=args.tex_jobs,
+                                    placeholder=args.bisect_placeholder)
+                sys.exit(1)
     
     sys.exit(0)
 
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the asyncio batch orchestrator (--jobs)
+"""
+
+import os
+import sys
+import stat
+import asyncio
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import process_directory_async, compile_latex_async
+
+
+# Fake TeX engine: records how many instances run at once and writes a PDF
+FAKE_COMPILER = '''#!/bin/sh
+log="$FAKE_TEX_LOG"
+echo start >> "$log"
+sleep 0.2
+echo end >> "$log"
+for last; do :; done
+touch "${last%.tex}.pdf"
+'''
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Async Batch')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def install_fake_compiler(bin_dir, log_path):
+    """Put a fake pdflatex first on PATH"""
+    compiler = Path(bin_dir) / 'pdflatex'
+    compiler.write_text(FAKE_COMPILER)
+    compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    os.environ['FAKE_TEX_LOG'] = str(log_path)
+
+
+def max_concurrency(log_path):
+    """Highest number of fake TeX processes that were running at once"""
+    running = peak = 0
+    for line in Path(log_path).read_text().split():
+        running += 1 if line == 'start' else -1
+        peak = max(peak, running)
+    return peak
+
+
+def test_async_batch_converts_all():
+    """Test that the orchestrator converts every book"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        output_dir = Path(tmpdir) / 'output'
+        input_dir.mkdir()
+        for i in range(4):
+            create_test_epub(str(input_dir / f'book_{i}.epub'))
+        (input_dir / 'broken.epub').write_bytes(b'not a zip file')
+
+        successful, failed = asyncio.run(process_directory_async(
+            str(input_dir), output_dir=str(output_dir), jobs=2))
+
+        assert (successful, failed) == (4, 1), f"Got {successful} successful, {failed} failed"
+        assert len(list(output_dir.glob('*.tex'))) == 4
+
+    print("✓ Async orchestrator converted every book")
+    return True
+
+
+def test_async_compile_respects_tex_limit():
+    """Test that TeX passes overlap but never exceed tex_jobs"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            log_path = Path(tmpdir) / 'tex.log'
+            install_fake_compiler(tmpdir, log_path)
+
+            input_dir = Path(tmpdir) / 'epubs'
+            output_dir = Path(tmpdir) / 'output'
+            input_dir.mkdir()
+            for i in range(4):
+                create_test_epub(str(input_dir / f'book_{i}.epub'))
+
+            successful, failed = asyncio.run(process_directory_async(
+                str(input_dir), output_dir=str(output_dir), compile_latex_flag=True,
+                jobs=2, tex_jobs=2))
+
+            assert (successful, failed) == (4, 0)
+            assert len(list(output_dir.glob('*.pdf'))) == 4, "Not every book was compiled"
+            peak = max_concurrency(log_path)
+            assert peak == 2, f"Expected 2 concurrent TeX runs, saw {peak}"
+        finally:
+            os.environ['PATH'] = saved_path
+            os.environ.pop('FAKE_TEX_LOG', None)
+
+    print("✓ TeX passes overlap within the tex_jobs limit")
+    return True
+
+
+def test_compile_latex_async_missing_file():
+    """Test that a missing .tex file is reported as a failure"""
+    result = asyncio.run(compile_latex_async('/nonexistent/book.tex'))
+    assert not result and result.pdf_path is None and result.passes == 0
+    print("✓ Missing .tex file reported")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Async Batch Orchestrator Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Converts All Books", test_async_batch_converts_all),
+        ("TeX Concurrency Limit", test_async_compile_respects_tex_limit),
+        ("Missing File", test_compile_latex_async_missing_file),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the parallel per-chapter bisection of compile failures
+"""
+
+import os
+import sys
+import stat
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, bisect_chapters
+
+
+# Fake TeX engine: fails on the first \input'd or \include'd file containing
+# FAILME, reporting its line like -file-line-error does
+FAKE_COMPILER = r'''#!/bin/sh
+[ "$1" = "--version" ] && exit 0
+outdir=.
+for arg; do
+  case "$arg" in -output-directory=*) outdir="${arg#-output-directory=}";; esac
+  last="$arg"
+done
+job=$(basename "${last%.tex}")
+log="$outdir/$job.log"
+: > "$log"
+for target in $(sed -n 's/^\\\(input\|include\){\(.*\)}$/\2/p' "$last"); do
+  line=$(grep -n FAILME "$target.tex" | head -1 | cut -d: -f1)
+  if [ -n "$line" ]; then
+    echo "./$target.tex:$line: Undefined control sequence." >> "$log"
+    exit 1
+  fi
+done
+touch "$outdir/$job.pdf"
+'''
+
+
+def create_test_epub(epub_path, chapters):
+    """Create an EPUB with one item per chapter"""
+    book = epub.EpubBook()
+    book.set_identifier('bisect-test')
+    book.set_title('Test Bisect')
+    book.set_language('en')
+
+    items = []
+    for i, content in enumerate(chapters, 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = content
+        book.add_item(chapter)
+        items.append(chapter)
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+
+
+def install_fake_compiler(bin_dir):
+    """Put a fake pdflatex first on PATH"""
+    compiler = Path(bin_dir) / 'pdflatex'
+    compiler.write_text(FAKE_COMPILER)
+    compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def test_failing_chapters_found():
+    """Test that exactly the failing chapters are reported, with their source"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            install_fake_compiler(tmpdir)
+            epub_path = os.path.join(tmpdir, 'book.epub')
+            output_path = os.path.join(tmpdir, 'out', 'book.tex')
+            create_test_epub(epub_path, [
+                '<html><body><h1>One</h1><p>Fine.</p></body></html>',
+                '<html><body><h1>Two</h1><p>Fine.</p><p>FAILME here.</p></body></html>',
+                '<html><body><h1>Three</h1><p>Fine.</p></body></html>',
+                '<html><body><h1>Four</h1><p>FAILME too.</p></body></html>',
+            ])
+            assert EPUBToLaTeXConverter(epub_path, output_path, split=True, source_map=True).convert()
+
+            result = bisect_chapters(output_path, jobs=2, placeholder=True)
+            failed = [chapter['chapter'] for chapter in result.failed]
+            assert failed == ['chapters/002', 'chapters/004'], failed
+            assert len(result.chapters) == 5
+            source = result.failed[0]['errors'][0]['source']
+            assert (source['item'], source['path']) == ('chap_02.xhtml', 'body/p[2]'), source
+
+            assert result.partial, "Placeholder build failed"
+            partial = (Path(tmpdir) / 'out' / 'book-partial.tex').read_text()
+            assert '\\include{chapters/001}' in partial
+            assert '\\include{chapters/002}' not in partial
+            assert 'could not be typeset' in partial
+            leftovers = [p.name for p in (Path(tmpdir) / 'out').iterdir() if p.name.startswith('.bisect-')]
+            assert not leftovers, f"Probe directories left behind: {leftovers}"
+        finally:
+            os.environ['PATH'] = saved_path
+
+    print("✓ Failing chapters found and replaced by placeholders")
+    return True
+
+
+def test_single_file_rejected():
+    """Test that a book without \\include'd chapters is reported, not bisected"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = os.path.join(tmpdir, 'book.tex')
+        create_test_epub(epub_path, ['<html><body><h1>One</h1><p>Text.</p></body></html>'])
+        assert EPUBToLaTeXConverter(epub_path, output_path).convert()
+
+        result = bisect_chapters(output_path)
+        assert result.chapters == [] and result.failed == []
+
+    print("✓ Single-file book reported")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Chapter Bisection Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Failing Chapters", test_failing_chapters_found),
+        ("Single File", test_single_file_rejected),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
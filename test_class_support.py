@@ -81,6 +81,30 @@ def test_class_formatting():
     return True
 
 
+def test_class_plans_cached():
+    """Test that each distinct class list is compiled once into a formatting plan"""
+    converter = EPUBToLaTeXConverter('dummy.epub')
+    
+    plan = converter._class_plan(['important', 'note'])
+    assert converter._class_plan(['important', 'note']) is plan, "Plan compiled twice"
+    
+    # Later classes wrap the earlier ones, as when applied one by one
+    important = converter.class_mapping['important']
+    note = converter.class_mapping['note']
+    expected = f"{note[0]}{important[0]}Text{important[1]}{note[1]}"
+    result = converter._apply_class_formatting('Text', ['important', 'note'], inline=True)
+    assert result == expected, f"Expected {expected}, got {result}"
+    
+    # The first block class gives the environment; highlight-row the row color
+    block_class = next(iter(converter.block_class_mapping))
+    _, _, block, row_prefix, _ = converter._class_plan(['unknown', block_class, 'highlight-row'])
+    assert block[0].startswith('\\begin{'), f"Expected a block environment, got {block}"
+    assert 'rowcolor' in row_prefix
+    
+    print("✓ Class plans compiled once and reused")
+    return True
+
+
 def test_class_conversion():
     """Test conversion of EPUB with classes"""
     if not os.path.exists('class_test.epub'):
@@ -192,6 +216,7 @@ def run_all_tests():
     tests = [
         ("Class Detection", test_class_detection),
         ("Class Formatting", test_class_formatting),
+        ("Class Plans", test_class_plans_cached),
         ("Class Conversion", test_class_conversion),
         ("Backward Compatibility", test_backward_compatibility),
     ]
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for sandboxed TeX subprocesses (--tex-memory, --tex-cpu, --tex-nice, --tex-timeout)
+"""
+
+import os
+import sys
+import stat
+import time
+import asyncio
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import CompileLimits, compile_latex, compile_latex_async, parse_size
+
+
+# Fake TeX engine: records its limits and niceness, and with $FAKE_TEX_HANG
+# starts a background child (recording its pid) and hangs
+FAKE_COMPILER = '''#!/bin/sh
+[ "$1" = "--version" ] && exit 0
+for last; do :; done
+job="${last%.tex}"
+if [ -n "$FAKE_TEX_HANG" ]; then
+  sleep 60 &
+  echo $! > "$FAKE_TEX_HANG"
+  sleep 60
+fi
+sleep 0.3
+grep -E 'Max (address space|cpu time)' /proc/$$/limits > "$job.limits"
+cut -d' ' -f19 /proc/$$/stat > "$job.nice"
+: > "$job.log"
+touch "$job.pdf"
+'''
+
+
+def install_fake_compiler(bin_dir):
+    """Put a fake pdflatex first on PATH"""
+    compiler = Path(bin_dir) / 'pdflatex'
+    compiler.write_text(FAKE_COMPILER)
+    compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+
+
+def is_running(pid):
+    """Whether pid is a live (non-zombie) process"""
+    try:
+        return Path(f'/proc/{pid}/stat').read_text().split()[2] != 'Z'
+    except OSError:
+        return False
+
+
+def test_parse_size():
+    """Test memory size parsing"""
+    assert parse_size('2G') == 2 * 1024 ** 3
+    assert parse_size('512m') == 512 * 1024 ** 2
+    assert parse_size('1.5K') == 1536
+    assert parse_size('1000') == 1000
+    try:
+        parse_size('lots')
+        assert False, "Invalid size accepted"
+    except ValueError:
+        pass
+
+    print("✓ Sizes parsed")
+    return True
+
+
+def test_adaptive_timeout():
+    """Test that the pass timeout grows with the document, chapters included"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tex_path = Path(tmpdir) / 'book.tex'
+        tex_path.write_text('x' * 1024 * 1024)
+        limits = CompileLimits(timeout=10, timeout_per_mb=20)
+        assert round(limits.timeout_for(tex_path)) == 30
+        (Path(tmpdir) / 'chapters').mkdir()
+        (Path(tmpdir) / 'chapters' / '001.tex').write_text('x' * 512 * 1024)
+        assert round(limits.timeout_for(tex_path)) == 40
+
+    print("✓ Timeout adapted to the document size")
+    return True
+
+
+def test_limits_applied():
+    """Test that TeX runs with the configured limits and niceness"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            install_fake_compiler(tmpdir)
+            tex_path = Path(tmpdir) / 'book.tex'
+            tex_path.write_text('\\documentclass{book}\n')
+            limits = CompileLimits(memory=3 * 1024 ** 3, cpu=50, nice=5)
+            assert compile_latex(str(tex_path), max_passes=1, limits=limits)
+
+            recorded = (Path(tmpdir) / 'book.limits').read_text().split('\n')
+            assert str(3 * 1024 ** 3) in recorded[0] or str(3 * 1024 ** 3) in recorded[1], recorded
+            assert any(line.startswith('Max cpu time') and ' 50 ' in line for line in recorded), recorded
+            assert int((Path(tmpdir) / 'book.nice').read_text()) >= 5
+        finally:
+            os.environ['PATH'] = saved_path
+
+    print("✓ Limits and niceness applied")
+    return True
+
+
+def test_timeout_kills_process_group():
+    """Test that a timeout kills TeX and the processes it started"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            install_fake_compiler(tmpdir)
+            tex_path = Path(tmpdir) / 'book.tex'
+            tex_path.write_text('\\documentclass{book}\n')
+            limits = CompileLimits(timeout=0.5, timeout_per_mb=0)
+
+            for run in ('sync', 'async'):
+                pid_file = Path(tmpdir) / f'{run}.pid'
+                os.environ['FAKE_TEX_HANG'] = str(pid_file)
+                start = time.monotonic()
+                if run == 'sync':
+                    result = compile_latex(str(tex_path), limits=limits)
+                else:
+                    result = asyncio.run(compile_latex_async(str(tex_path), limits=limits))
+                assert time.monotonic() - start < 10
+                assert not result and result.timed_out
+                time.sleep(0.2)
+                child = int(pid_file.read_text())
+                assert not is_running(child), f"Child of TeX survived the timeout ({run})"
+        finally:
+            os.environ['PATH'] = saved_path
+            os.environ.pop('FAKE_TEX_HANG', None)
+
+    print("✓ Timeout kills the whole process group")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Compile Limits Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Parse Size", test_parse_size),
+        ("Adaptive Timeout", test_adaptive_timeout),
+        ("Limits Applied", test_limits_applied),
+        ("Process Group Kill", test_timeout_kills_process_group),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
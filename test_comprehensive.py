@@ -121,6 +121,27 @@ def test_nested_lists():
         print("✗ Nested list test failed - missing nested itemize end")
         return False
     
+    # Each level is indented by four more spaces, without blank lines
+    deep = BeautifulSoup('<ol><li>A<ul><li>B<br/>C<ol><li>D</li></ol></li></ul></li></ol>', 'html.parser')
+    expected = (
+        "\\begin{enumerate}\n"
+        "    \\item A\n"
+        "    \\begin{itemize}\n"
+        "        \\item B\\\\\n"
+        "    C\n"
+        "        \\begin{enumerate}\n"
+        "            \\item D\n"
+        "        \\end{enumerate}\n"
+        "    \\end{itemize}\n"
+        "\\end{enumerate}\n\n"
+    )
+    result = converter._convert_list(deep.find('ol'))
+    if result != expected:
+        print("✗ Nested list test failed - wrong indentation")
+        print(f"  Expected: {expected!r}")
+        print(f"  Got:      {result!r}")
+        return False
+    
     print("✓ Nested lists work correctly")
     return True
 
@@ -191,6 +212,82 @@ def test_table_with_caption():
     return True
 
 
+def test_large_table_longtable():
+    """Test that large tables become a longtable with a repeated header"""
+    converter = EPUBToLaTeXConverter('dummy.epub', longtable_threshold=3)
+    
+    rows = ''.join(f'<tr><td>Row {i}</td><td>{i}</td></tr>' for i in range(5))
+    html_input = f'''
+    <table>
+        <caption>Big Table</caption>
+        <thead><tr><th>Name</th><th>Value</th></tr></thead>
+        <tbody>{rows}</tbody>
+    </table>
+    '''
+    
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_input, 'html.parser')
+    result = converter._convert_table(soup.find('table'))
+    
+    if r'\begin{longtable}{|l|l|}' not in result or r'\begin{table}' in result:
+        print("✗ Large table test failed - expected a longtable")
+        return False
+    if result.count('Name & Value') != 2 or r'\endhead' not in result:
+        print("✗ Large table test failed - header not repeated")
+        return False
+    if r'\caption{Big Table}\\' not in result or result.count('Row ') != 5:
+        print("✗ Large table test failed - caption or rows missing")
+        return False
+    
+    # Below the threshold, the table keeps its float
+    small = BeautifulSoup('<table><tr><td>A</td></tr><tr><td>B</td></tr></table>', 'html.parser')
+    if r'\begin{tabular}' not in converter._convert_table(small.find('table')):
+        print("✗ Large table test failed - small table not a tabular")
+        return False
+    
+    print("✓ Large tables use longtable")
+    return True
+
+
+def test_nested_table_rows():
+    """Test that the rows of a nested table are not pulled into the outer one"""
+    converter = EPUBToLaTeXConverter('dummy.epub')
+    
+    html_input = '''
+    <table>
+        <tr><td>Outer 1</td><td><table><tr><td>Inner</td></tr></table></td></tr>
+        <tr><td>Outer 2</td><td>Plain</td></tr>
+    </table>
+    '''
+    
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html_input, 'html.parser')
+    rows = converter._table_rows(soup.find('table'))
+    
+    if [row.find('td').get_text() for row in rows] != ['Outer 1', 'Outer 2']:
+        print("✗ Nested table test failed - inner rows collected")
+        return False
+    
+    # The inner table is a bare tabular inside the cell, never a float or a longtable
+    converter.longtable_threshold = 0
+    result = converter._convert_table(soup.find('table'))
+    if result.count(r'\begin{longtable}') != 1 or result.count(r'\begin{tabular}') != 1:
+        print("✗ Nested table test failed - inner table not a bare tabular")
+        return False
+    converter.longtable_threshold = 100
+    result = converter._convert_table(soup.find('table'))
+    inner = result[result.index(r'\begin{tabular}', result.index('Outer 1')):]
+    if result.count(r'\begin{table}') != 1 or r'\begin{table}' in inner:
+        print("✗ Nested table test failed - float inside a tabular cell")
+        return False
+    if not inner.startswith(r'\begin{tabular}{|l|}') or 'Inner' not in inner:
+        print("✗ Nested table test failed - inner table missing")
+        return False
+    
+    print("✓ Nested table rows stay in the nested table")
+    return True
+
+
 def test_page_breaks():
     """Test that page breaks are added for chapters and sections"""
     converter = EPUBToLaTeXConverter('dummy.epub')
@@ -298,6 +395,8 @@ def main():
         ("Nested Lists", test_nested_lists),
         ("HTML5 Semantic Tags", test_semantic_html5_tags),
         ("Tables with Captions", test_table_with_caption),
+        ("Large Tables", test_large_table_longtable),
+        ("Nested Tables", test_nested_table_rows),
         ("Page Breaks", test_page_breaks),
         ("Error Handling", test_error_handling),
         ("Comprehensive EPUB Conversion", test_comprehensive_epub_conversion),
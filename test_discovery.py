@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for recursive EPUB discovery in directory mode
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import iter_epub_files, process_directory
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Discovery')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def make_tree(root):
+    """
+    root/
+        a.epub
+        B.EPUB
+        c.Epub
+        notes.txt
+        fiction/d.epub
+        fiction/drafts/e.epub
+    """
+    root = Path(root)
+    (root / 'fiction' / 'drafts').mkdir(parents=True)
+    for name in ('a.epub', 'B.EPUB', 'c.Epub', 'fiction/d.epub', 'fiction/drafts/e.epub'):
+        (root / name).write_bytes(b'')
+    (root / 'notes.txt').write_text('not a book')
+    return root
+
+
+def relative_names(root, paths):
+    return [p.relative_to(root).as_posix() for p in paths]
+
+
+def test_recursive_case_insensitive():
+    """Test that discovery recurses and matches .epub in any case"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = make_tree(tmpdir)
+        found = relative_names(root, iter_epub_files(root))
+        assert found == ['B.EPUB', 'a.epub', 'c.Epub', 'fiction/d.epub', 'fiction/drafts/e.epub'], found
+
+        top = relative_names(root, iter_epub_files(root, recursive=False))
+        assert top == ['B.EPUB', 'a.epub', 'c.Epub'], top
+
+    print("✓ Recursive, case-insensitive discovery")
+    return True
+
+
+def test_include_exclude():
+    """Test include and exclude globs"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = make_tree(tmpdir)
+        found = relative_names(root, iter_epub_files(root, exclude=['drafts']))
+        assert 'fiction/drafts/e.epub' not in found and 'fiction/d.epub' in found, found
+
+        found = relative_names(root, iter_epub_files(root, include=['fiction/*']))
+        assert found == ['fiction/d.epub', 'fiction/drafts/e.epub'], found
+
+        found = relative_names(root, iter_epub_files(root, include=['*.epub'], exclude=['a.*']))
+        assert found == ['fiction/d.epub', 'fiction/drafts/e.epub'], found
+
+    print("✓ Include and exclude globs")
+    return True
+
+
+def test_symlink_policies():
+    """Test the symlink policies, including a directory loop"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = Path(tmpdir) / 'root'
+        root.mkdir()
+        outside = Path(tmpdir) / 'outside'
+        (outside / 'sub').mkdir(parents=True)
+        (outside / 'linked.epub').write_bytes(b'')
+        (outside / 'sub' / 'deep.epub').write_bytes(b'')
+
+        (root / 'file_link.epub').symlink_to(outside / 'linked.epub')
+        (root / 'dir_link').symlink_to(outside / 'sub')
+        (root / 'loop').symlink_to(root)
+
+        files = relative_names(root, iter_epub_files(root, symlinks='files'))
+        assert files == ['file_link.epub'], files
+
+        follow = relative_names(root, iter_epub_files(root, symlinks='follow'))
+        assert follow == ['file_link.epub', 'dir_link/deep.epub'], follow
+
+        ignore = relative_names(root, iter_epub_files(root, symlinks='ignore'))
+        assert ignore == [], ignore
+
+    print("✓ Symlink policies")
+    return True
+
+
+def test_iter_is_lazy():
+    """Test that discovery yields before the whole tree has been walked"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        root = make_tree(tmpdir)
+        it = iter_epub_files(root)
+        first = next(it)
+        assert first.name == 'B.EPUB'
+        # Subdirectories are only read when reached, so later additions are seen
+        (root / 'fiction' / 'late.epub').write_bytes(b'')
+        rest = relative_names(root, it)
+        assert 'fiction/late.epub' in rest, rest
+
+    print("✓ Discovery is lazy")
+    return True
+
+
+def test_output_mirrors_input_tree():
+    """Test that process_directory mirrors the input tree in the output directory"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'library'
+        output_dir = Path(tmpdir) / 'output'
+        (input_dir / 'fiction').mkdir(parents=True)
+        create_test_epub(str(input_dir / 'top.epub'))
+        create_test_epub(str(input_dir / 'fiction' / 'novel.EPUB'))
+
+        successful, failed = process_directory(str(input_dir), output_dir=str(output_dir))
+        assert (successful, failed) == (2, 0), f"Got {successful} successful, {failed} failed"
+        assert (output_dir / 'top.tex').exists()
+        assert (output_dir / 'fiction' / 'novel.tex').exists()
+
+    print("✓ Output mirrors input tree")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Directory Discovery Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Recursive Case-Insensitive", test_recursive_case_insensitive),
+        ("Include/Exclude", test_include_exclude),
+        ("Symlink Policies", test_symlink_policies),
+        ("Lazy Iteration", test_iter_is_lazy),
+        ("Mirrored Output", test_output_mirrors_input_tree),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for draft-mode passes in compile_latex()
+"""
+
+import os
+import sys
+import stat
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import compile_latex
+
+
+# Fake TeX engine: records its arguments, writes the .aux and asks for
+# RERUNS reruns; draft passes (-draftmode, -no-pdf) write no PDF
+FAKE_COMPILER = '''#!/bin/sh
+[ "$1" = "--version" ] && exit 0
+draft=
+for last; do
+  case "$last" in -draftmode) draft=pdf;; -no-pdf) draft=xdv;; esac
+done
+job="${last%.tex}"
+echo "$*" >> "$job.passes"
+count=$(wc -l < "$job.passes")
+if [ $count -le "$RERUNS" ]; then
+  echo "LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right." > "$job.log"
+else
+  echo "Output written on $job.pdf (1 page)." > "$job.log"
+fi
+echo '\\\\relax' > "$job.aux"
+if [ "$draft" = xdv ]; then touch "$job.xdv"; elif [ -z "$draft" ]; then date > "$job.pdf"; fi
+'''
+
+
+def run_fake_compile(compiler_name, reruns=0, draft=True, fresh=True):
+    """Compile a dummy document with the fake engine, return (result, pass argument lists, files)"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            compiler = Path(tmpdir) / compiler_name
+            compiler.write_text(FAKE_COMPILER)
+            compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+            os.environ['PATH'] = f"{tmpdir}{os.pathsep}{saved_path}"
+            os.environ['RERUNS'] = str(reruns)
+
+            tex_path = Path(tmpdir) / 'book.tex'
+            tex_path.write_text('\\documentclass{article}\\begin{document}x\\end{document}\n')
+            if not fresh:
+                tex_path.with_suffix('.aux').write_text('\\relax\n')
+            result = compile_latex(str(tex_path), compiler=compiler_name, draft=draft)
+            passes = [line.split() for line in (Path(tmpdir) / 'book.passes').read_text().splitlines()]
+            files = {p.name for p in Path(tmpdir).iterdir()}
+        finally:
+            os.environ['PATH'] = saved_path
+            os.environ.pop('RERUNS', None)
+    return result, passes, files
+
+
+def test_fresh_build_drafts_first_pass():
+    """Test that only the first pass of a fresh build runs in draft mode"""
+    for compiler, flag in (('pdflatex', '-draftmode'), ('lualatex', '-draftmode'), ('xelatex', '-no-pdf')):
+        result, passes, files = run_fake_compile(compiler)
+        assert result and result.passes == 2, (compiler, passes)
+        assert flag in passes[0] and flag not in passes[1], (compiler, passes)
+        assert passes[0][-1] == 'book.tex'
+        assert 'book.xdv' not in files, "Draft output left behind"
+
+    # Reruns after the draft are real passes, up to max_passes
+    result, passes, files = run_fake_compile('pdflatex', reruns=2)
+    assert result and len(passes) == 3
+    assert ['-draftmode' in args for args in passes] == [True, False, False]
+
+    print("✓ First pass of a fresh build is a draft")
+    return True
+
+
+def test_no_draft():
+    """Test that rebuilds, draft=False and unknown engines never use draft mode"""
+    for kwargs in ({'fresh': False}, {'draft': False}):
+        result, passes, _ = run_fake_compile('pdflatex', **kwargs)
+        assert result and not any('-draftmode' in args for args in passes), (kwargs, passes)
+    # A rebuild takes no more passes than with drafts
+    assert len(run_fake_compile('pdflatex', fresh=False)[1]) == 1
+
+    result, passes, _ = run_fake_compile('tectonic')
+    assert result and len(passes) == 2
+    assert not any(arg in ('-draftmode', '-no-pdf') for args in passes for arg in args)
+
+    print("✓ Draft mode only when a rerun is certain")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Draft Pass Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Fresh Build", test_fresh_build_drafts_first_pass),
+        ("No Draft", test_no_draft),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
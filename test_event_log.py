@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the structured event log (--log-json, --quiet)
+"""
+
+import io
+import os
+import sys
+import json
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import epub2tex
+from epub2tex import (EPUBToLaTeXConverter, EventLog, ConsoleSink, events,
+                      configure_events, process_directory)
+
+
+class ListSink:
+    """Collects events in memory"""
+
+    def __init__(self, level=10):
+        self.level = level
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Events')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def test_event_fields():
+    """Test levels, book IDs, stages and durations"""
+    sink = ListSink()
+    log = EventLog([sink])
+    with log.book('a.epub'):
+        with log.stage('read', "Reading"):
+            log.warning('read', "Odd file", item='x')
+    log.error('batch', "Failed")
+
+    start, warning, finished, error = sink.events
+    assert (start['level'], start['stage'], start['book']) == ('info', 'read', 'a.epub')
+    assert warning['item'] == 'x' and warning['level'] == 'warning'
+    assert finished['level'] == 'debug' and finished['duration'] >= 0
+    assert error['book'] is None, "Book ID leaked out of its block"
+
+    print("✓ Events carry level, book, stage and duration")
+    return True
+
+
+def test_console_levels():
+    """Test console rendering and level filtering"""
+    stream = io.StringIO()
+    log = EventLog([ConsoleSink(stream)])
+    log.debug('read', "hidden")
+    log.success('convert', "Done")
+    log.warning('images', "No images")
+    log.info('convert', "Output: x.tex", detail=True)
+    assert stream.getvalue() == "✓ Done\n⚠ Warning: No images\n  Output: x.tex\n", stream.getvalue()
+
+    print("✓ Console sink renders markers and filters levels")
+    return True
+
+
+def test_json_lines_and_quiet():
+    """Test that a batch run writes JSON lines and nothing to the console"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        create_test_epub(str(input_dir / 'one.epub'))
+        (input_dir / 'broken.epub').write_bytes(b'not a zip file')
+        log_path = Path(tmpdir) / 'events.jsonl'
+
+        stdout = io.StringIO()
+        try:
+            configure_events(json_log=str(log_path), quiet=True)
+            with redirect_stdout(stdout):
+                result = process_directory(str(input_dir), output_dir=str(Path(tmpdir) / 'out'))
+        finally:
+            configure_events()
+
+        assert result == (1, 1)
+        assert stdout.getvalue() == '', f"Quiet mode printed: {stdout.getvalue()!r}"
+
+        records = [json.loads(line) for line in log_path.read_text(encoding='utf-8').splitlines()]
+        books = {r['book'] for r in records if r['book']}
+        assert books == {'one.epub', 'broken.epub'}, books
+        assert any(r['level'] == 'error' and r['book'] == 'broken.epub' for r in records)
+        stages = {r['stage'] for r in records if 'duration' in r}
+        assert {'read', 'convert', 'book'} <= stages, stages
+        summary = [r for r in records if r.get('successful') is not None]
+        assert summary and summary[-1]['failed'] == 1
+
+    print("✓ JSON-lines log written, console silent")
+    return True
+
+
+def test_no_sinks_is_silent():
+    """Test library use with all sinks removed"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        stdout = io.StringIO()
+        saved = events.sinks
+        try:
+            events.set_sinks([])
+            with redirect_stdout(stdout):
+                assert EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'book.tex')).convert()
+        finally:
+            events.set_sinks(saved)
+        assert stdout.getvalue() == ''
+
+    print("✓ No output without sinks")
+    return True
+
+
+def test_compile_exit_status():
+    """Test the exit status of a single-file --compile run"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        saved_argv, saved_compile = sys.argv, epub2tex.compile_latex
+        codes = []
+        try:
+            for compiled in (True, False):
+                epub2tex.compile_latex = lambda *args, **kwargs: compiled
+                sys.argv = ['epub2tex.py', epub_path, os.path.join(tmpdir, 'book.tex'),
+                            '--compile', '--quiet']
+                try:
+                    epub2tex.main()
+                except SystemExit as e:
+                    codes.append(e.code)
+        finally:
+            sys.argv, epub2tex.compile_latex = saved_argv, saved_compile
+            configure_events()
+        assert codes == [0, 1], codes
+
+    print("✓ Exit status follows the compilation result")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Event Log Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Event Fields", test_event_fields),
+        ("Console Levels", test_console_levels),
+        ("JSON Lines and Quiet", test_json_lines_and_quiet),
+        ("No Sinks", test_no_sinks_is_silent),
+        ("Compile Exit Status", test_compile_exit_status),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the background image writes overlapping text conversion
+"""
+
+import io
+import os
+import sys
+import tempfile
+import threading
+from pathlib import Path
+from PIL import Image
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter
+
+
+class GatedConverter(EPUBToLaTeXConverter):
+    """Converter whose image writes wait until the text conversion has started"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.text_started = threading.Event()
+        self.overlapped = []
+
+    def _write_image(self, path, item):
+        self.overlapped.append(self.text_started.wait(timeout=10))
+        return super()._write_image(path, item)
+
+    def _convert_html_to_latex(self, html_content):
+        self.text_started.set()
+        return super()._convert_html_to_latex(html_content)
+
+
+class BrokenImageConverter(EPUBToLaTeXConverter):
+    """Converter that cannot write any image"""
+
+    def _write_image(self, path, item):
+        raise OSError('disk full')
+
+
+def create_test_epub(epub_path, count=3):
+    """Create an EPUB with count images referenced from one chapter"""
+    book = epub.EpubBook()
+    book.set_identifier('image-writes-test')
+    book.set_title('Test Image Writes')
+    book.set_language('en')
+
+    body = ''
+    for i in range(count):
+        buffer = io.BytesIO()
+        Image.new('RGB', (20, 20), color=(i * 60, 0, 0)).save(buffer, 'PNG')
+        image = epub.EpubImage()
+        image.file_name = f'img_{i}.png'
+        image.content = buffer.getvalue()
+        book.add_item(image)
+        body += f'<p>Picture {i}</p><img src="img_{i}.png" alt="Picture {i}"/>'
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = f'<html><body><h1>Pictures</h1>{body}</body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def test_writes_overlap_conversion():
+    """Test that images are written while the text is converted, and waited for"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path)
+
+        converter = GatedConverter(epub_path, os.path.join(tmpdir, 'book.tex'))
+        assert converter.convert()
+        assert converter.overlapped == [True] * 3, "Image writes did not overlap text conversion"
+
+        images = sorted((Path(tmpdir) / 'images').iterdir())
+        assert [p.name for p in images] == [f'image_{i}_img_{i}.png' for i in range(3)]
+        tex = Path(tmpdir, 'book.tex').read_text()
+        assert tex.count('\\includegraphics') == 3
+        image_bytes = sum(p.stat().st_size for p in images)
+        assert converter.bytes_written == image_bytes + len(tex.encode('utf-8'))
+
+    print("✓ Image writes overlap text conversion")
+    return True
+
+
+def test_failed_writes_reported():
+    """Test that failed image writes only cost the images"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path)
+
+        converter = BrokenImageConverter(epub_path, os.path.join(tmpdir, 'book.tex'))
+        assert converter.convert()
+        assert converter._image_pool is None, "Image pool left running"
+        assert not list((Path(tmpdir) / 'images').iterdir())
+        assert 'Picture 2' in Path(tmpdir, 'book.tex').read_text()
+
+    print("✓ Failed image writes reported")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Background Image Write Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Overlap", test_writes_overlap_conversion),
+        ("Failed Writes", test_failed_writes_reported),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for incremental (--update) conversion of changed chapters only
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter
+
+
+def create_test_epub(epub_path, texts):
+    """Create an EPUB with one XHTML file per entry of texts"""
+    book = epub.EpubBook()
+    book.set_identifier('test-update-001')
+    book.set_title('Test Incremental Update')
+    book.set_language('en')
+    book.add_author('Test Author')
+
+    items = []
+    for i, text in enumerate(texts, 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = f'<html><body><h1>Chapter {i}</h1><p>{text}</p></body></html>'
+        book.add_item(chapter)
+        items.append(chapter)
+
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def chapter_mtimes(chapters_dir):
+    """Map chapter file name to its mtime_ns"""
+    return {f.name: f.stat().st_mtime_ns for f in chapters_dir.glob('*.tex')}
+
+
+def test_update_regenerates_only_changed_chapters():
+    """Test that --update rewrites the changed chapter and nothing else"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = Path(tmpdir) / 'out' / 'book.tex'
+        chapters_dir = output_path.parent / 'chapters'
+
+        create_test_epub(epub_path, ['First text.', 'Second text.', 'Third text.'])
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), update=True)
+        assert converter.convert(), "Initial conversion failed"
+        assert converter.chapters_reused == 0
+
+        before = chapter_mtimes(chapters_dir)
+        main_before = output_path.stat().st_mtime_ns
+        time.sleep(0.05)
+
+        # Correct a typo in the second chapter only
+        create_test_epub(epub_path, ['First text.', 'Second text, fixed.', 'Third text.'])
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), update=True)
+        assert converter.convert(), "Update conversion failed"
+
+        after = chapter_mtimes(chapters_dir)
+        changed = sorted(name for name in after if after[name] != before.get(name))
+        assert len(changed) == 1, f"Expected one rewritten chapter, got {changed}"
+        assert 'Second text, fixed.' in (chapters_dir / changed[0]).read_text(encoding='utf-8')
+        assert converter.chapters_written == 1
+        assert output_path.stat().st_mtime_ns == main_before, "Main file rewritten without changes"
+
+        print(f"✓ Update rewrote only {changed[0]}")
+        return True
+
+
+def test_update_removes_stale_chapters():
+    """Test that chapters dropped from the book are removed"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = Path(tmpdir) / 'book.tex'
+        chapters_dir = output_path.parent / 'chapters'
+
+        create_test_epub(epub_path, ['One.', 'Two.', 'Three.'])
+        assert EPUBToLaTeXConverter(epub_path, str(output_path), update=True).convert()
+        count_before = len(list(chapters_dir.glob('*.tex')))
+
+        create_test_epub(epub_path, ['One.', 'Two.'])
+        assert EPUBToLaTeXConverter(epub_path, str(output_path), update=True).convert()
+        count_after = len(list(chapters_dir.glob('*.tex')))
+
+        assert count_after == count_before - 1, f"Expected {count_before - 1} chapters, found {count_after}"
+        main_tex = output_path.read_text(encoding='utf-8')
+        for chapter_file in chapters_dir.glob('*.tex'):
+            assert f"\\include{{chapters/{chapter_file.stem}}}" in main_tex
+
+        print("✓ Stale chapters removed")
+        return True
+
+
+def test_update_invalidated_by_mapping_change():
+    """Test that changing class mappings regenerates every chapter"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = Path(tmpdir) / 'book.tex'
+
+        create_test_epub(epub_path, ['One.', 'Two.'])
+        assert EPUBToLaTeXConverter(epub_path, str(output_path), update=True).convert()
+
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), update=True)
+        converter.class_mapping['custom'] = ('\\textsc{', '}')
+        assert converter.convert()
+        assert converter.chapters_reused == 0, "Chapters reused despite a mapping change"
+
+        print("✓ Mapping change invalidates cached chapters")
+        return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Incremental Update Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Only Changed Chapters", test_update_regenerates_only_changed_chapters),
+        ("Stale Chapters Removed", test_update_removes_stale_chapters),
+        ("Mapping Change Invalidates", test_update_invalidated_by_mapping_change),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the intermediate representation (IR) and its disk cache
+"""
+
+import os
+import sys
+import marshal
+import tempfile
+from pathlib import Path
+from bs4 import BeautifulSoup
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import epub2tex
+from epub2tex import EPUBToLaTeXConverter, IRElement, IRString
+
+
+HTML = '''<html><body>
+<h1 class="center">Title</h1>
+<p class="important">Bold <b>and</b> <!-- hidden --> escaped &amp; text.</p>
+<pre>code <!-- not text --> here</pre>
+<table><thead><tr><th>H</th></tr></thead><tr class="highlight-row"><td>1</td></tr></table>
+<ul><li>One<ol><li>Nested</li></ol></li></ul>
+<a href="https://example.org">link</a>
+</body></html>'''
+
+
+def create_test_epub(epub_path):
+    """Create a two-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier('ir-test')
+    book.set_title('Test IR')
+    book.set_language('en')
+
+    items = []
+    for i in range(2):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = HTML.replace('Title', f'Title {i}')
+        book.add_item(chapter)
+        items.append(chapter)
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+
+
+def test_ir_renders_like_bs4():
+    """Test that rendering the IR gives the same LaTeX as rendering the bs4 tree"""
+    converter = EPUBToLaTeXConverter('dummy.epub')
+    body = BeautifulSoup(HTML, 'lxml').find('body')
+    ir = IRElement.from_tag(body)
+
+    assert converter._convert_element(ir) == converter._convert_element(body)
+    assert ir.find('pre').get_text() == body.find('pre').get_text(), "Comment leaked into get_text()"
+    assert any(isinstance(node, IRString) for node in ir.find('p').children)
+    assert ir.find('p').get('class') == ['important']
+    assert ir.find('a').get('href') == 'https://example.org'
+
+    # Round trip through the marshal form
+    restored = IRElement.from_tuple(marshal.loads(marshal.dumps(ir.to_tuple())))
+    assert converter._convert_element(restored) == converter._convert_element(ir)
+
+    print("✓ IR renders like the bs4 tree")
+    return True
+
+
+def test_cached_ir_skips_parsing():
+    """Test that a second conversion renders from the cache without parsing HTML"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        cache_dir = os.path.join(tmpdir, 'cache')
+        create_test_epub(epub_path)
+
+        first = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'a', 'book.tex'), ir_cache=cache_dir)
+        assert first.convert()
+        assert (first.ir_cache_hits, first.ir_cache_misses) == (0, 3)
+        assert len(list(Path(cache_dir).glob('*.ir'))) == 3
+
+        def no_parsing(*args, **kwargs):
+            raise AssertionError("HTML parsed despite the cache")
+
+        saved = epub2tex.BeautifulSoup
+        epub2tex.BeautifulSoup = no_parsing
+        try:
+            second = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'b', 'book.tex'), ir_cache=cache_dir)
+            assert second.convert()
+            assert second.ir_cache_hits == 3
+
+            # Other class mappings are applied to the cached IR
+            restyled = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'c', 'book.tex'), ir_cache=cache_dir)
+            restyled.class_mapping['important'] = ('\\textsc{', '}')
+            assert restyled.convert()
+        finally:
+            epub2tex.BeautifulSoup = saved
+
+        a = (Path(tmpdir) / 'a' / 'book.tex').read_text()
+        assert (Path(tmpdir) / 'b' / 'book.tex').read_text() == a
+        assert '\\textsc{Bold' in (Path(tmpdir) / 'c' / 'book.tex').read_text()
+
+    print("✓ Cached IR re-rendered without parsing")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("IR and IR Cache Tests")
+    print("=" * 60)
+
+    tests = [
+        ("IR Rendering", test_ir_renders_like_bs4),
+        ("IR Cache", test_cached_ir_skips_parsing),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
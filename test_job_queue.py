@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the SQLite-backed batch job queue
+"""
+
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import epub2tex
+from epub2tex import JobQueue, enqueue_directory, run_queue_worker
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Queue')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def make_input_dir(tmpdir):
+    """Two valid EPUBs and one corrupt file"""
+    input_dir = Path(tmpdir) / 'epubs'
+    input_dir.mkdir()
+    create_test_epub(str(input_dir / 'good_1.epub'))
+    create_test_epub(str(input_dir / 'good_2.epub'))
+    (input_dir / 'broken.epub').write_bytes(b'not a zip file')
+    return input_dir
+
+
+def test_enqueue_and_work():
+    """Test that a worker drains the queue and records outcomes"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        output_dir = Path(tmpdir) / 'output'
+        db_path = str(Path(tmpdir) / 'jobs.db')
+
+        assert enqueue_directory(db_path, str(input_dir), output_dir=str(output_dir)) == 3
+        assert enqueue_directory(db_path, str(input_dir), output_dir=str(output_dir)) == 0, \
+            "Re-enqueueing duplicated jobs"
+
+        assert run_queue_worker(db_path) == (2, 1)
+        assert (output_dir / 'good_1.tex').exists()
+        assert (output_dir / 'good_2.tex').exists()
+
+        queue = JobQueue(db_path)
+        assert queue.counts() == {'done': 2, 'failed': 1}
+        failures = queue.failures()
+        assert failures[0]['epub_path'].endswith('broken.epub')
+        assert failures[0]['error'], "Error text not recorded"
+        assert failures[0]['duration'] is not None, "Duration not recorded"
+        queue.close()
+
+        # A restarted worker has nothing left to do
+        assert run_queue_worker(db_path) == (0, 0)
+
+    print("✓ Worker drains queue and records success and failure")
+    return True
+
+
+def test_retry_failed_selectively():
+    """Test that failed jobs can be requeued by pattern"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        enqueue_directory(db_path, str(input_dir), output_dir=str(Path(tmpdir) / 'output'))
+        run_queue_worker(db_path)
+
+        queue = JobQueue(db_path)
+        assert queue.retry('*/good_*') == 0, "Retried jobs that did not fail"
+        assert queue.retry('*/broken.epub') == 1
+        assert queue.counts() == {'done': 2, 'pending': 1}
+        job = queue.lease('test-worker')
+        assert job['epub_path'].endswith('broken.epub')
+        assert job['attempts'] == 1, "Attempt count lost on retry"
+        queue.close()
+
+    print("✓ Failed jobs retried selectively")
+    return True
+
+
+def test_expired_lease_is_resumed():
+    """Test that jobs of a crashed worker are leased again after the lease expires"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        queue = JobQueue(db_path, lease_seconds=0.2)
+        queue.enqueue([('/books/a.epub', '/out/a.tex', {})])
+
+        job = queue.lease('crashed-worker')
+        assert job is not None
+        assert queue.lease('other-worker') is None, "Leased job handed out twice"
+
+        time.sleep(0.3)
+        resumed = queue.lease('other-worker')
+        assert resumed is not None and resumed['id'] == job['id'], "Expired lease not resumed"
+
+        # The crashed worker can no longer report on the job
+        assert not queue.heartbeat(job['id'], 'crashed-worker')
+        assert not queue.complete(job['id'], 'crashed-worker', True, 1.0)
+        assert queue.complete(job['id'], 'other-worker', True, 1.0)
+        assert queue.counts() == {'done': 1}
+        queue.close()
+
+    print("✓ Expired leases are resumed by other workers")
+    return True
+
+
+def test_lost_leases_capped():
+    """Test that a job whose worker keeps dying is failed after max_attempts leases"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        queue = JobQueue(db_path, lease_seconds=0.1, max_attempts=2)
+        queue.enqueue([('/books/huge.epub', '/out/huge.tex', {})])
+
+        assert queue.lease('killed-1') is not None
+        time.sleep(0.2)
+        assert queue.lease('killed-2') is not None
+        time.sleep(0.2)
+        assert queue.lease('next-worker') is None, "Job leased beyond max_attempts"
+        assert queue.counts() == {'failed': 1}
+        failure = queue.failures()[0]
+        assert failure['attempts'] == 2 and 'Lease expired' in failure['error'], failure
+        queue.close()
+
+    print("✓ Lost leases capped by max_attempts")
+    return True
+
+
+def test_path_options_stored_absolute():
+    """Test that path options are resolved before they are queued"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        cwd = os.getcwd()
+        try:
+            os.chdir(tmpdir)
+            enqueue_directory(db_path, 'epubs', ir_cache='cache', profile_dir='profiles')
+        finally:
+            os.chdir(cwd)
+
+        queue = JobQueue(db_path)
+        options = queue.lease('test-worker')['options']
+        queue.close()
+        assert options['ir_cache'] == str(Path(tmpdir, 'cache').resolve()), options
+        assert options['profile_dir'] == str(Path(tmpdir, 'profiles').resolve()), options
+
+    print("✓ Path options stored as absolute paths")
+    return True
+
+
+def test_taken_over_job_not_counted():
+    """Test that a worker whose job was re-leased elsewhere does not count it"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        create_test_epub(str(input_dir / 'slow.epub'))
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        enqueue_directory(db_path, str(input_dir), output_dir=str(Path(tmpdir) / 'output'))
+
+        def taken_over(*args, **kwargs):
+            # Meanwhile the lease expired and another worker got the job
+            queue = JobQueue(db_path)
+            queue.conn.execute("UPDATE jobs SET worker = 'other-worker'")
+            queue.close()
+            return True, None
+
+        saved = epub2tex._process_book
+        epub2tex._process_book = taken_over
+        try:
+            assert run_queue_worker(db_path, worker='slow-worker') == (0, 0)
+        finally:
+            epub2tex._process_book = saved
+
+        queue = JobQueue(db_path)
+        assert queue.counts() == {'running': 1}, "Outcome recorded for a lost job"
+        queue.close()
+
+    print("✓ Taken-over jobs are left to their new worker")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Job Queue Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Enqueue and Work", test_enqueue_and_work),
+        ("Retry Failed", test_retry_failed_selectively),
+        ("Expired Lease", test_expired_lease_is_resumed),
+        ("Lost Leases Capped", test_lost_leases_capped),
+        ("Absolute Path Options", test_path_options_stored_absolute),
+        ("Taken-Over Job", test_taken_over_job_not_counted),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
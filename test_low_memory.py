@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the bounded-memory (--low-memory) conversion mode
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter
+
+
+def create_test_epub(epub_path, chapters, paragraphs=400):
+    """Create an EPUB with identical, reasonably large chapters"""
+    book = epub.EpubBook()
+    book.set_identifier('test-low-memory-001')
+    book.set_title('Test Low Memory')
+    book.set_language('en')
+    book.add_author('Test Author')
+
+    body = ''.join(f'<p><span class="note"><b>Word {j}</b> and some text.</span></p>'
+                   for j in range(paragraphs))
+    items = []
+    for i in range(1, chapters + 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:03d}.xhtml', lang='en')
+        chapter.content = f'<html><body><h1>Chapter {i}</h1>{body}</body></html>'
+        book.add_item(chapter)
+        items.append(chapter)
+
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def test_low_memory_output_unchanged():
+    """Test that low-memory mode produces the same LaTeX"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'), chapters=3, paragraphs=20)
+        normal_path = Path(tmpdir) / 'normal.tex'
+        low_path = Path(tmpdir) / 'low.tex'
+
+        assert EPUBToLaTeXConverter(epub_path, str(normal_path)).convert()
+        converter = EPUBToLaTeXConverter(epub_path, str(low_path), low_memory=True)
+        assert converter.convert()
+
+        assert normal_path.read_text(encoding='utf-8') == low_path.read_text(encoding='utf-8')
+        assert converter.peak_memory and converter.peak_memory > 0, "Peak memory not reported"
+
+        print(f"✓ Low-memory output identical (peak {converter.peak_memory} bytes)")
+        return True
+
+
+def test_peak_memory_tracks_largest_chapter():
+    """Test that peak memory does not grow with the number of chapters"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        small = create_test_epub(os.path.join(tmpdir, 'small.epub'), chapters=2)
+        large = create_test_epub(os.path.join(tmpdir, 'large.epub'), chapters=20)
+
+        peaks = {}
+        for name, path in (('small', small), ('large', large)):
+            converter = EPUBToLaTeXConverter(path, os.path.join(tmpdir, f'{name}.tex'), low_memory=True)
+            assert converter.convert()
+            peaks[name] = converter.peak_memory
+
+        # Ten times the chapters must not cost anywhere near ten times the memory
+        ratio = peaks['large'] / peaks['small']
+        assert ratio < 2, f"Peak memory grew {ratio:.1f}x for 10x the chapters"
+
+        print(f"✓ Peak memory ratio for 10x chapters: {ratio:.2f}")
+        return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Low-Memory Mode Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Output Unchanged", test_low_memory_output_unchanged),
+        ("Peak Tracks Largest Chapter", test_peak_memory_tracks_largest_chapter),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
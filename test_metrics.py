@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the Prometheus textfile metrics exporter (--metrics-file)
+"""
+
+import io
+import os
+import sys
+import time
+import asyncio
+import tempfile
+from contextlib import redirect_stderr
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import (MetricsSink, EventLog, events, configure_events,
+                      process_directory_async, enqueue_directory, run_queue_worker)
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Metrics')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def parse_metrics(path):
+    """Map 'name{labels}' to value, skipping comments"""
+    values = {}
+    for line in Path(path).read_text(encoding='utf-8').splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            values[name] = float(value)
+    return values
+
+
+def test_metrics_from_events():
+    """Test counters, histograms, cache ratio and queue depth"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'epub2tex.prom'
+        sink = MetricsSink(str(path), interval=3600)
+        log = EventLog([sink])
+        with log.stage('book') as summary:
+            summary.update(success=True, bytes_read=100, bytes_written=250, images=3)
+        log.debug('book', duration=7.0, success=False)
+        log.debug('compile', duration=0.2, success=True)
+        log.debug('cache', cache='chapters', hits=3, misses=1)
+        log.debug('queue', queue_depth=42)
+        sink.close()
+
+        m = parse_metrics(path)
+        assert m['epub2tex_books_total{status="converted"}'] == 1
+        assert m['epub2tex_books_total{status="failed"}'] == 1
+        assert m['epub2tex_conversion_duration_seconds_bucket{le="0.1"}'] == 1
+        assert m['epub2tex_conversion_duration_seconds_bucket{le="5"}'] == 1
+        assert m['epub2tex_conversion_duration_seconds_bucket{le="10"}'] == 2
+        assert m['epub2tex_conversion_duration_seconds_count'] == 2
+        assert m['epub2tex_compile_duration_seconds_bucket{le="0.25"}'] == 1
+        assert m['epub2tex_read_bytes_total'] == 100
+        assert m['epub2tex_written_bytes_total'] == 250
+        assert m['epub2tex_images_extracted_total'] == 3
+        assert m['epub2tex_cache_hit_ratio{cache="chapters"}'] == 0.75
+        assert m['epub2tex_queue_depth'] == 42
+        assert [p.name for p in Path(tmpdir).iterdir()] == ['epub2tex.prom'], "Temporary file left"
+
+    print("✓ Metrics derived from events")
+    return True
+
+
+def test_periodic_refresh_and_write_errors():
+    """Test rewrites without new events, and that write errors don't reach the caller"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = Path(tmpdir) / 'epub2tex.prom'
+        sink = MetricsSink(str(path), interval=0.05)
+        EventLog([sink]).debug('queue', queue_depth=1)
+        first = parse_metrics(path)['epub2tex_last_update_timestamp_seconds']
+        time.sleep(0.3)
+        # No event since, e.g. a worker stuck in a long TeX pass
+        assert parse_metrics(path)['epub2tex_last_update_timestamp_seconds'] > first
+        sink.close()
+
+        # The metrics directory can't be created: a file is in the way
+        blocker = Path(tmpdir) / 'not-a-dir'
+        blocker.write_text('')
+        stderr = io.StringIO()
+        with redirect_stderr(stderr):
+            sink = MetricsSink(str(blocker / 'epub2tex.prom'), interval=0.05)
+            log = EventLog([sink])
+            log.debug('book', duration=1.0, success=True)
+            time.sleep(0.2)
+            log.debug('book', duration=1.0, success=True)
+            sink.close()
+        assert stderr.getvalue().count('Cannot write metrics file') == 1, stderr.getvalue()
+
+    print("✓ Metrics refreshed periodically, write errors reported")
+    return True
+
+
+def test_metrics_across_worker_processes():
+    """Test that books converted in worker processes are counted"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        for i in range(3):
+            create_test_epub(str(input_dir / f'book_{i}.epub'))
+        (input_dir / 'broken.epub').write_bytes(b'not a zip file')
+        path = Path(tmpdir) / 'epub2tex.prom'
+
+        try:
+            configure_events(quiet=True, metrics_file=str(path))
+            result = asyncio.run(process_directory_async(
+                str(input_dir), output_dir=str(Path(tmpdir) / 'out'), jobs=2))
+            events.sinks[0].close()
+        finally:
+            configure_events()
+
+        assert result == (3, 1)
+        m = parse_metrics(path)
+        assert m['epub2tex_books_total{status="converted"}'] == 3
+        assert m['epub2tex_books_total{status="failed"}'] == 1
+        assert m['epub2tex_read_bytes_total'] > 0
+        assert m['epub2tex_written_bytes_total'] > 0
+        assert m['epub2tex_queue_depth'] == 0
+
+    print("✓ Worker process events reach the metrics file")
+    return True
+
+
+def test_metrics_in_queue_worker():
+    """Test that a long-running queue worker keeps the file current"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        for i in range(2):
+            create_test_epub(str(input_dir / f'book_{i}.epub'))
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        path = Path(tmpdir) / 'epub2tex.prom'
+        enqueue_directory(db_path, str(input_dir), output_dir=str(Path(tmpdir) / 'out'))
+
+        try:
+            # Interval 0: rewritten on every event, as a long run would be periodically
+            configure_events(quiet=True, metrics_file=str(path), metrics_interval=0)
+            assert run_queue_worker(db_path) == (2, 0)
+            m = parse_metrics(path)
+        finally:
+            configure_events()
+
+        assert m['epub2tex_books_total{status="converted"}'] == 2
+        assert m['epub2tex_queue_depth'] == 1, "Queue depth not reported before the last job"
+
+    print("✓ Queue worker exports metrics while running")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Metrics Exporter Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Metrics From Events", test_metrics_from_events),
+        ("Refresh and Write Errors", test_periodic_refresh_and_write_errors),
+        ("Worker Processes", test_metrics_across_worker_processes),
+        ("Queue Worker", test_metrics_in_queue_worker),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the feature-driven minimal preamble (--minimal-preamble)
+"""
+
+import os
+import re
+import sys
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, SourceMap
+
+
+NOVEL = ['<html><body><h1>Chapter One</h1><p>It was a <i>dark</i> and <b>stormy</b> night.</p></body></html>',
+         '<html><body><h1>Chapter Two</h1><p>The end &amp; more.</p></body></html>']
+
+RICH = ['<html><body><h1>Plain</h1><p>Nothing special.</p></body></html>',
+        '''<html><body><h1>Rich</h1>
+<p>A <mark>marked</mark> and <del>deleted</del> word, a <a href="https://example.org">link</a>.</p>
+<div class="box"><p>Boxed.</p></div>
+<table><tr class="highlight-row"><td>1</td></tr></table>
+</body></html>''']
+
+
+def create_test_epub(epub_path, chapters):
+    """Create an EPUB with one item per chapter"""
+    book = epub.EpubBook()
+    book.set_identifier('minimal-preamble-test')
+    book.set_title('Test Minimal Preamble')
+    book.set_language('en')
+
+    items = []
+    for i, content in enumerate(chapters, 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = content
+        book.add_item(chapter)
+        items.append(chapter)
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+
+
+def packages(tex):
+    """Packages loaded by a LaTeX document"""
+    return set(re.findall(r'\\usepackage(?:\[[^\]]*\])?\{([^}]*)\}', tex))
+
+
+def body(tex):
+    """Everything from \\begin{document} on"""
+    return tex[tex.index('\\begin{document}'):]
+
+
+def test_plain_novel():
+    """Test that a plain novel only gets the base packages, with an unchanged body"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path, NOVEL)
+        assert EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'full', 'book.tex')).convert()
+        converter = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'min', 'book.tex'),
+                                         minimal_preamble=True)
+        assert converter.convert()
+
+        full = Path(tmpdir, 'full', 'book.tex').read_text()
+        minimal = Path(tmpdir, 'min', 'book.tex').read_text()
+        assert body(minimal) == body(full)
+        assert converter.features == set(), converter.features
+        dropped = packages(full) - packages(minimal)
+        assert {'hyperref', 'mdframed', 'soul', 'colortbl', 'longtable', 'tabularx', 'fancyvrb',
+                'microtype', 'titlesec', 'xcolor', 'ulem', 'amsmath'} <= dropped, dropped
+        assert packages(minimal) == {'inputenc', 'fontenc', 'lmodern', 'babel', 'geometry', 'setspace'}
+
+    print("✓ Plain novel gets a minimal preamble")
+    return True
+
+
+def test_used_features_loaded():
+    """Test that each feature used pulls in its packages"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path, RICH)
+        output_path = os.path.join(tmpdir, 'book.tex')
+        converter = EPUBToLaTeXConverter(epub_path, output_path, minimal_preamble=True)
+        assert converter.convert()
+
+        assert {'highlight', 'color', 'strikeout', 'links', 'framed', 'rowcolor'} <= converter.features
+        tex = Path(output_path).read_text()
+        assert {'soul', 'xcolor', 'ulem', 'hyperref', 'mdframed', 'colortbl'} <= packages(tex), packages(tex)
+        assert '\\definecolor{highlightyellow}' in tex
+        assert 'longtable' not in packages(tex) and 'fancyvrb' not in packages(tex)
+
+    print("✓ Used features load their packages")
+    return True
+
+
+def test_update_keeps_features_of_reused_chapters():
+    """Test that chapters reused by --update still count for the preamble"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = os.path.join(tmpdir, 'out', 'book.tex')
+        create_test_epub(epub_path, RICH)
+        assert EPUBToLaTeXConverter(epub_path, output_path, update=True, minimal_preamble=True).convert()
+
+        create_test_epub(epub_path, [RICH[0].replace('Nothing', 'Still nothing'), RICH[1]])
+        converter = EPUBToLaTeXConverter(epub_path, output_path, update=True, minimal_preamble=True)
+        assert converter.convert()
+        assert converter.chapters_reused >= 1
+        assert {'mdframed', 'soul', 'colortbl'} <= packages(Path(output_path).read_text())
+
+    print("✓ Reused chapters keep their features")
+    return True
+
+
+def test_source_map_shifted():
+    """Test that source map lines account for the preamble written after the body"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = os.path.join(tmpdir, 'book.tex')
+        create_test_epub(epub_path, RICH)
+        assert EPUBToLaTeXConverter(epub_path, output_path, minimal_preamble=True,
+                                    source_map=True).convert()
+
+        lines = Path(output_path).read_text().split('\n')
+        number = next(i for i, line in enumerate(lines, 1) if 'Boxed.' in line)
+        location = SourceMap.load(Path(output_path).with_suffix('.srcmap.json')).lookup('book.tex', number)
+        assert location['item'] == 'chap_02.xhtml', location
+
+    print("✓ Source map lines shifted by the preamble")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Minimal Preamble Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Plain Novel", test_plain_novel),
+        ("Used Features", test_used_features_loaded),
+        ("Update Mode", test_update_keeps_features_of_reused_chapters),
+        ("Source Map", test_source_map_shifted),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for parallel chapter conversion within one book (--chapter-jobs)
+"""
+
+import os
+import sys
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter
+
+
+class FailingConverter(EPUBToLaTeXConverter):
+    """Converter that cannot convert items mentioning BOOM"""
+
+    def _convert_html_to_latex(self, html_content):
+        if 'BOOM' in html_content:
+            raise RuntimeError('boom')
+        return super()._convert_html_to_latex(html_content)
+
+
+def create_test_epub(epub_path, count=6, failing=None):
+    """Create an EPUB with count chapters"""
+    book = epub.EpubBook()
+    book.set_identifier('parallel-test')
+    book.set_title('Test Parallel Chapters')
+    book.set_language('en')
+
+    items = []
+    for i in range(count):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        text = 'BOOM' if i == failing else f'Text of chapter {i}.'
+        chapter.content = (f'<html><body><h1>Chapter {i}</h1><p class="important">{text}</p>'
+                           f'<ul><li>Item<ul><li>Nested {i}</li></ul></li></ul></body></html>')
+        book.add_item(chapter)
+        items.append(chapter)
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+
+
+def test_parallel_matches_serial():
+    """Test that parallel conversion writes exactly what serial conversion writes"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path)
+
+        for split in (False, True):
+            outputs = []
+            for jobs in (1, 3):
+                output_dir = Path(tmpdir) / f'out-{split}-{jobs}'
+                converter = EPUBToLaTeXConverter(epub_path, str(output_dir / 'book.tex'), split=split,
+                                                 chapter_jobs=jobs, source_map=True)
+                # Customized mappings must reach the workers
+                converter.class_mapping['important'] = ('\\textsc{', '}')
+                assert converter.convert()
+                files = sorted(p for p in output_dir.rglob('*') if p.is_file() and p.suffix != '.json')
+                outputs.append({p.relative_to(output_dir): p.read_bytes() for p in files})
+                outputs[-1]['map'] = (output_dir / 'book.srcmap.json').read_bytes()
+            assert outputs[0] == outputs[1], f"Parallel output differs (split={split})"
+            assert b'\\textsc{Text of chapter 5.}' in b''.join(outputs[1].values())
+
+    print("✓ Parallel conversion matches serial conversion")
+    return True
+
+
+def test_failed_item_reported():
+    """Test that an item failing in a worker is skipped like in serial mode"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path, failing=2)
+
+        converter = FailingConverter(epub_path, os.path.join(tmpdir, 'book.tex'), chapter_jobs=2)
+        assert converter.convert()
+        tex = Path(tmpdir, 'book.tex').read_text()
+        assert 'Chapter 1' in tex and 'Chapter 3' in tex
+        assert 'Chapter 2' not in tex, "Failed item was written"
+
+    print("✓ Failed items skipped")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Parallel Chapter Conversion Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Matches Serial", test_parallel_matches_serial),
+        ("Failed Item", test_failed_item_reported),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the built-in per-book profiler (--profile-dir)
+"""
+
+import os
+import sys
+import asyncio
+import pstats
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, process_directory_async, _collapsed_stacks
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Profiling')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Some <b>bold</b> text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def test_profile_written():
+    """Test that a profiled conversion writes readable pstats and folded stacks"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        profile_dir = Path(tmpdir) / 'profiles'
+        converter = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'book.tex'),
+                                         profile_dir=str(profile_dir))
+        assert converter.convert()
+
+        stats_files = list(profile_dir.glob('book-*.pstats'))
+        folded_files = list(profile_dir.glob('book-*.folded'))
+        assert len(stats_files) == 1 and len(folded_files) == 1, list(profile_dir.iterdir())
+
+        functions = {name for _, _, name in pstats.Stats(str(stats_files[0])).stats}
+        assert '_convert_element' in functions
+
+        lines = folded_files[0].read_text(encoding='utf-8').splitlines()
+        assert lines, "No collapsed stacks written"
+        for line in lines:
+            stack, value = line.rsplit(' ', 1)
+            assert int(value) >= 0 and stack
+        assert any('_convert_element' in line for line in lines)
+
+    print("✓ Profile written as .pstats and .folded")
+    return True
+
+
+def test_profile_threshold():
+    """Test that fast books are not kept when a threshold is set"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        profile_dir = Path(tmpdir) / 'profiles'
+        converter = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'book.tex'),
+                                         profile_dir=str(profile_dir), profile_threshold=3600)
+        assert converter.convert()
+        assert not profile_dir.exists() or not any(profile_dir.iterdir())
+
+    print("✓ Profiles below the threshold are dropped")
+    return True
+
+
+def test_profile_in_workers():
+    """Test that books converted in worker processes are profiled too"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        for i in range(3):
+            create_test_epub(str(input_dir / f'book_{i}.epub'))
+        profile_dir = Path(tmpdir) / 'profiles'
+
+        successful, failed = asyncio.run(process_directory_async(
+            str(input_dir), output_dir=str(Path(tmpdir) / 'output'), jobs=2,
+            profile_dir=str(profile_dir)))
+
+        assert (successful, failed) == (3, 0)
+        assert len(list(profile_dir.glob('*.pstats'))) == 3
+        assert len(list(profile_dir.glob('*.folded'))) == 3
+
+    print("✓ Worker processes write their own profiles")
+    return True
+
+
+def test_collapsed_stacks_split_time():
+    """Test that a shared callee's time is split between its callers"""
+    main = ('m.py', 1, 'main')
+    a = ('m.py', 2, 'a')
+    b = ('m.py', 3, 'b')
+    leaf = ('m.py', 4, 'leaf')
+    # func: (cc, nc, tottime, cumtime, callers{caller: (cc, nc, tottime, cumtime)})
+    stats = {
+        main: (1, 1, 0.0, 4.0, {}),
+        a: (1, 1, 0.0, 1.0, {main: (1, 1, 0.0, 1.0)}),
+        b: (1, 1, 0.0, 3.0, {main: (1, 1, 0.0, 3.0)}),
+        leaf: (2, 2, 4.0, 4.0, {a: (1, 1, 1.0, 1.0), b: (1, 1, 3.0, 3.0)}),
+    }
+    lines = dict(line.rsplit(' ', 1) for line in _collapsed_stacks(stats))
+    assert lines == {
+        'main (m.py:1);a (m.py:2);leaf (m.py:4)': '1000000',
+        'main (m.py:1);b (m.py:3);leaf (m.py:4)': '3000000',
+    }, lines
+
+    print("✓ Collapsed stacks split shared callees by caller")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Profiler Hook Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Profile Written", test_profile_written),
+        ("Profile Threshold", test_profile_threshold),
+        ("Profile In Workers", test_profile_in_workers),
+        ("Collapsed Stacks", test_collapsed_stacks_split_time),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
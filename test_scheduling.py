@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for cost-based longest-first batch scheduling (--longest-first)
+"""
+
+import os
+import sys
+import asyncio
+import sqlite3
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import (JobQueue, enqueue_directory, estimate_book_cost, events,
+                      predict_makespan, process_directory_async)
+
+
+class ListSink:
+    """Collects events in memory"""
+
+    def __init__(self, level=10):
+        self.level = level
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+
+def create_test_epub(epub_path, paragraphs=1):
+    """Create a one-chapter EPUB with the given number of paragraphs"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Scheduling')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    body = ''.join(f'<p>Paragraph {i} of a book.</p>' for i in range(paragraphs))
+    chapter.content = f'<html><body><h1>Chapter</h1>{body}</body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def make_input_dir(tmpdir):
+    """Books whose listing order is the reverse of their size"""
+    input_dir = Path(tmpdir) / 'epubs'
+    input_dir.mkdir()
+    create_test_epub(str(input_dir / 'a_small.epub'), 1)
+    create_test_epub(str(input_dir / 'b_medium.epub'), 200)
+    create_test_epub(str(input_dir / 'c_large.epub'), 2000)
+    return input_dir
+
+
+def test_cost_estimate():
+    """Test the signals read from the zip directory"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        small = estimate_book_cost(input_dir / 'a_small.epub')
+        large = estimate_book_cost(input_dir / 'c_large.epub')
+        assert large['xhtml_bytes'] > 50 * small['xhtml_bytes'], (small, large)
+        assert small['items'] == large['items'] > 0
+        assert large['cost'] > small['cost'] > 0
+
+        broken = Path(tmpdir) / 'broken.epub'
+        broken.write_bytes(b'not a zip file')
+        assert estimate_book_cost(broken)['cost'] == 0
+
+    print("✓ Book cost estimated from the zip directory")
+    return True
+
+
+def test_predicted_makespan():
+    """Test that starting the longest job first shortens the predicted tail"""
+    assert predict_makespan([1, 1, 1, 1, 4], 2) == 6
+    assert predict_makespan([4, 1, 1, 1, 1], 2) == 4
+    assert predict_makespan([3, 2], 1) == 5
+
+    print("✓ Makespan predicted")
+    return True
+
+
+def test_async_longest_first():
+    """Test that the orchestrator starts the expensive books first and reports the makespan"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        sink = ListSink()
+        saved = events.sinks
+        try:
+            events.set_sinks([sink])
+            result = asyncio.run(process_directory_async(
+                str(input_dir), output_dir=str(Path(tmpdir) / 'out'), jobs=1, longest_first=True))
+        finally:
+            events.set_sinks(saved)
+        assert result == (3, 0)
+
+        read_order = [e['book'] for e in sink.events if e.get('stage') == 'read' and 'duration' in e]
+        assert read_order == ['c_large.epub', 'b_medium.epub', 'a_small.epub'], read_order
+        schedule = [e for e in sink.events if e.get('stage') == 'schedule']
+        assert schedule[0]['books'] == 3
+        assert 'actual_makespan' in schedule[-1] and schedule[-1]['predicted_makespan'] > 0
+
+    print("✓ Most expensive book started first")
+    return True
+
+
+def test_queue_priority():
+    """Test that queue workers lease the most expensive books first"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = make_input_dir(tmpdir)
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        assert enqueue_directory(db_path, str(input_dir), longest_first=True) == 3
+
+        queue = JobQueue(db_path)
+        leased = [Path(queue.lease('w')['epub_path']).name for _ in range(3)]
+        queue.close()
+        assert leased == ['c_large.epub', 'b_medium.epub', 'a_small.epub'], leased
+
+    print("✓ Queue leases by priority")
+    return True
+
+
+def test_queue_without_priority_column():
+    """Test that a queue database created before priorities still works"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        db_path = str(Path(tmpdir) / 'jobs.db')
+        conn = sqlite3.connect(db_path)
+        conn.executescript(JobQueue.SCHEMA.replace('priority REAL NOT NULL DEFAULT 0,', ''))
+        conn.execute("INSERT INTO jobs (epub_path, output_tex, enqueued_at) VALUES ('a.epub', 'a.tex', 0)")
+        conn.commit()
+        conn.close()
+
+        queue = JobQueue(db_path)
+        assert queue.lease('w')['epub_path'] == 'a.epub'
+        queue.close()
+
+    print("✓ Old queue database upgraded")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Longest-First Scheduling Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Cost Estimate", test_cost_estimate),
+        ("Predicted Makespan", test_predicted_makespan),
+        ("Async Longest First", test_async_longest_first),
+        ("Queue Priority", test_queue_priority),
+        ("Old Queue Database", test_queue_without_priority_column),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
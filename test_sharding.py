@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for sharded and lock-coordinated batch processing
+"""
+
+import os
+import sys
+import time
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import (process_directory, parse_shard, _shard_of, _claim_lock, _release_lock,
+                      _hold_lock)
+
+
+def create_test_epub(epub_path):
+    """Create a minimal one-chapter EPUB"""
+    book = epub.EpubBook()
+    book.set_identifier(Path(epub_path).stem)
+    book.set_title('Test Sharding')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = '<html><body><h1>Chapter</h1><p>Text.</p></body></html>'
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+
+
+def test_parse_shard():
+    """Test parsing of I/N shard specifications"""
+    assert parse_shard('1/4') == (1, 4)
+    assert parse_shard(' 4 / 4 ') == (4, 4)
+    for bad in ('0/4', '5/4', '1/0', 'a/b', '3'):
+        try:
+            parse_shard(bad)
+        except ValueError:
+            continue
+        raise AssertionError(f"parse_shard accepted {bad!r}")
+
+    print("✓ Shard specifications parsed correctly")
+    return True
+
+
+def test_shards_are_disjoint_and_complete():
+    """Test that every file lands in exactly one shard, the same one every time"""
+    paths = [f"book_{i}.epub" for i in range(200)]
+    shards = [_shard_of(p, 4) for p in paths]
+    assert shards == [_shard_of(p, 4) for p in paths], "Shard assignment not stable"
+    assert set(shards) == {1, 2, 3, 4}, f"Unexpected shards {set(shards)}"
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        input_dir.mkdir()
+        for i in range(6):
+            create_test_epub(str(input_dir / f'book_{i}.epub'))
+
+        converted = []
+        for index in (1, 2, 3):
+            output_dir = Path(tmpdir) / f'out_{index}'
+            successful, failed = process_directory(str(input_dir), output_dir=str(output_dir),
+                                                   shard=(index, 3))
+            assert failed == 0
+            names = sorted(p.name for p in output_dir.glob('*.tex')) if output_dir.exists() else []
+            assert len(names) == successful
+            converted.extend(names)
+
+        assert sorted(converted) == sorted(f'book_{i}.tex' for i in range(6)), \
+            f"Shards overlap or miss files: {sorted(converted)}"
+
+    print("✓ Shards are disjoint and cover every file")
+    return True
+
+
+def test_claim_skips_done_and_locked_books():
+    """Test that --claim leaves locked or finished books to their owner"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        output_dir = Path(tmpdir) / 'output'
+        input_dir.mkdir()
+        output_dir.mkdir()
+        for name in ('a', 'b', 'c'):
+            create_test_epub(str(input_dir / f'{name}.epub'))
+
+        # Another node is working on a.epub, and c.epub is already done
+        assert _claim_lock(output_dir / 'a.epub.lock', ttl=60)
+        (output_dir / 'c.epub.done').write_text('other-node\n')
+
+        successful, failed = process_directory(str(input_dir), output_dir=str(output_dir), claim=True)
+        assert (successful, failed) == (1, 0), f"Got {successful} successful, {failed} failed"
+        assert (output_dir / 'b.tex').exists()
+        assert (output_dir / 'b.epub.done').exists(), "Done marker not written"
+        assert not (output_dir / 'b.epub.lock').exists(), "Lock not released"
+        assert (output_dir / 'a.epub.lock').exists(), "Foreign lock removed"
+
+        # A second run finds nothing left to do
+        assert process_directory(str(input_dir), output_dir=str(output_dir), claim=True) == (0, 0)
+
+    print("✓ Claim mode skips locked and finished books")
+    return True
+
+
+def test_abandoned_lock_is_taken_over():
+    """Test that locks older than the TTL are taken over"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lock_path = Path(tmpdir) / 'book.epub.lock'
+        assert _claim_lock(lock_path, ttl=60)
+        assert not _claim_lock(lock_path, ttl=60), "Fresh lock claimed twice"
+
+        old = time.time() - 120
+        os.utime(lock_path, (old, old))
+        assert _claim_lock(lock_path, ttl=60), "Abandoned lock not taken over"
+        assert lock_path.stat().st_mtime > old
+        assert [p.name for p in Path(tmpdir).iterdir()] == ['book.epub.lock']
+
+    print("✓ Abandoned locks are taken over")
+    return True
+
+
+def test_release_keeps_taken_over_lock():
+    """Test that a node that outlived its lock does not delete the new owner's lock"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lock_path = Path(tmpdir) / 'book.epub.lock'
+        slow_owner = _claim_lock(lock_path, ttl=60)
+        old = time.time() - 120
+        os.utime(lock_path, (old, old))
+        new_owner = _claim_lock(lock_path, ttl=60)
+        assert new_owner and new_owner != slow_owner
+
+        _release_lock(lock_path, slow_owner)
+        assert lock_path.read_text() == new_owner, "New owner's lock removed"
+        _release_lock(lock_path, new_owner)
+        assert not lock_path.exists(), "Own lock not released"
+
+    print("✓ Taken-over locks are left to their new owner")
+    return True
+
+
+def test_held_lock_outlives_ttl():
+    """Test that a lock held longer than the TTL is not taken over"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        lock_path = Path(tmpdir) / 'book.epub.lock'
+        owner = _claim_lock(lock_path, ttl=0.3)
+        with _hold_lock(lock_path, owner, ttl=0.3):
+            time.sleep(0.8)
+            assert _claim_lock(lock_path, ttl=0.3) is None, "Live claim taken over"
+        assert lock_path.read_text() == owner
+
+    print("✓ Held locks are refreshed")
+    return True
+
+
+def test_failed_books_not_retried():
+    """Test that a failed book is marked and only retried on request"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        output_dir = Path(tmpdir) / 'output'
+        input_dir.mkdir()
+        (input_dir / 'broken.epub').write_bytes(b'not a zip file')
+
+        assert process_directory(str(input_dir), output_dir=str(output_dir), claim=True) == (0, 1)
+        marker = output_dir / 'broken.epub.failed'
+        assert marker.exists() and 'Bad Zip' in marker.read_text(), "Failure marker not written"
+        assert not (output_dir / 'broken.epub.lock').exists()
+
+        # Other nodes (and later runs) leave it alone...
+        assert process_directory(str(input_dir), output_dir=str(output_dir), claim=True) == (0, 0)
+        assert process_directory(str(input_dir), output_dir=str(output_dir), claim=True,
+                                 retry_failed='*/other.epub') == (0, 0)
+        # ... unless asked to retry it
+        assert process_directory(str(input_dir), output_dir=str(output_dir), claim=True,
+                                 retry_failed='*/broken.epub') == (0, 1)
+
+    print("✓ Failed books marked and retried on request")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Sharding and Claim Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Parse Shard", test_parse_shard),
+        ("Disjoint Shards", test_shards_are_disjoint_and_complete),
+        ("Claim Mode", test_claim_skips_done_and_locked_books),
+        ("Abandoned Locks", test_abandoned_lock_is_taken_over),
+        ("Release Ownership", test_release_keeps_taken_over_lock),
+        ("Held Lock", test_held_lock_outlives_ttl),
+        ("Failed Books", test_failed_books_not_retried),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
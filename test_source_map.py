@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the LaTeX-to-EPUB source map (--source-map)
+"""
+
+import os
+import sys
+import stat
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, SourceMap, compile_latex
+
+
+CHAPTERS = [
+    '''<html><body>
+<h1>First</h1>
+<p>Opening paragraph.</p>
+<div><p>Inside a div.</p>
+<section><p>Deep <b>marker</b> paragraph.</p></section></div>
+<ul><li>One</li><li>Two</li></ul>
+</body></html>''',
+    '''<html><body>
+<h1>Second</h1>
+<p>Second chapter text.</p>
+<p>Another paragraph.</p>
+</body></html>''',
+]
+
+# Fake TeX engine: reports an error on line $ERROR_LINE of the main file
+FAKE_COMPILER = '''#!/bin/sh
+[ "$1" = "--version" ] && exit 0
+for last; do :; done
+job="${last%.tex}"
+echo "./$last:$ERROR_LINE: Undefined control sequence." > "$job.log"
+echo "l.$ERROR_LINE \\\\foo" >> "$job.log"
+'''
+
+
+def create_test_epub(epub_path, chapters=CHAPTERS):
+    """Create an EPUB with one item per chapter"""
+    book = epub.EpubBook()
+    book.set_identifier('source-map-test')
+    book.set_title('Test Source Map')
+    book.set_language('en')
+
+    items = []
+    for i, content in enumerate(chapters, 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = content
+        book.add_item(chapter)
+        items.append(chapter)
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+    epub.write_epub(epub_path, book)
+
+
+def line_of(tex_path, needle):
+    """1-based number of the first line containing needle"""
+    for number, line in enumerate(Path(tex_path).read_text(encoding='utf-8').split('\n'), 1):
+        if needle in line:
+            return number
+    raise AssertionError(f"{needle!r} not found in {tex_path}")
+
+
+def test_single_file_map():
+    """Test that lines map to the right item and element without changing the output"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        create_test_epub(epub_path)
+
+        plain = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'plain', 'book.tex'))
+        assert plain.convert()
+        mapped = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'mapped', 'book.tex'),
+                                      source_map=True)
+        assert mapped.convert()
+
+        tex_path = Path(tmpdir) / 'mapped' / 'book.tex'
+        assert tex_path.read_text() == (Path(tmpdir) / 'plain' / 'book.tex').read_text(), \
+            "Source map changed the generated LaTeX"
+        assert not (Path(tmpdir) / 'plain' / 'book.srcmap.json').exists()
+
+        source_map = SourceMap.load(tex_path.with_suffix('.srcmap.json'))
+        assert source_map is not None, "Source map not written"
+        location = source_map.lookup('./book.tex', line_of(tex_path, 'marker'))
+        assert location['item'] == 'chap_01.xhtml'
+        assert location['path'] == 'body/div[1]/section[1]/p[1]', location
+        location = source_map.lookup('book.tex', line_of(tex_path, 'Another paragraph'))
+        assert (location['item'], location['path']) == ('chap_02.xhtml', 'body/p[2]'), location
+        assert source_map.lookup('book.tex', 1) is None, "Preamble mapped to an item"
+
+    print("✓ Lines map back to items and element paths")
+    return True
+
+
+def test_split_update_keeps_reused_entries():
+    """Test that chapters reused by --update keep their entries"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = os.path.join(tmpdir, 'book.epub')
+        output_path = os.path.join(tmpdir, 'out', 'book.tex')
+        create_test_epub(epub_path)
+        assert EPUBToLaTeXConverter(epub_path, output_path, update=True, source_map=True).convert()
+
+        create_test_epub(epub_path, [CHAPTERS[0], CHAPTERS[1].replace('Another', 'A changed')])
+        converter = EPUBToLaTeXConverter(epub_path, output_path, update=True, source_map=True)
+        assert converter.convert()
+        assert converter.chapters_reused >= 1, "Unchanged chapters were reconverted"
+
+        chapters_dir = Path(tmpdir) / 'out' / 'chapters'
+        first, second = sorted(p for p in chapters_dir.glob('*.tex') if 'marker' in p.read_text()
+                               or 'changed' in p.read_text())
+        source_map = SourceMap.load(Path(output_path).with_suffix('.srcmap.json'))
+        location = source_map.lookup(f'chapters/{first.name}', line_of(first, 'marker'))
+        assert location['path'] == 'body/div[1]/section[1]/p[1]', location
+        location = source_map.lookup(f'./chapters/{second.name}', line_of(second, 'changed'))
+        assert (location['item'], location['path']) == ('chap_02.xhtml', 'body/p[2]'), location
+
+    print("✓ Reused chapters keep their source map entries")
+    return True
+
+
+def test_compile_errors_located():
+    """Test that compile errors are annotated with the source element"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            epub_path = os.path.join(tmpdir, 'book.epub')
+            output_path = os.path.join(tmpdir, 'out', 'book.tex')
+            create_test_epub(epub_path)
+            assert EPUBToLaTeXConverter(epub_path, output_path, source_map=True).convert()
+
+            compiler = Path(tmpdir) / 'pdflatex'
+            compiler.write_text(FAKE_COMPILER)
+            compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+            os.environ['PATH'] = f"{tmpdir}{os.pathsep}{saved_path}"
+            os.environ['ERROR_LINE'] = str(line_of(output_path, 'Opening paragraph'))
+
+            result = compile_latex(output_path, max_passes=1)
+            assert not result
+            assert len(result.errors) == 1, result.errors
+            source = result.errors[0]['source']
+            assert (source['item'], source['path']) == ('chap_01.xhtml', 'body/p[1]'), source
+        finally:
+            os.environ['PATH'] = saved_path
+            os.environ.pop('ERROR_LINE', None)
+
+    print("✓ Compile errors located in the EPUB")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Source Map Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Single File Map", test_single_file_map),
+        ("Split Update", test_split_update_keeps_reused_entries),
+        ("Compile Errors", test_compile_errors_located),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
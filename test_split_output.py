@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for split (per-chapter) LaTeX output
+"""
+
+import io
+import os
+import sys
+import tempfile
+from contextlib import redirect_stdout
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import epub2tex
+from epub2tex import EPUBToLaTeXConverter, process_directory
+
+
+def create_test_epub(epub_path, chapters=3):
+    """Create a small EPUB with one XHTML file per chapter"""
+    book = epub.EpubBook()
+    book.set_identifier('test-split-001')
+    book.set_title('Test Split Output')
+    book.set_language('en')
+    book.add_author('Test Author')
+
+    items = []
+    for i in range(1, chapters + 1):
+        chapter = epub.EpubHtml(title=f'Chapter {i}', file_name=f'chap_{i:02d}.xhtml', lang='en')
+        chapter.content = f'''
+        <html>
+        <head><title>Chapter {i}</title></head>
+        <body>
+            <h1>Chapter {i}</h1>
+            <p>Text of chapter {i}.</p>
+        </body>
+        </html>
+        '''
+        book.add_item(chapter)
+        items.append(chapter)
+
+    book.toc = tuple(items)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav'] + items
+
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def test_split_writes_chapter_files():
+    """Test that --split writes chapters/NNN.tex and \\include lines"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        output_path = Path(tmpdir) / 'out' / 'book.tex'
+
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), split=True)
+        assert converter.convert(), "Conversion failed"
+
+        main_tex = output_path.read_text(encoding='utf-8')
+        chapter_files = sorted((output_path.parent / 'chapters').glob('*.tex'))
+        assert chapter_files, "No chapter files written"
+
+        for chapter_file in chapter_files:
+            target = f"\\include{{chapters/{chapter_file.stem}}}"
+            assert target in main_tex, f"Missing {target} in main file"
+
+        assert '\\begin{document}' in main_tex
+        assert '\\end{document}' in main_tex
+        assert 'Text of chapter' not in main_tex, "Chapter text leaked into main file"
+
+        all_chapters = ''.join(f.read_text(encoding='utf-8') for f in chapter_files)
+        for i in range(1, 4):
+            assert f'Text of chapter {i}.' in all_chapters, f"Chapter {i} text missing"
+
+        print(f"✓ Split output wrote {len(chapter_files)} chapter files")
+        return True
+
+
+def test_split_matches_single_file():
+    """Test that split output contains the same body as single-file output"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        single_path = Path(tmpdir) / 'single' / 'book.tex'
+        split_path = Path(tmpdir) / 'split' / 'book.tex'
+
+        assert EPUBToLaTeXConverter(epub_path, str(single_path)).convert()
+        assert EPUBToLaTeXConverter(epub_path, str(split_path), split=True).convert()
+
+        single = single_path.read_text(encoding='utf-8')
+        chapters = ''.join(f.read_text(encoding='utf-8')
+                           for f in sorted((split_path.parent / 'chapters').glob('*.tex')))
+
+        assert chapters in single, "Split chapters differ from single-file body"
+
+        print("✓ Split chapters match single-file output")
+        return True
+
+
+def test_include_only():
+    """Test that include_only emits \\includeonly before \\begin{document}"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        output_path = Path(tmpdir) / 'book.tex'
+
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), split=True,
+                                         include_only=['002'])
+        assert converter.convert(), "Conversion failed"
+
+        main_tex = output_path.read_text(encoding='utf-8')
+        assert '\\includeonly{chapters/002}' in main_tex, "Missing \\includeonly"
+        assert main_tex.index('\\includeonly') < main_tex.index('\\begin{document}')
+
+        print("✓ \\includeonly emitted in preamble")
+        return True
+
+
+def test_include_only_rejected_for_directories():
+    """Test that --include-only is refused in directory mode instead of being ignored"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        saved_argv = sys.argv
+        stdout = io.StringIO()
+        try:
+            sys.argv = ['epub2tex.py', '--directory', tmpdir, '--split', '--include-only', '002']
+            with redirect_stdout(stdout):
+                epub2tex.main()
+        except SystemExit as e:
+            assert e.code == 1, e.code
+        else:
+            raise AssertionError("Directory mode accepted --include-only")
+        finally:
+            sys.argv = saved_argv
+        assert 'single EPUB file' in stdout.getvalue()
+
+    print("✓ --include-only refused with --directory")
+    return True
+
+
+def test_split_batch_uses_subdirectories():
+    """Test that batch split mode gives each book its own directory"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_dir = Path(tmpdir) / 'epubs'
+        output_dir = Path(tmpdir) / 'output'
+        input_dir.mkdir()
+        create_test_epub(str(input_dir / 'first.epub'))
+        create_test_epub(str(input_dir / 'second.epub'))
+
+        successful, failed = process_directory(str(input_dir), output_dir=str(output_dir), split=True)
+        assert (successful, failed) == (2, 0), f"Got {successful} successful, {failed} failed"
+
+        for stem in ('first', 'second'):
+            assert (output_dir / stem / f'{stem}.tex').exists(), f"Missing main file for {stem}"
+            assert list((output_dir / stem / 'chapters').glob('*.tex')), f"No chapters for {stem}"
+
+        print("✓ Batch split output uses one directory per book")
+        return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Split Output Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Split Writes Chapter Files", test_split_writes_chapter_files),
+        ("Split Matches Single File", test_split_matches_single_file),
+        ("Include Only", test_include_only),
+        ("Include Only in Directory Mode", test_include_only_rejected_for_directories),
+        ("Batch Split Subdirectories", test_split_batch_uses_subdirectories),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
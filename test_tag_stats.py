@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for per-tag converter instrumentation (--tag-stats)
+"""
+
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+from ebooklib import epub
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import EPUBToLaTeXConverter, TagStats
+
+
+def create_test_epub(epub_path):
+    """Create an EPUB with a few known and unknown tags"""
+    book = epub.EpubBook()
+    book.set_identifier('test-tag-stats-001')
+    book.set_title('Test Tag Stats')
+    book.set_language('en')
+
+    chapter = epub.EpubHtml(title='Chapter', file_name='chap_01.xhtml', lang='en')
+    chapter.content = ('<html><body><h1>Chapter</h1>'
+                       '<p>One <b>bold</b> line<br/>and é.</p>'
+                       '<p>Two <span>spans</span> <span>here</span>.</p>'
+                       '<blink>odd</blink><marquee>old</marquee><blink>again</blink>'
+                       '</body></html>')
+    book.add_item(chapter)
+    book.toc = (chapter,)
+    book.add_item(epub.EpubNcx())
+    book.add_item(epub.EpubNav())
+    book.spine = ['nav', chapter]
+    epub.write_epub(epub_path, book)
+    return epub_path
+
+
+def test_tag_counters():
+    """Test node counts, timings, escaped bytes and unknown tags"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        output_path = Path(tmpdir) / 'book.tex'
+        converter = EPUBToLaTeXConverter(epub_path, str(output_path), tag_stats=True)
+        assert converter.convert()
+
+        data = converter.tag_stats.to_dict()
+        tags = data['tags']
+        assert tags['p']['nodes'] == 2
+        assert tags['span']['nodes'] == 2
+        assert tags['br']['nodes'] == 1
+        assert tags['b']['text_bytes'] == len('bold')
+        # 'é' is two bytes in UTF-8
+        assert tags['p']['text_bytes'] >= len('One  line and .') + 2
+        for row in tags.values():
+            assert row['exclusive_seconds'] <= row['inclusive_seconds'] + 1e-9
+        assert data['unknown']['blink'] == 2
+        assert data['unknown']['marquee'] == 1
+        assert 'p' not in data['unknown']
+
+        exported = json.loads(converter.tag_stats_path.read_text(encoding='utf-8'))
+        assert exported['tags']['p']['nodes'] == 2
+
+    print("✓ Per-tag counters recorded and exported")
+    return True
+
+
+def test_disabled_by_default():
+    """Test that instrumentation is off and the output identical"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        epub_path = create_test_epub(os.path.join(tmpdir, 'book.epub'))
+        plain = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'plain.tex'))
+        timed = EPUBToLaTeXConverter(epub_path, os.path.join(tmpdir, 'timed.tex'), tag_stats=True)
+        assert plain.convert() and timed.convert()
+
+        assert plain.tag_stats is None
+        assert '_convert_element' not in vars(plain), "Uninstrumented converter was wrapped"
+        assert not Path(plain.tag_stats_path).exists()
+        assert (Path(tmpdir) / 'plain.tex').read_text() == (Path(tmpdir) / 'timed.tex').read_text()
+
+    print("✓ Instrumentation is opt-in and does not change output")
+    return True
+
+
+def test_exclusive_time():
+    """Test inclusive and exclusive time bookkeeping on nested elements"""
+    stats = TagStats()
+    stats.enter('div')
+    stats.enter('span')
+    stats.leave(0.25)
+    stats.leave(1.0)
+    assert stats.tags['span'][1:3] == [0.25, 0.25]
+    assert stats.tags['div'][1:3] == [1.0, 0.75]
+    assert 'div' in stats.summary()
+
+    print("✓ Exclusive time excludes children")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Tag Statistics Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Tag Counters", test_tag_counters),
+        ("Disabled By Default", test_disabled_by_default),
+        ("Exclusive Time", test_exclusive_time),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
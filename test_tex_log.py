@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the streaming TeX log parser and rerun-driven compilation
+"""
+
+import os
+import sys
+import stat
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import parse_tex_log, compile_latex, TEX_LOG_LINE_WIDTH
+
+
+SAMPLE_LOG = r"""This is pdfTeX, Version 3.141592653-2.6-1.40.25 (TeX Live 2023)
+(./book.tex
+LaTeX2e <2023-06-01>
+Package: rerunfilecheck 2022/07/10 v1.10 Rerun checks for auxiliary files
+./book.tex:42: Undefined control sequence.
+l.42 \foo
+         bar
+! LaTeX Error: File `missing.sty' not found.
+
+Type X to quit or <RETURN> to proceed,
+l.7 \usepackage
+               {missing}
+Overfull \hbox (12.0pt too wide) in paragraph at lines 10--12
+Underfull \vbox (badness 10000) has occurred while \output is active
+Overfull \hbox (1.0pt too wide) detected at line 20
+LaTeX Warning: Reference `fig:one' on page 3 undefined on input line 55.
+LaTeX Warning: Citation `knuth84' on page 4 undefined on input line 60.
+LaTeX Warning: Reference `fig:one' on page 5 undefined on input line 70.
+"""
+
+# Fake TeX engine: writes a .log asking for a rerun until RERUNS passes have run
+FAKE_COMPILER = '''#!/bin/sh
+[ "$1" = "--version" ] && exit 0
+for last; do :; done
+job="${last%.tex}"
+count=$(cat "$job.count" 2>/dev/null || echo 0)
+count=$((count + 1))
+echo $count > "$job.count"
+if [ $count -le "$RERUNS" ]; then
+  echo "LaTeX Warning: Label(s) may have changed. Rerun to get cross-references right." > "$job.log"
+else
+  echo "Output written on $job.pdf (1 page)." > "$job.log"
+fi
+echo '\\relax' > "$job.aux"
+touch "$job.pdf"
+'''
+
+
+def test_parse_diagnostics():
+    """Test extraction of errors, boxes, undefined references and rerun hints"""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_path = Path(tmpdir) / 'book.log'
+        log_path.write_text(SAMPLE_LOG)
+        log = parse_tex_log(log_path)
+
+        assert len(log.errors) == 2, log.errors
+        first, second = log.errors
+        assert (first['type'], first['file'], first['line']) == \
+            ('Undefined control sequence', './book.tex', 42)
+        assert first['context'] == r'\foo'
+        assert second['type'] == 'LaTeX Error'
+        assert second['message'] == "File `missing.sty' not found."
+        assert second['line'] == 7 and second['file'] is None
+        assert (log.overfull, log.underfull) == (2, 1)
+        assert log.undefined_references == ['fig:one']
+        assert log.undefined_citations == ['knuth84']
+        assert log.rerun is False, "Package banner mistaken for a rerun hint"
+
+    print("✓ Diagnostics extracted from the log")
+    return True
+
+
+def test_wrapped_lines():
+    """Test that lines hard-wrapped by TeX are joined before parsing"""
+    message = ("LaTeX Warning: Reference `a-rather-long-label-name:that-wraps' on page 12 "
+               "undefined on input line 100.")
+    wrapped = '\n'.join(message[i:i + TEX_LOG_LINE_WIDTH]
+                        for i in range(0, len(message), TEX_LOG_LINE_WIDTH))
+    assert '\n' in wrapped
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_path = Path(tmpdir) / 'book.log'
+        log_path.write_text(wrapped + "\nLabel(s) may have changed. Rerun to get cross-references right.\n")
+        log = parse_tex_log(log_path)
+        assert log.undefined_references == ['a-rather-long-label-name:that-wraps']
+        assert log.rerun
+
+    print("✓ Wrapped log lines joined")
+    return True
+
+
+def run_fake_compile(reruns, max_passes=3):
+    """Compile a dummy document with the fake engine, return (result, runs)"""
+    saved_path = os.environ['PATH']
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            compiler = Path(tmpdir) / 'pdflatex'
+            compiler.write_text(FAKE_COMPILER)
+            compiler.chmod(compiler.stat().st_mode | stat.S_IEXEC)
+            os.environ['PATH'] = f"{tmpdir}{os.pathsep}{saved_path}"
+            os.environ['RERUNS'] = str(reruns)
+
+            tex_path = Path(tmpdir) / 'book.tex'
+            tex_path.write_text('\\documentclass{article}\\begin{document}x\\end{document}\n')
+            result = compile_latex(str(tex_path), max_passes=max_passes)
+            runs = int((Path(tmpdir) / 'book.count').read_text())
+        finally:
+            os.environ['PATH'] = saved_path
+            os.environ.pop('RERUNS', None)
+    return result, runs
+
+
+def test_rerun_hints_drive_passes():
+    """Test that passes stop as soon as neither TeX nor the aux files ask for more"""
+    # Pass 1 creates the .aux, pass 2 leaves it unchanged and asks for nothing
+    result, runs = run_fake_compile(reruns=0)
+    assert result and runs == 2 and result.passes == 2, (runs, result.passes)
+
+    # A rerun hint on pass 2 forces a third pass
+    result, runs = run_fake_compile(reruns=2)
+    assert runs == 3 and result.passes == 3
+    assert not result.log.rerun
+
+    # ... but never more than max_passes
+    result, runs = run_fake_compile(reruns=10, max_passes=2)
+    assert runs == 2 and result.log.rerun
+    assert result.to_dict()['diagnostics']['rerun'] is True
+
+    print("✓ Rerun hints and aux changes decide the passes")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("TeX Log Parser Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Parse Diagnostics", test_parse_diagnostics),
+        ("Wrapped Lines", test_wrapped_lines),
+        ("Rerun-Driven Passes", test_rerun_hints_drive_passes),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Test script for the cached toolchain probe (engines and LaTeX packages)
+"""
+
+import os
+import sys
+import stat
+import tempfile
+from pathlib import Path
+
+# Add parent directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from epub2tex import compile_latex, configure_toolchain_cache, probe_toolchain
+
+
+# Fake TeX engine: records its command line and writes a PDF
+FAKE_COMPILER = '''#!/bin/sh
+echo "$@" >> "$FAKE_TEX_RUNS"
+for last; do :; done
+: > "${last%.tex}.log"
+touch "${last%.tex}.pdf"
+'''
+
+# Fake kpsewhich: records its arguments and finds the files present in $FAKE_TEXMF
+FAKE_KPSEWHICH = '''#!/bin/sh
+echo "$@" >> "$FAKE_KPSE_LOG"
+for name; do [ -f "$FAKE_TEXMF/$name" ] && echo "$FAKE_TEXMF/$name"; done
+exit 0
+'''
+
+DOCUMENT = r'''\documentclass[12pt]{book}
+\usepackage[utf8]{inputenc}
+\usepackage{soul,mdframed}
+% \usepackage{commented}
+\begin{document}
+\usepackage{too-late}
+\end{document}
+'''
+
+
+def install_tools(tmpdir):
+    """Put the fake pdflatex and kpsewhich first on PATH, with an empty texmf"""
+    bin_dir = Path(tmpdir) / 'bin'
+    bin_dir.mkdir()
+    for name, script in (('pdflatex', FAKE_COMPILER), ('kpsewhich', FAKE_KPSEWHICH)):
+        tool = bin_dir / name
+        tool.write_text(script)
+        tool.chmod(tool.stat().st_mode | stat.S_IEXEC)
+    texmf = Path(tmpdir) / 'texmf'
+    texmf.mkdir()
+    os.environ['PATH'] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+    os.environ['FAKE_TEXMF'] = str(texmf)
+    os.environ['FAKE_TEX_RUNS'] = str(Path(tmpdir) / 'runs.log')
+    os.environ['FAKE_KPSE_LOG'] = str(Path(tmpdir) / 'kpse.log')
+    return bin_dir, texmf
+
+
+def lines(path):
+    """Lines of a log file, empty if it does not exist"""
+    return Path(path).read_text().splitlines() if Path(path).exists() else []
+
+
+def with_tools(test):
+    """Run test(tmpdir, bin_dir, texmf) with the fake tools, restoring the environment"""
+    saved = dict(os.environ)
+    with tempfile.TemporaryDirectory() as tmpdir:
+        try:
+            bin_dir, texmf = install_tools(tmpdir)
+            configure_toolchain_cache(None)
+            return test(tmpdir, bin_dir, texmf)
+        finally:
+            os.environ.clear()
+            os.environ.update(saved)
+            configure_toolchain_cache(None)
+
+
+def test_missing_packages_fail_fast():
+    """Test that missing packages are reported before TeX runs"""
+    def test(tmpdir, bin_dir, texmf):
+        for name in ('book.cls', 'inputenc.sty', 'soul.sty'):
+            (texmf / name).write_text('')
+        tex_path = Path(tmpdir) / 'book.tex'
+        tex_path.write_text(DOCUMENT)
+
+        result = compile_latex(str(tex_path))
+        assert not result
+        assert lines(os.environ['FAKE_TEX_RUNS']) == [], "TeX ran despite missing packages"
+        assert probe_toolchain().missing(['mdframed.sty', 'soul.sty']) == ['mdframed.sty']
+        checked = lines(os.environ['FAKE_KPSE_LOG'])[0].split()
+        assert 'commented.sty' not in checked and 'too-late.sty' not in checked, checked
+
+        # Installed meanwhile: missing packages are asked again
+        (texmf / 'mdframed.sty').write_text('')
+        assert compile_latex(str(tex_path), max_passes=1)
+        return True
+
+    assert with_tools(test)
+    print("✓ Missing packages reported before compiling")
+    return True
+
+
+def test_probed_once_per_process():
+    """Test that repeated compiles neither run the engine to probe it nor re-run kpsewhich"""
+    def test(tmpdir, bin_dir, texmf):
+        for name in ('book.cls', 'inputenc.sty', 'soul.sty', 'mdframed.sty'):
+            (texmf / name).write_text('')
+        for i in range(3):
+            tex_path = Path(tmpdir) / f'book{i}.tex'
+            tex_path.write_text(DOCUMENT)
+            assert compile_latex(str(tex_path), max_passes=1)
+        runs = lines(os.environ['FAKE_TEX_RUNS'])
+        assert len(runs) == 3 and not any('--version' in run for run in runs), runs
+        assert len(lines(os.environ['FAKE_KPSE_LOG'])) == 1
+        assert probe_toolchain().to_dict()['engines']['pdflatex'] == str(bin_dir / 'pdflatex')
+        return True
+
+    assert with_tools(test)
+    print("✓ Toolchain probed once per process")
+    return True
+
+
+def test_disk_cache():
+    """Test that found packages are remembered on disk until TeX changes"""
+    def test(tmpdir, bin_dir, texmf):
+        for name in ('book.cls', 'inputenc.sty', 'soul.sty', 'mdframed.sty'):
+            (texmf / name).write_text('')
+        tex_path = Path(tmpdir) / 'book.tex'
+        tex_path.write_text(DOCUMENT)
+        cache_dir = str(Path(tmpdir) / 'cache')
+
+        configure_toolchain_cache(cache_dir)
+        assert compile_latex(str(tex_path), max_passes=1)
+        # A new process: only the disk cache is left
+        configure_toolchain_cache(cache_dir)
+        assert compile_latex(str(tex_path), max_passes=1)
+        assert len(lines(os.environ['FAKE_KPSE_LOG'])) == 1, "Disk cache not used"
+
+        # Upgrading the engine invalidates the cache
+        engine = bin_dir / 'pdflatex'
+        engine.write_text(engine.read_text() + '\n')
+        configure_toolchain_cache(cache_dir)
+        assert compile_latex(str(tex_path), max_passes=1)
+        assert len(lines(os.environ['FAKE_KPSE_LOG'])) == 2
+        return True
+
+    assert with_tools(test)
+    print("✓ Found packages cached on disk")
+    return True
+
+
+def main():
+    """Run all tests"""
+    print("=" * 60)
+    print("Toolchain Probe Tests")
+    print("=" * 60)
+
+    tests = [
+        ("Missing Packages", test_missing_packages_fail_fast),
+        ("Probed Once", test_probed_once_per_process),
+        ("Disk Cache", test_disk_cache),
+    ]
+
+    passed = 0
+    failed = 0
+
+    for name, test_func in tests:
+        try:
+            print(f"\nRunning: {name}")
+            if test_func():
+                passed += 1
+            else:
+                failed += 1
+        except Exception as e:
+            print(f"✗ {name} failed with exception: {str(e)}")
+            import traceback
+            traceback.print_exc()
+            failed += 1
+
+    print("\n" + "=" * 60)
+    print(f"Passed: {passed}")
+    print(f"Failed: {failed}")
+
+    return 0 if failed == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())